@@ -14,17 +14,31 @@
 # ============================================================================
 """Masked Image Modeling Dataset."""
 import os
+import struct
 import mindspore.common.dtype as mstype
 import mindspore.dataset.transforms.c_transforms as C
 from mindformers.tools.register import MindFormerRegister, MindFormerModuleType
 from mindformers.tools.logger import logger
 from .dataloader import build_dataset_loader
 from .base_dataset import BaseDataset
+from .sequence_packing import BertSequencePacker, pack_dataset
 
 
 @MindFormerRegister.register(MindFormerModuleType.DATASET)
 class BertPretrainDataset(BaseDataset):
-    """Bert pretrain dataset."""
+    """
+    Bert pretrain dataset.
+
+    All the tfrecord files are read by the loader. When the files can be dealt to the devices with the same
+    number of rows on every device, each device reads its own files, otherwise the rows are sharded by
+    `shard_equal_rows`, since the devices hang in the collective communication if they read different
+    numbers of rows. Set `shard_equal_rows: False` of the data loader to require the file level sharding,
+    then the unbalanced files raise an error. The files are read in parallel by `num_parallel_workers` readers. Set `shuffle_buffer_size` to shuffle the rows of the
+    interleaved files by a buffer of that size.
+
+    Set `pack_sequences` to pack the short examples into the rows by BertSequencePacker, the columns of
+    the packer are used instead of `input_columns` and the model should be created with `packed: True`.
+    """
     def __new__(cls, dataset_config: dict = None):
         logger.info("Now Create Masked Image Modeling Dataset.")
         cls.init_dataset_config(dataset_config)
@@ -39,22 +53,94 @@ class BertPretrainDataset(BaseDataset):
                     for file in f:
                         if file.endswith(".tfrecord"):
                             dataset_files.append(os.path.join(r, file))
+                # the same order on all the devices for the file level sharding
+                dataset_files.sort()
             else:
                 if data_dir.endswith(".tfrecord"):
                     dataset_files.append(data_dir)
         else:
             dataset_files = list(dataset_config.data_loader.dataset_files)
         dataset_config.data_loader.pop("dataset_dir")
-        dataset = build_dataset_loader(
-            dataset_config.data_loader, default_args={'dataset_files': dataset_files[0],
-                                                      'num_shards': device_num, 'shard_id': rank_id})
+        if not dataset_files:
+            raise ValueError("No tfrecord file is found for the BertPretrainDataset.")
+        cls._report_file_sizes(dataset_files)
+
+        default_args = {'dataset_files': dataset_files, 'num_shards': device_num, 'shard_id': rank_id,
+                        'num_parallel_workers': dataset_config.num_parallel_workers}
+        if device_num > 1:
+            shard_equal_rows = dataset_config.data_loader.shard_equal_rows
+            device_files = None
+            if not shard_equal_rows and len(dataset_files) >= device_num \
+                    and not dataset_config.data_loader.compression_type:
+                device_files = cls._balance_files(dataset_files, device_num)
+            if device_files is not None:
+                # each device reads its own files, all the devices read the same number of rows
+                default_args.update(dataset_files=device_files[rank_id], num_shards=None, shard_id=None)
+            elif shard_equal_rows is False:
+                raise ValueError(f"The {len(dataset_files)} tfrecord files can not be sharded to {device_num} "
+                                 f"devices with the same number of rows, set shard_equal_rows of the "
+                                 f"data_loader to True to shard the rows.")
+            else:
+                default_args['shard_equal_rows'] = True
+        dataset = build_dataset_loader(dataset_config.data_loader, default_args=default_args)
+        if dataset_config.shuffle_buffer_size:
+            dataset = dataset.shuffle(dataset_config.shuffle_buffer_size)
+        input_columns = dataset_config.input_columns
+        if dataset_config.pack_sequences:
+            packer = BertSequencePacker(seq_length=dataset_config.seq_length,
+                                        max_sequences_per_pack=dataset_config.max_sequences_per_pack or 8,
+                                        max_predictions_per_pack=dataset_config.max_predictions_per_pack,
+                                        pack_window=dataset_config.pack_window or 1024)
+            dataset = pack_dataset(dataset, packer)
+            input_columns = packer.output_columns
         dataset = dataset.batch(dataset_config.batch_size,
                                 drop_remainder=dataset_config.drop_remainder,
-                                column_order=dataset_config.input_columns,
-                                output_columns=dataset_config.input_columns,
+                                column_order=input_columns,
+                                output_columns=input_columns,
                                 num_parallel_workers=dataset_config.num_parallel_workers)
         dataset = dataset.repeat(dataset_config.repeat)
         type_cast_op = C.TypeCast(mstype.int32)
-        for input_arg in dataset_config.input_columns:
+        for input_arg in input_columns:
             dataset = dataset.map(operations=type_cast_op, input_columns=input_arg)
         return dataset
+
+    @staticmethod
+    def _report_file_sizes(dataset_files):
+        """Log the size of each file"""
+        sizes = [os.path.getsize(file) if os.path.isfile(file) else 0 for file in dataset_files]
+        for file, size in zip(dataset_files, sizes):
+            logger.info("Bert pretrain file %s: %.2f MB.", file, size / (1 << 20))
+        logger.info("Read %s bert pretrain files of %.2f MB in total.", len(dataset_files), sum(sizes) / (1 << 20))
+
+    @staticmethod
+    def _count_rows(dataset_file):
+        """Count the records of an uncompressed tfrecord file by their length fields without parsing them"""
+        num_rows = 0
+        with open(dataset_file, 'rb') as file:
+            header = file.read(8)
+            while header:
+                if len(header) < 8:
+                    raise ValueError(f"The tfrecord file {dataset_file} is truncated.")
+                # skip the crc of the length, the record and the crc of the record
+                file.seek(struct.unpack('<Q', header)[0] + 8, os.SEEK_CUR)
+                num_rows += 1
+                header = file.read(8)
+        return num_rows
+
+    @classmethod
+    def _balance_files(cls, dataset_files, device_num):
+        """
+        Deal the files to the devices by their rows, the largest file first to the device of the fewest rows.
+        Return the files of each device, or None if the devices do not get the same number of rows.
+        """
+        num_rows = [cls._count_rows(file) for file in dataset_files]
+        device_rows = [0] * device_num
+        device_files = [[] for _ in range(device_num)]
+        for index in sorted(range(len(dataset_files)), key=lambda index: -num_rows[index]):
+            device = device_rows.index(min(device_rows))
+            device_rows[device] += num_rows[index]
+            device_files[device].append(dataset_files[index])
+        logger.info("The rows of the tfrecord files dealt to %s devices are %s.", device_num, device_rows)
+        if len(set(device_rows)) > 1 or not device_rows[0]:
+            return None
+        return [sorted(files) for files in device_files]
@@ -13,9 +13,14 @@
 # limitations under the License.
 # ============================================================================
 """Image Classification Dataset."""
+import inspect
+
+from mindspore.dataset import vision
+
 from .dataloader import build_dataset_loader
+from .dataloader.image_cache import split_cache_transforms
 from .transforms import build_transforms
-from .sampler import build_sampler
+from .sampler import build_sampler, BlockShuffleSampler, LengthBucketedSampler, compute_token_lengths
 from .base_dataset import BaseDataset
 from ..tools import logger
 from ..models.build_tokenizer import build_tokenizer
@@ -32,15 +37,66 @@ class ContrastiveLanguageImagePretrainDataset(BaseDataset):
         """new method"""
         logger.info("Now Create Contrastive Language Image Pretrain Dataset.")
         cls.init_dataset_config(dataset_config)
+        transform_configs = dataset_config.transforms
+        image_cache = dataset_config.data_loader.image_cache
+        if image_cache:
+            # the cache keeps the images transformed by the same leading deterministic transforms
+            cached_configs, transform_configs = split_cache_transforms(transform_configs)
+            image_cache = dict(image_cache)
+            image_cache["transforms"] = cached_configs
+            dataset_config.data_loader.image_cache = image_cache
+            transform_configs = transform_configs or None
+            logger.info("The transforms %s run before the image cache.", cached_configs)
         dataset = build_dataset_loader(dataset_config.data_loader)
 
-        transforms = build_transforms(dataset_config.transforms)
+        transforms = build_transforms(transform_configs)
+        if cls._decode_image(dataset_config.data_loader) is False:
+            # the loader yields the encoded bytes, decode them in the C++ worker pool
+            if transforms is None:
+                transforms = []
+            elif not isinstance(transforms, list):
+                transforms = [transforms]
+            transforms = [vision.Decode()] + transforms
 
         tokenizer = build_tokenizer(dataset_config.tokenizer)
         text_transforms = build_transforms(dataset_config.text_transforms,
                                            default_args={"tokenizer": tokenizer})
 
+        pretokenize = text_transforms is not None and getattr(text_transforms, "pretokenize", False)
+        if pretokenize:
+            source = getattr(dataset, "source", None)
+            if not hasattr(source, "get_captions"):
+                raise ValueError(f"pretokenize of the text_transforms needs a data loader with "
+                                 f"the captions, but got {type(dataset)}.")
+            logger.info("Tokenize the captions of %s samples in advance.", len(source))
+            text_transforms.build_table(source.get_captions())
+            source.return_index = True
+
         sampler = build_sampler(dataset_config.sampler)
+        if isinstance(sampler, LengthBucketedSampler):
+            if sampler.batch_size is None:
+                sampler.batch_size = dataset_config.batch_size
+            if sampler.lengths is None:
+                source = getattr(dataset, "source", None)
+                if not hasattr(source, "get_captions") or tokenizer is None:
+                    raise ValueError(f"LengthBucketedSampler needs the lengths, or a data loader with "
+                                     f"the captions and a tokenizer, but got {type(dataset)}.")
+                sampler.set_lengths(compute_token_lengths(source.get_captions(), tokenizer,
+                                                          cache_dir=sampler.length_cache_dir))
+
+        if pretokenize:
+            # the sampler gives the epoch of a sample in its index, so the picked caption does not depend
+            # on the workers of the loader or on how many times the sample is read
+            if sampler is None:
+                # keep the sampler of the loader, or shuffle all samples as GeneratorDataset does by default
+                sampler = getattr(dataset, "sampler", None)
+                if not hasattr(sampler, "with_epoch"):
+                    sampler = BlockShuffleSampler(len(dataset.source), block_size=1, buffer_size=0,
+                                                  seed=dataset_config.seed or 0)
+            if not hasattr(sampler, "with_epoch"):
+                raise ValueError(f"pretokenize of the text_transforms needs a sampler which gives the "
+                                 f"epoch, like BlockShuffleSampler, but got {type(sampler)}.")
+            sampler.with_epoch = True
 
         if sampler is not None:
             dataset = dataset.use_sampler(sampler)
@@ -66,3 +122,12 @@ class ContrastiveLanguageImagePretrainDataset(BaseDataset):
                                 num_parallel_workers=dataset_config.num_parallel_workers)
         dataset = dataset.repeat(dataset_config.repeat)
         return dataset
+
+    @staticmethod
+    def _decode_image(loader_config):
+        """The decode_image of the data loader, the default of the loader class if it is not configured"""
+        if loader_config.decode_image is not None:
+            return loader_config.decode_image
+        loader_cls = MindFormerRegister.get_cls(MindFormerModuleType.DATASET_LOADER, loader_config.type)
+        parameter = inspect.signature(loader_cls).parameters.get("decode_image")
+        return parameter.default if parameter is not None else None
@@ -15,5 +15,6 @@
 """MindFormers DataLoader."""
 from .build_dataloader import build_dataset_loader
 from .flickr8k_dataloader import Flickr8kDataLoader
+from .packed_image_text_dataloader import PackedImageTextDataLoader
 
-__all__ = ['build_dataset_loader', 'Flickr8kDataLoader']
+__all__ = ['build_dataset_loader', 'Flickr8kDataLoader', 'PackedImageTextDataLoader']
@@ -13,20 +13,33 @@
 # limitations under the License.
 # ============================================================================
 """Flickr8k DataLoader."""
+import hashlib
+import json
 import os
 from collections import defaultdict
+from functools import lru_cache
 
+import numpy as np
 from mindspore.dataset import GeneratorDataset
 
 from ...tools.image_tools import load_image
+from ...tools.logger import logger
 from ...tools.register import MindFormerRegister, MindFormerModuleType
+from .image_cache import DecodedImageCache
+
+ANNOTATION_INDEX_VERSION = 1
+_DEFAULT_STAGE_FILES = {"train": "Flickr_8k.trainImages.txt",
+                        "test": "Flickr_8k.testImages.txt",
+                        "dev": "Flickr_8k.devImages.txt"}
 
 
 @MindFormerRegister.register(MindFormerModuleType.DATASET_LOADER)
 class Flickr8kDataLoader:
     """Flicker8k Dataloader"""
     _default_column_names = ["image", "text"]
-    def __new__(cls, dataset_dir, annotation_dir, column_names=None, stage="train"):
+    def __new__(cls, dataset_dir, annotation_dir, column_names=None, stage="train",
+                annotation_file="Flickr8k.token.txt", stage_files=None, annotation_index=False,
+                decode_image=True, image_cache=None):
         """
         Flicker8k Dataloader API
 
@@ -36,6 +49,20 @@ class Flickr8kDataLoader:
                             Flickr_8k.devImages.txt, and Flickr8k.token.txt
             stege: the supported key words are in ["train"、"test"、"del"、"all"]
             column_names: the output column names, a tuple or a list of string with length 2
+            annotation_file: the caption file under annotation_dir, the corpora in the same layout
+                             as Flickr8k.token.txt are supported
+            stage_files: a dict from the stage to the image list file under annotation_dir,
+                         the files of Flickr8k are used if it is None
+            annotation_index: whether to keep the parsed captions in an index file, True for
+                              `annotation_file + ".index.json"` under annotation_dir or a path of the index
+            decode_image: whether to decode the images by PIL, if it is False, the encoded bytes are
+                          returned as a uint8 array and should be decoded by the `Decode` transform,
+                          note that the EXIF orientation is not applied by `Decode`
+            image_cache: a dict of `cache_dir`, `transforms` (or `image_size`) and `max_size` to keep the
+                         decoded images transformed by the deterministic transforms in a memory-mapped file,
+                         see DecodedImageCache. ContrastiveLanguageImagePretrainDataset moves the leading
+                         Resize and CenterCrop of the dataset transforms into `transforms`.
+                         Default None, which means the images are decoded every epoch
 
         Return:
             a GeneratorDataset for Flickr8k dataset
@@ -60,12 +87,15 @@ class Flickr8kDataLoader:
 
         if column_names is None:
             column_names = cls._default_column_names
-        flick8k_dataset = Flickr8kDataSet(dataset_dir, annotation_dir, stage)
+        flick8k_dataset = Flickr8kDataSet(dataset_dir, annotation_dir, stage, annotation_file=annotation_file,
+                                          stage_files=stage_files, annotation_index=annotation_index,
+                                          decode_image=decode_image, image_cache=image_cache)
         return GeneratorDataset(flick8k_dataset, column_names)
 
 class Flickr8kDataSet:
     """Flickr8k DataSet"""
-    def __init__(self, dataset_dir, annotation_dir, stage="train"):
+    def __init__(self, dataset_dir, annotation_dir, stage="train", annotation_file="Flickr8k.token.txt",
+                 stage_files=None, annotation_index=False, decode_image=True, image_cache=None):
         """
         Flicker8k Dataset
 
@@ -74,6 +104,11 @@ class Flickr8kDataSet:
             annotation_dir: the directory to Flickr_8k.trainImages.txt, Flickr_8k.testImages.txt,
                             Flickr_8k.devImages.txt, and Flickr8k.token.txt
             stege: the supported key words are in ["train"、"test"、"del"、"all"]
+            annotation_file: the caption file under annotation_dir
+            stage_files: a dict from the stage to the image list file under annotation_dir
+            annotation_index: whether to keep the parsed captions in an index file, see Flickr8kDataLoader
+            decode_image: whether to decode the images, the encoded bytes are returned if it is False
+            image_cache: the settings of the decoded image cache, see Flickr8kDataLoader
 
         Return:
             a iterable dataset for Flickr8k dataset
@@ -85,45 +120,109 @@ class Flickr8kDataSet:
             raise TypeError(f"{annotation_dir} is not existed.")
 
         self.dataset_dir = dataset_dir
+        self.decode_image = decode_image
 
-        if stage == "train":
-            train_file = os.path.join(annotation_dir, "Flickr_8k.trainImages.txt")
-            with open(train_file, 'r', encoding='utf-8') as file:
-                image_names = file.read().splitlines()
-        elif stage == "test":
-            test_file = os.path.join(annotation_dir, "Flickr_8k.testImages.txt")
-            with open(test_file, 'r', encoding='utf-8') as file:
-                image_names = file.read().splitlines()
-        elif stage == "dev":
-            dev_file = os.path.join(annotation_dir, "Flickr_8k.devImages.txt")
-            with open(dev_file, 'r', encoding='utf-8') as file:
+        stage_files = stage_files if stage_files else _DEFAULT_STAGE_FILES
+        if stage in stage_files:
+            with open(os.path.join(annotation_dir, stage_files[stage]), 'r', encoding='utf-8') as file:
                 image_names = file.read().splitlines()
         elif stage == "all":
             image_names = [file for file in os.listdir(dataset_dir) if file.endswith(".jpg")]
         else:
             raise KeyError("unsupported stage.")
 
-        annotation_file = os.path.join(annotation_dir, "Flickr8k.token.txt")
-        with open(annotation_file, 'r', encoding='utf-8') as file:
-            annotation_list = file.read().splitlines()
+        annotation_file = os.path.join(annotation_dir, annotation_file)
+        if annotation_index is True:
+            annotation_index = annotation_file + ".index.json"
+        file_stat = os.stat(annotation_file)
+        annotations = load_annotations(annotation_file, file_stat.st_mtime_ns, file_stat.st_size,
+                                       annotation_index or None)
 
         dataset_dict = defaultdict(list)
-        for line in annotation_list:
-            image_name = line.split("#")[0]
-            if image_name in image_names:
-                image_anno = line.split("\t")[-1]
-                dataset_dict[image_name].append(image_anno)
+        for image_name in set(image_names):
+            if image_name in annotations:
+                dataset_dict[image_name] = list(annotations[image_name])
 
         self.image_names = image_names
         self.dataset_dict = dataset_dict
+        # set by the dataset when the captions are tokenized in advance, then the pair of the sample index
+        # and the epoch is returned in place of the captions, see RandomChoiceTokenizerForward
+        self.return_index = False
+
+        self.image_cache = None
+        if image_cache:
+            if not decode_image:
+                raise ValueError("image_cache needs the decoded images, but decode_image is False.")
+            names_digest = hashlib.sha256("\n".join(image_names).encode('utf-8')).hexdigest()
+            config = {"dataset_dir": os.path.abspath(dataset_dir), "image_names": names_digest}
+            self.image_cache = DecodedImageCache(image_cache["cache_dir"], len(image_names),
+                                                 transforms=image_cache.get("transforms"),
+                                                 image_size=image_cache.get("image_size", 224),
+                                                 max_size=image_cache.get("max_size"), config=config)
 
     def __getitem__(self, item):
+        # an epoch-aware sampler yields epoch * len(self) + index, see BlockShuffleSampler
+        epoch, item = divmod(int(item), len(self))
         image_name = self.image_names[item]
         image_path = os.path.join(self.dataset_dir, image_name)
-        image = load_image(image_path)
+        if self.image_cache is not None:
+            image = self.image_cache.get(item)
+            if image is None:
+                image = self.image_cache.transform(load_image(image_path))
+                self.image_cache.put(item, image)
+        elif self.decode_image:
+            image = load_image(image_path)
+        else:
+            image = np.fromfile(image_path, dtype=np.uint8)
 
+        if self.return_index:
+            return image, np.array([item, epoch], dtype=np.int64)
         image_anno = self.dataset_dict[image_name]
         return image, image_anno
 
     def __len__(self):
         return len(self.image_names)
+
+    def get_captions(self):
+        """Return the caption lists of the samples in the order of the sample index"""
+        return [self.dataset_dict[image_name] for image_name in self.image_names]
+
+
+def parse_annotations(annotation_file):
+    """Parse the caption file whose lines are `image_name#index<TAB>caption` into a dict of the captions"""
+    annotations = defaultdict(list)
+    with open(annotation_file, 'r', encoding='utf-8') as file:
+        for line in file.read().splitlines():
+            annotations[line.split("#", 1)[0]].append(line.rsplit("\t", 1)[-1])
+    return dict(annotations)
+
+
+@lru_cache(maxsize=4)
+def load_annotations(annotation_file, mtime_ns, size, index_file=None):
+    """
+    Load the captions of annotation_file, the result is kept for the stages in the same process.
+
+    If index_file is set, the captions are read from it when it is built from the same version
+    of annotation_file, which is checked by mtime_ns and size, otherwise the index is rebuilt.
+    """
+    key = {"version": ANNOTATION_INDEX_VERSION, "source": os.path.abspath(annotation_file),
+           "mtime_ns": mtime_ns, "size": size}
+    if index_file and os.path.isfile(index_file):
+        try:
+            with open(index_file, 'r', encoding='utf-8') as file:
+                index = json.load(file)
+            if index.get("key") == key:
+                return index["annotations"]
+        except (OSError, ValueError, KeyError):
+            pass
+        logger.info("The annotation index %s is stale, rebuild it.", index_file)
+
+    annotations = parse_annotations(annotation_file)
+    if index_file:
+        try:
+            with open(index_file + ".tmp", 'w', encoding='utf-8') as file:
+                json.dump({"key": key, "annotations": annotations}, file, ensure_ascii=False)
+            os.replace(index_file + ".tmp", index_file)
+        except OSError as error:
+            logger.warning("Failed to write the annotation index %s: %s", index_file, error)
+    return annotations
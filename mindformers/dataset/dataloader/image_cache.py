@@ -0,0 +1,170 @@
+# Copyright 2022 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+"""Decoded Image Cache."""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from ..transforms import build_transforms
+from ...tools.logger import logger
+
+__all__ = ['DecodedImageCache', 'split_cache_transforms']
+
+# the deterministic transforms which can run before the cache, in the order of a pipeline
+CACHE_TRANSFORM_TYPES = ("Resize", "CenterCrop")
+
+
+def split_cache_transforms(transforms):
+    """
+    Split the transform configs of a dataset into the leading deterministic ones run before the image cache
+    and the others run by the map of the dataset.
+
+    The leading transforms should end with a CenterCrop, so the cached images have the same shape.
+    """
+    transforms = list(transforms or [])
+    num_cached = 0
+    while num_cached < len(transforms) and transforms[num_cached].get("type") in CACHE_TRANSFORM_TYPES:
+        num_cached += 1
+    if not num_cached or transforms[num_cached - 1].get("type") != "CenterCrop":
+        raise ValueError(f"The image cache needs the transforms which start with {CACHE_TRANSFORM_TYPES} and "
+                         f"end them with CenterCrop, but got {transforms}.")
+    return transforms[:num_cached], transforms[num_cached:]
+
+
+class DecodedImageCache:
+    """
+    A cache of the decoded images transformed by the deterministic transforms kept in a memory-mapped file.
+
+    The file is mapped by each dataset worker, so the workers share the cached pages of the system.
+    The images are transformed by the same MindSpore ops as the dataset pipeline, so the pixels are the same
+    with or without the cache. The random augmentations should run after the cache.
+
+    Args:
+        cache_dir(str): The directory of the cache files.
+        num_images(int): The number of the images of the dataset, an image is cached by its index.
+        transforms(list): The configs of the deterministic transforms ending with CenterCrop, see
+            split_cache_transforms. Default None, which means Resize and CenterCrop to image_size.
+        image_size(int): The size of the default transforms. Default 224.
+        max_size(int): The max bytes of the cached images, the images out of the limit are not cached.
+            Default None, which means all the images are cached.
+        config(dict): The settings of the dataset which change the images, for example the image list.
+            The cache file is named by the hash of config and the transforms, including the interpolation
+            and the size, so a new file is used when they change. The hashed settings are written into
+            the json file next to the cache.
+    """
+    VERSION = 2
+
+    def __init__(self, cache_dir, num_images, transforms=None, image_size=224, max_size=None, config=None):
+        if transforms is None:
+            if not isinstance(image_size, int) or image_size <= 0:
+                raise ValueError(f"image_size should be a positive int, but got {image_size}.")
+            transforms = [{"type": "Resize", "size": image_size}, {"type": "CenterCrop", "size": image_size}]
+        transforms = [dict(item) for item in transforms]
+        cached, others = split_cache_transforms(transforms)
+        if others:
+            raise ValueError(f"The transforms of the image cache should be in {CACHE_TRANSFORM_TYPES}, "
+                             f"but got {others}.")
+        crop_size = cached[-1]["size"]
+        height, width = (crop_size, crop_size) if isinstance(crop_size, int) else tuple(crop_size)
+        self.image_shape = (height, width, 3)
+        self.transforms = transforms
+        self._ops = build_transforms(transforms)
+        image_bytes = height * width * 3
+        self.capacity = num_images if max_size is None else min(num_images, max_size // image_bytes)
+        settings = {"version": self.VERSION, "num_images": num_images, "config": config,
+                    "transforms": [{"type": type(op).__name__, **{k: str(v) for k, v in vars(op).items()}}
+                                   for op in self._ops]}
+        key = json.dumps(settings, sort_keys=True)
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+        self.data_file = os.path.join(cache_dir, f"decoded_images_{digest}.bin")
+        self.flag_file = os.path.join(cache_dir, f"decoded_images_{digest}.flags")
+        self.hits = 0
+        self.misses = 0
+        self._images = None
+        self._flags = None
+        if self.capacity > 0:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._create_files()
+            with open(os.path.join(cache_dir, f"decoded_images_{digest}.json"), 'w', encoding='utf-8') as file:
+                json.dump(settings, file, indent=4, sort_keys=True)
+            logger.info("Cache %s decoded images of %s in %s.", self.capacity, num_images, self.data_file)
+
+    def transform(self, image):
+        """Run the transforms of the cache on the decoded PIL image, the HWC uint8 array is returned"""
+        image = np.asarray(image)
+        for op in self._ops:
+            image = op(image)
+        return np.asarray(image, dtype=np.uint8)
+
+    def _create_files(self):
+        """Create the zero filled files, the existing files with the same hash are reused"""
+        for path, size in ((self.data_file, self.capacity * int(np.prod(self.image_shape))),
+                           (self.flag_file, self.capacity)):
+            if os.path.isfile(path) and os.path.getsize(path) == size:
+                continue
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as file:
+                file.truncate(size)
+            os.replace(tmp_path, path)
+
+    def _open(self):
+        """Map the files in the current process"""
+        shape = (self.capacity,) + self.image_shape
+        self._images = np.memmap(self.data_file, dtype=np.uint8, mode='r+', shape=shape)
+        self._flags = np.memmap(self.flag_file, dtype=np.uint8, mode='r+', shape=(self.capacity,))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_ops'] = None
+        state['_images'] = None
+        state['_flags'] = None
+        state['hits'] = 0
+        state['misses'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._ops = build_transforms(self.transforms)
+
+    def get(self, index):
+        """Return a copy of the cached image of index, None if it is not cached"""
+        if index >= self.capacity:
+            return None
+        if self._images is None:
+            self._open()
+        if not self._flags[index]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.array(self._images[index])
+
+    def put(self, index, image):
+        """Cache the HWC uint8 image of index, the flag is set after the image is written"""
+        if index >= self.capacity:
+            return
+        if self._images is None:
+            self._open()
+        self._images[index] = image
+        self._flags[index] = 1
+
+    def stats(self):
+        """Return the counters of the current process"""
+        total = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'capacity': self.capacity,
+                'hit_rate': self.hits / total if total else 0.0}
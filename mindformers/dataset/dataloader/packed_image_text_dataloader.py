@@ -0,0 +1,216 @@
+# Copyright 2022 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+"""Packed Image Text DataLoader."""
+import io
+import json
+import math
+import os
+
+import numpy as np
+from PIL import Image
+from mindspore.dataset import GeneratorDataset
+
+from ...tools.image_tools import load_image
+from ...tools.logger import logger
+from ...tools.register import MindFormerRegister, MindFormerModuleType
+from ..sampler.block_shuffle_sampler import BlockShuffleSampler
+
+__all__ = ['PackedImageTextDataLoader', 'PackedImageTextDataSet', 'pack_image_text_dataset']
+
+PACKED_INDEX_NAME = "index.json"
+PACKED_OFFSETS_NAME = "index.npy"
+PACKED_VERSION = 1
+
+
+def pack_image_text_dataset(dataset, output_dir, shard_size=1 << 30, prefix="shard"):
+    """
+    Pack the (encoded image, captions) samples into the large shard files with an index.
+
+    A sample is stored as the encoded image bytes followed by the utf-8 captions joined by the newline.
+    `index.npy` keeps the shard, the offset, the image length and the captions length of each sample,
+    and `index.json` keeps the shard file names.
+
+    Args:
+        dataset: An indexable dataset returning the encoded image as a uint8 array or bytes and
+            a list of captions, for example Flickr8kDataSet with decode_image=False.
+        output_dir(str): The output directory.
+        shard_size(int): A new shard is started when the current one is larger than shard_size bytes.
+            Default 1GB.
+        prefix(str): The prefix of the shard file names. Default "shard".
+
+    Returns:
+        The number of the packed samples.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    offsets = np.zeros((len(dataset), 4), dtype=np.int64)
+    shard_files = []
+    writer = None
+    position = 0
+    for index in range(len(dataset)):
+        image, captions = dataset[index]
+        if any("\n" in caption for caption in captions):
+            raise ValueError(f"The captions of the sample {index} contain the newline character.")
+        image = image.tobytes() if isinstance(image, np.ndarray) else bytes(image)
+        text = "\n".join(captions).encode('utf-8')
+        if writer is None or position >= shard_size:
+            if writer is not None:
+                writer.close()
+            shard_files.append(f"{prefix}-{len(shard_files):05d}.bin")
+            writer = open(os.path.join(output_dir, shard_files[-1]), 'wb')  # pylint: disable=R1732
+            position = 0
+        offsets[index] = (len(shard_files) - 1, position, len(image), len(text))
+        writer.write(image)
+        writer.write(text)
+        position += len(image) + len(text)
+    if writer is not None:
+        writer.close()
+
+    np.save(os.path.join(output_dir, PACKED_OFFSETS_NAME), offsets)
+    with open(os.path.join(output_dir, PACKED_INDEX_NAME), 'w', encoding='utf-8') as file:
+        json.dump({"version": PACKED_VERSION, "num_samples": len(dataset), "shard_files": shard_files}, file)
+    logger.info("Packed %s samples into %s shards under %s.", len(dataset), len(shard_files), output_dir)
+    return len(dataset)
+
+
+@MindFormerRegister.register(MindFormerModuleType.DATASET_LOADER)
+class PackedImageTextDataLoader:
+    """Packed Image Text Dataloader"""
+    _default_column_names = ["image", "text"]
+    def __new__(cls, dataset_dir, column_names=None, num_shards=None, shard_id=None,
+                decode_image=False, shuffle=True, block_size=256, buffer_size=2048, seed=0):
+        """
+        Packed Image Text Dataloader API, which reads the shards written by pack_image_text_dataset
+
+        Args:
+            dataset_dir: the directory to the shards and the index files
+            column_names: the output column names, a tuple or a list of string with length 2
+            num_shards: the number of the devices, each device reads a contiguous range of the samples,
+                        RANK_SIZE of the environment is used if it is None
+            shard_id: the id of the device, RANK_ID of the environment is used if it is None
+            decode_image: whether to decode the images by PIL, the encoded bytes are returned by default
+                          and should be decoded by the `Decode` transform
+            shuffle: whether to shuffle the samples by BlockShuffleSampler, which shuffles the blocks of
+                     block_size contiguous samples and the samples within a buffer of buffer_size, so the
+                     samples of a block are read sequentially. Default True
+            block_size: the number of the contiguous samples read together. Default 256
+            buffer_size: the size of the shuffle buffer. Default 2048
+            seed: the random seed of the shuffle, combined with the epoch. Default 0
+
+        Return:
+            a GeneratorDataset for the packed dataset
+        """
+        if column_names is None:
+            column_names = cls._default_column_names
+
+        if not isinstance(column_names, (tuple, list)) or len(column_names) != 2:
+            raise TypeError(f"column_names should be a tuple or a list"
+                            f" of string with length 2, but got {column_names}")
+
+        if num_shards is None:
+            num_shards = int(os.getenv("RANK_SIZE", "1"))
+        if shard_id is None:
+            shard_id = int(os.getenv("RANK_ID", "0"))
+        packed_dataset = PackedImageTextDataSet(dataset_dir, num_shards=num_shards, shard_id=shard_id,
+                                                decode_image=decode_image)
+        sampler = BlockShuffleSampler(len(packed_dataset), block_size=block_size, buffer_size=buffer_size,
+                                      shuffle=shuffle, seed=seed)
+        return GeneratorDataset(packed_dataset, column_names, sampler=sampler)
+
+
+class PackedImageTextDataSet:
+    """Packed Image Text DataSet"""
+    def __init__(self, dataset_dir, num_shards=None, shard_id=None, decode_image=False):
+        """
+        Packed Image Text DataSet
+
+        Args:
+            dataset_dir: the directory to the shards and the index files
+            num_shards: the number of the devices, the samples are split into num_shards contiguous ranges
+                        of the same length, the first samples are repeated to fill the last range
+            shard_id: the id of the device
+            decode_image: whether to decode the images by PIL
+
+        Return:
+            a iterable dataset for the packed dataset
+        """
+        index_file = os.path.join(dataset_dir, PACKED_INDEX_NAME)
+        if not os.path.isfile(index_file):
+            raise ValueError(f"{index_file} is not existed.")
+        with open(index_file, 'r', encoding='utf-8') as file:
+            index = json.load(file)
+        if index.get("version") != PACKED_VERSION:
+            raise ValueError(f"The packed dataset version should be {PACKED_VERSION}, "
+                             f"but got {index.get('version')}.")
+
+        self.dataset_dir = dataset_dir
+        self.decode_image = decode_image
+        self.shard_files = [os.path.join(dataset_dir, name) for name in index["shard_files"]]
+        offsets = np.load(os.path.join(dataset_dir, PACKED_OFFSETS_NAME))
+        if num_shards is not None and num_shards > 1:
+            if shard_id is None or not 0 <= shard_id < num_shards:
+                raise ValueError(f"shard_id should be in [0, {num_shards}), but got {shard_id}.")
+            per_shard = math.ceil(len(offsets) / num_shards)
+            positions = np.arange(shard_id * per_shard, (shard_id + 1) * per_shard) % len(offsets)
+            offsets = offsets[positions]
+        self.offsets = offsets
+        self.return_index = False
+        self._files = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_files'] = {}
+        return state
+
+    def close(self):
+        """Close the opened shard files, they are opened again by the next read"""
+        for file in self._files.values():
+            file.close()
+        self._files = {}
+
+    def __del__(self):
+        try:
+            self.close()
+        except AttributeError:
+            pass
+
+    def _read(self, shard, offset, length):
+        """Read the bytes of a shard"""
+        file = self._files.get(shard)
+        if file is None:
+            file = open(self.shard_files[shard], 'rb')  # pylint: disable=R1732
+            self._files[shard] = file
+        file.seek(offset)
+        return file.read(length)
+
+    def __getitem__(self, item):
+        # an epoch-aware sampler yields epoch * len(self) + index, see BlockShuffleSampler
+        epoch, item = divmod(int(item), len(self))
+        shard, offset, image_length, text_length = self.offsets[item].tolist()
+        data = self._read(shard, offset, image_length + text_length)
+        if self.decode_image:
+            image = load_image(Image.open(io.BytesIO(data[:image_length])))
+        else:
+            image = np.frombuffer(data, dtype=np.uint8, count=image_length)
+        if self.return_index:
+            return image, np.array([item, epoch], dtype=np.int64)
+        return image, data[image_length:].decode('utf-8').split("\n")
+
+    def get_captions(self):
+        """Return the caption lists of the samples in the order of the sample index, the images are skipped"""
+        return [self._read(shard, offset + image_length, text_length).decode('utf-8').split("\n")
+                for shard, offset, image_length, text_length in self.offsets.tolist()]
+
+    def __len__(self):
+        return len(self.offsets)
@@ -14,6 +14,10 @@
 # ============================================================================
 """MindFormers Sampler API."""
 from .build_sampler import build_sampler
+from .length_bucketed_sampler import *
+from .block_shuffle_sampler import *
 
 
 __all__ = ['build_sampler']
+__all__.extend(length_bucketed_sampler.__all__)
+__all__.extend(block_shuffle_sampler.__all__)
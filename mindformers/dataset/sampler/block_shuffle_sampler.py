@@ -0,0 +1,94 @@
+# Copyright 2022 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+"""Block Shuffle Sampler."""
+import numpy as np
+from mindspore.dataset import Sampler
+
+from mindformers.tools.register import MindFormerRegister, MindFormerModuleType
+
+__all__ = ['BlockShuffleSampler']
+
+
+@MindFormerRegister.register(MindFormerModuleType.DATASET_SAMPLER)
+class BlockShuffleSampler(Sampler):
+    """
+    A sampler which shuffles the blocks of the contiguous samples and the samples within a bounded buffer.
+
+    The samples are split into the blocks of block_size contiguous indices. Every epoch the order of the
+    blocks is shuffled, the samples of a block are read in order, and a buffer of buffer_size samples
+    shuffles the samples of the neighbouring blocks. The reads of a block are sequential in the storage of
+    the packed datasets, while the samples are still well mixed when buffer_size spans several blocks.
+    block_size=1 is the full shuffle.
+
+    Args:
+        num_samples(int): The number of the samples. Default None, which means it is set by the data loader.
+        block_size(int): The number of the contiguous samples of a block. Default 256.
+        buffer_size(int): The size of the shuffle buffer, 0 or 1 disables it. Default 2048.
+        shuffle(bool): Whether to shuffle, the samples are read in order if it is False. Default True.
+        seed(int): The random seed, the order of an epoch is decided by the seed and the epoch. Default 0.
+        with_epoch(bool): Whether to yield `epoch * num_samples + index`, so the data loader gets the epoch of
+            a sample from its index, see RandomChoiceTokenizerForward. Default False.
+    """
+    def __init__(self, num_samples=None, block_size=256, buffer_size=2048, shuffle=True, seed=0, with_epoch=False):
+        super(BlockShuffleSampler, self).__init__()
+        if not isinstance(block_size, int) or block_size <= 0:
+            raise ValueError(f"block_size should be a positive int, but got {block_size}.")
+        if not isinstance(buffer_size, int) or buffer_size < 0:
+            raise ValueError(f"buffer_size should be a non-negative int, but got {buffer_size}.")
+        self.num_samples = num_samples
+        self.block_size = block_size
+        self.buffer_size = buffer_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.with_epoch = with_epoch
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        """Set the epoch of the next iteration, for example to resume the training"""
+        self.epoch = epoch
+
+    def get_epoch_indices(self, epoch=0):
+        """Return the sample indices of an epoch"""
+        if self.num_samples is None:
+            raise ValueError("The num_samples of BlockShuffleSampler should be set before it is iterated.")
+        indices = np.arange(self.num_samples, dtype=np.int64)
+        if not self.shuffle:
+            return indices
+        rng = np.random.default_rng((self.seed, epoch))
+        blocks = np.split(indices, np.arange(self.block_size, self.num_samples, self.block_size))
+        indices = np.concatenate([blocks[block] for block in rng.permutation(len(blocks))]) if blocks else indices
+        if self.buffer_size <= 1:
+            return indices
+        # a sample is put into the buffer and a random one of the buffer is taken out in its place
+        output = np.empty_like(indices)
+        buffer = indices[:self.buffer_size].copy()
+        picks = rng.integers(0, len(buffer), size=len(indices))
+        for position, index in enumerate(indices[len(buffer):].tolist()):
+            pick = picks[position]
+            output[position] = buffer[pick]
+            buffer[pick] = index
+        rng.shuffle(buffer)
+        output[len(indices) - len(buffer):] = buffer
+        return output
+
+    def __iter__(self):
+        indices = self.get_epoch_indices(self.epoch)
+        if self.with_epoch:
+            indices = indices + self.epoch * self.num_samples
+        self.epoch += 1
+        return iter(indices.tolist())
+
+    def __len__(self):
+        return self.num_samples if self.num_samples is not None else 0
@@ -0,0 +1,193 @@
+# Copyright 2022 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+"""Length Bucketed Sampler."""
+import hashlib
+import json
+import os
+
+import numpy as np
+from mindspore.dataset import Sampler
+
+from mindformers.tools.logger import logger
+from mindformers.tools.register import MindFormerRegister, MindFormerModuleType
+
+__all__ = ['LengthBucketedSampler', 'compute_token_lengths']
+
+
+def compute_token_lengths(texts, tokenizer, cache_dir=None):
+    """
+    Compute the token lengths of the samples, including the special tokens.
+
+    Args:
+        texts(list): The texts of the samples, a sample is a string or a list of the strings,
+            for example the captions of an image, whose max length is used.
+        tokenizer: The tokenizer.
+        cache_dir(str): The directory of the cached lengths. The lengths are saved in a file named by
+            the hash of the texts and the tokenizer, so they are computed once. Default None, not cached.
+
+    Returns:
+        An int64 array of the token lengths.
+    """
+    cache_file = None
+    if cache_dir:
+        key = json.dumps({"texts": texts, "tokenizer": type(tokenizer).__name__,
+                          "vocab_size": getattr(tokenizer, "vocab_size", None)})
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+        cache_file = os.path.join(cache_dir, f"token_lengths_{digest}.npy")
+        if os.path.isfile(cache_file):
+            return np.load(cache_file)
+
+    num_texts = [1 if isinstance(item, str) else len(item) for item in texts]
+    flat_texts = [text for item in texts for text in ([item] if isinstance(item, str) else item)]
+    text_lengths = np.array([len(ids) for ids in tokenizer(flat_texts)["input_ids"]], dtype=np.int64)
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(num_texts, out=offsets[1:])
+    if np.any(offsets[1:] == offsets[:-1]):
+        raise ValueError("Every sample should have at least one text.")
+    lengths = np.maximum.reduceat(text_lengths, offsets[:-1]) if len(texts) else text_lengths
+
+    if cache_file:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp.npy"
+        np.save(tmp_file, lengths)
+        os.replace(tmp_file, cache_file)
+        logger.info("Save the token lengths of %s samples in %s.", len(lengths), cache_file)
+    return lengths
+
+
+@MindFormerRegister.register(MindFormerModuleType.DATASET_SAMPLER)
+class LengthBucketedSampler(Sampler):
+    """
+    A sampler which groups the samples of similar lengths into the batches.
+
+    The samples are put into the buckets by their lengths, and the batches are formed within each bucket,
+    so a batch padded to its longest sample keeps little padding. The samples of a bucket and the order of
+    the batches are shuffled every epoch. The leftover samples of the buckets, which are fewer than
+    batch_size, are batched together after the bucketed batches, so every batch_size consecutive indices
+    form a batch of the following `batch` operation. With several shards, every shard gets the same number
+    of batches: the extra batches are dropped if drop_remainder is True, otherwise the partial batch is
+    filled and the first batches are repeated, like the padding of DistributedSampler.
+
+    Args:
+        batch_size(int): The batch size, which should be the same as the batch size of the dataset.
+            Default None, which means it is set by the dataset.
+        lengths: The token lengths of the samples, a list, an array or the path of a npy file.
+            Default None, which means they are set by `set_lengths`, for example computed by the dataset
+            with compute_token_lengths.
+        bucket_boundaries(list): The increasing upper boundaries of the buckets, the bucket i keeps the
+            lengths in [bucket_boundaries[i - 1], bucket_boundaries[i]) and the last bucket keeps the
+            lengths not less than the last boundary. Default None, which means the boundaries are the
+            quantiles of the lengths which split them into num_buckets buckets.
+        num_buckets(int): The number of the buckets when bucket_boundaries is None. Default 8.
+        shuffle(bool): Whether to shuffle the samples and the batches. Default True.
+        seed(int): The random seed, the order of an epoch is decided by the seed and the epoch. Default 0.
+        drop_remainder(bool): Whether to drop the last batch if it is smaller than batch_size. Default False.
+        num_shards(int): The number of the devices, the batches are dealt to the devices. Default 1.
+        shard_id(int): The id of the device. Default 0.
+        length_cache_dir(str): The directory of the lengths computed by the dataset. Default None.
+        with_epoch(bool): Whether to yield `epoch * len(lengths) + index`, so the data loader gets the epoch of
+            a sample from its index, see RandomChoiceTokenizerForward. Default False.
+    """
+    def __init__(self, batch_size=None, lengths=None, bucket_boundaries=None, num_buckets=8, shuffle=True,
+                 seed=0, drop_remainder=False, num_shards=1, shard_id=0, length_cache_dir=None, with_epoch=False):
+        super(LengthBucketedSampler, self).__init__()
+        if batch_size is not None and (not isinstance(batch_size, int) or batch_size <= 0):
+            raise ValueError(f"batch_size should be a positive int, but got {batch_size}.")
+        if bucket_boundaries is not None and \
+                (not bucket_boundaries or any(b <= a for a, b in zip(bucket_boundaries, bucket_boundaries[1:]))):
+            raise ValueError(f"bucket_boundaries should be a non-empty increasing list, but got {bucket_boundaries}.")
+        if not isinstance(num_buckets, int) or num_buckets <= 0:
+            raise ValueError(f"num_buckets should be a positive int, but got {num_buckets}.")
+        if not 0 <= shard_id < num_shards:
+            raise ValueError(f"shard_id should be in [0, {num_shards}), but got {shard_id}.")
+        self.batch_size = batch_size
+        self.bucket_boundaries = list(bucket_boundaries) if bucket_boundaries is not None else None
+        self.num_buckets = num_buckets
+        self.shuffle = shuffle
+        self.seed = seed
+        self.drop_remainder = drop_remainder
+        self.num_shards = num_shards
+        self.shard_id = shard_id
+        self.length_cache_dir = length_cache_dir
+        self.with_epoch = with_epoch
+        self.epoch = 0
+        self.lengths = None
+        self.boundaries = None
+        self.buckets = None
+        if lengths is not None:
+            self.set_lengths(lengths)
+
+    def set_epoch(self, epoch):
+        """Set the epoch of the next iteration, for example to resume the training"""
+        self.epoch = epoch
+
+    def set_lengths(self, lengths):
+        """Set the token lengths of the samples and put the samples into the buckets"""
+        if isinstance(lengths, str):
+            lengths = np.load(lengths)
+        lengths = np.asarray(lengths, dtype=np.int64).reshape(-1)
+        if self.bucket_boundaries is not None:
+            boundaries = np.array(self.bucket_boundaries, dtype=np.int64)
+        else:
+            quantiles = np.quantile(lengths, np.linspace(0, 1, self.num_buckets + 1)[1:-1]) if len(lengths) else []
+            boundaries = np.unique(np.ceil(quantiles).astype(np.int64) + 1)
+        self.lengths = lengths
+        self.boundaries = boundaries
+        self.buckets = np.searchsorted(boundaries, lengths, side='right')
+        logger.info("Put %s samples into the buckets of the boundaries %s, the sizes are %s.", len(lengths),
+                    boundaries.tolist(), np.bincount(self.buckets, minlength=len(boundaries) + 1).tolist())
+
+    def get_batches(self, epoch=0):
+        """Return the index batches of the shard in an epoch"""
+        if self.lengths is None or self.batch_size is None:
+            raise ValueError("The lengths and the batch_size of LengthBucketedSampler should be set before it "
+                             "is iterated.")
+        rng = np.random.default_rng((self.seed, epoch))
+        batches = []
+        leftover = []
+        for bucket in range(len(self.boundaries) + 1):
+            indices = np.flatnonzero(self.buckets == bucket)
+            if self.shuffle:
+                rng.shuffle(indices)
+            num_full = len(indices) // self.batch_size * self.batch_size
+            if num_full:
+                batches.extend(np.split(indices[:num_full], num_full // self.batch_size))
+            leftover.append(indices[num_full:])
+        if self.shuffle:
+            rng.shuffle(batches)
+        # the leftover samples are sorted by the length, so the mixed batches are still close in the length
+        leftover = np.concatenate(leftover)
+        leftover = leftover[np.argsort(self.lengths[leftover], kind='stable')]
+        for start in range(0, len(leftover), self.batch_size):
+            batch = leftover[start:start + self.batch_size]
+            if len(batch) == self.batch_size or not self.drop_remainder:
+                batches.append(batch)
+        if self.num_shards > 1:
+            # the shards should run the same number of steps, or the collective communication hangs
+            if not self.drop_remainder and batches:
+                if len(batches[-1]) < self.batch_size:
+                    samples = np.resize(np.concatenate(batches), self.batch_size - len(batches[-1]))
+                    batches[-1] = np.concatenate([batches[-1], samples])
+                batches.extend([batches[index % len(batches)] for index in range(-len(batches) % self.num_shards)])
+            num_batches = len(batches) // self.num_shards * self.num_shards
+            batches = batches[self.shard_id:num_batches:self.num_shards]
+        return batches
+
+    def __iter__(self):
+        batches = self.get_batches(self.epoch)
+        offset = self.epoch * len(self.lengths) if self.with_epoch else 0
+        self.epoch += 1
+        for batch in batches:
+            yield from (batch + offset).tolist()
@@ -0,0 +1,300 @@
+# Copyright 2022 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+"""Sequence Packing."""
+import numpy as np
+from mindspore.dataset import GeneratorDataset
+
+from ..tools.logger import logger
+
+__all__ = ['SequencePacker', 'BertSequencePacker', 'T5SequencePacker', 'pack_dataset', 'first_fit_decreasing']
+
+
+def first_fit_decreasing(lengths, capacity, max_items=None):
+    """
+    Pack the items into the bins by the first fit decreasing heuristic.
+
+    Args:
+        lengths: The lengths of the items, an int array of shape (N,) or (N, D) where D is the number of
+            the budgets of a bin, for example the tokens and the masked predictions.
+        capacity: The capacity of a bin, an int or an array of shape (D,).
+        max_items(int): The max number of the items of a bin. Default None, which means no limit.
+
+    Returns:
+        A list of the bins, a bin is a list of the item indices in the ascending order.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64).reshape(len(lengths), -1)
+    capacity = np.broadcast_to(np.asarray(capacity, dtype=np.int64), lengths.shape[1:])
+    if np.any(lengths > capacity):
+        index = int(np.argmax(np.any(lengths > capacity, axis=1)))
+        raise ValueError(f"The item {index} of lengths {lengths[index].tolist()} is larger than "
+                         f"the capacity {capacity.tolist()}.")
+    remaining = np.empty_like(lengths)
+    counts = np.zeros(len(lengths), dtype=np.int64)
+    bins = []
+    for index in np.argsort(-lengths[:, 0], kind='stable').tolist():
+        length = lengths[index]
+        fits = np.all(remaining[:len(bins)] >= length, axis=1)
+        if max_items is not None:
+            fits &= counts[:len(bins)] < max_items
+        position = int(np.argmax(fits)) if bins else 0
+        if not bins or not fits[position]:
+            position = len(bins)
+            bins.append([])
+            remaining[position] = capacity
+        bins[position].append(index)
+        remaining[position] -= length
+        counts[position] += 1
+    return [sorted(item) for item in bins]
+
+
+class SequencePacker:
+    """
+    Pack several short examples into one fixed-length row.
+
+    The examples are buffered by pack_window and packed by first_fit_decreasing, so a larger window packs
+    tighter but mixes the examples of a wider range. The tokens of the n-th example of a row are marked by
+    the segment id n + 1 and the padding by 0, the models build the block-diagonal attention masks from
+    the segment ids when they are created with `packed=True`.
+
+    Args:
+        max_sequences_per_pack(int): The max number of the examples of a row. Default 8.
+        pack_window(int): The number of the examples packed together. Default 1024.
+    """
+    input_columns = []
+    output_columns = []
+
+    def __init__(self, max_sequences_per_pack=8, pack_window=1024):
+        if not isinstance(max_sequences_per_pack, int) or max_sequences_per_pack <= 0:
+            raise ValueError(f"max_sequences_per_pack should be a positive int, but got {max_sequences_per_pack}.")
+        if not isinstance(pack_window, int) or pack_window <= 0:
+            raise ValueError(f"pack_window should be a positive int, but got {pack_window}.")
+        self.max_sequences_per_pack = max_sequences_per_pack
+        self.pack_window = pack_window
+        self.capacity = None
+        self.num_examples = 0
+        self.num_rows = 0
+        self.num_tokens = 0
+
+    def _capacity(self, example):
+        """The budgets of a row, the first one is the token budget"""
+        raise NotImplementedError
+
+    def _lengths(self, example):
+        """The lengths of the example in the budgets of _capacity"""
+        raise NotImplementedError
+
+    def _merge(self, examples, lengths):
+        """Merge the examples into a row of output_columns"""
+        raise NotImplementedError
+
+    def pack(self, examples):
+        """
+        Pack the examples.
+
+        Args:
+            examples: An iterable of the examples, an example is a tuple of the arrays of input_columns.
+
+        Returns:
+            A generator of the packed rows, a row is a tuple of the arrays of output_columns.
+        """
+        window = []
+        for example in examples:
+            window.append(example)
+            if len(window) == self.pack_window:
+                yield from self._pack_window(window)
+                window = []
+        if window:
+            yield from self._pack_window(window)
+        stats = self.stats()
+        logger.info("Packed %s examples into %s rows, the packing efficiency is %.2f%% compared with "
+                    "%.2f%% of the padded examples.", stats['examples'], stats['rows'],
+                    stats['packing_efficiency'] * 100, stats['padded_efficiency'] * 100)
+
+    def _pack_window(self, window):
+        if self.capacity is None:
+            self.capacity = self._capacity(window[0])
+        lengths = [self._lengths(example) for example in window]
+        for indices in first_fit_decreasing(lengths, self.capacity, self.max_sequences_per_pack):
+            row_lengths = [lengths[index] for index in indices]
+            self.num_examples += len(indices)
+            self.num_rows += 1
+            self.num_tokens += sum(int(item[0]) for item in row_lengths)
+            yield self._merge([window[index] for index in indices], row_lengths)
+
+    def stats(self):
+        """
+        Return the counters of the packed examples.
+
+        The packing efficiency is the ratio of the real tokens in the packed rows, and the padded efficiency
+        is the ratio of the real tokens when every example is padded to a row. The tokens are counted by
+        the first budget of the row, which is the sources for t5.
+        """
+        row_size = int(self.capacity[0]) if self.capacity is not None else 0
+        return {'examples': self.num_examples,
+                'rows': self.num_rows,
+                'tokens': self.num_tokens,
+                'sequences_per_row': self.num_examples / self.num_rows if self.num_rows else 0.0,
+                'packing_efficiency': self.num_tokens / (self.num_rows * row_size) if self.num_rows else 0.0,
+                'padded_efficiency': self.num_tokens / (self.num_examples * row_size) if self.num_examples else 0.0}
+
+
+class BertSequencePacker(SequencePacker):
+    """
+    Pack the bert pretrain examples.
+
+    `input_mask` of the packed row is the segment ids, `position_ids` restarts from 0 at each example, and
+    the masked lm positions are shifted to the positions in the row. Each example keeps its next sentence
+    label, which is predicted from the first token of the example at `next_sentence_positions` and weighted
+    by `next_sentence_weights`, so the padding slots are not counted in the loss.
+
+    Args:
+        seq_length(int): The length of a row. Default None, which means the length of the input examples.
+        max_sequences_per_pack(int): The max number of the examples of a row. Default 8.
+        max_predictions_per_pack(int): The max number of the masked lm predictions of a row.
+            Default None, which means twice the max predictions of an input example.
+        pack_window(int): The number of the examples packed together. Default 1024.
+    """
+    input_columns = ["input_ids", "input_mask", "segment_ids", "next_sentence_labels",
+                     "masked_lm_positions", "masked_lm_ids", "masked_lm_weights"]
+    output_columns = input_columns + ["position_ids", "next_sentence_positions", "next_sentence_weights"]
+
+    def __init__(self, seq_length=None, max_sequences_per_pack=8, max_predictions_per_pack=None, pack_window=1024):
+        super(BertSequencePacker, self).__init__(max_sequences_per_pack, pack_window)
+        self.seq_length = seq_length
+        self.max_predictions_per_pack = max_predictions_per_pack
+
+    def _capacity(self, example):
+        seq_length = self.seq_length if self.seq_length else len(example[0])
+        max_predictions = self.max_predictions_per_pack if self.max_predictions_per_pack else 2 * len(example[4])
+        return np.array([seq_length, max_predictions])
+
+    def _lengths(self, example):
+        return np.array([np.count_nonzero(example[1]), np.count_nonzero(example[6])])
+
+    def _merge(self, examples, lengths):
+        seq_length, max_predictions = self.capacity.tolist()
+        max_sequences = self.max_sequences_per_pack
+        input_ids = np.zeros(seq_length, dtype=np.int32)
+        input_mask = np.zeros(seq_length, dtype=np.int32)
+        segment_ids = np.zeros(seq_length, dtype=np.int32)
+        position_ids = np.zeros(seq_length, dtype=np.int32)
+        masked_lm_positions = np.zeros(max_predictions, dtype=np.int32)
+        masked_lm_ids = np.zeros(max_predictions, dtype=np.int32)
+        masked_lm_weights = np.zeros(max_predictions, dtype=np.int32)
+        next_sentence_labels = np.zeros(max_sequences, dtype=np.int32)
+        next_sentence_positions = np.zeros(max_sequences, dtype=np.int32)
+        next_sentence_weights = np.zeros(max_sequences, dtype=np.int32)
+
+        offset = 0
+        predictions = 0
+        for sequence, (example, (length, num_predictions)) in enumerate(zip(examples, lengths)):
+            end = offset + length
+            input_ids[offset:end] = example[0][:length]
+            input_mask[offset:end] = sequence + 1
+            segment_ids[offset:end] = example[2][:length]
+            position_ids[offset:end] = np.arange(length)
+            next_sentence_labels[sequence] = np.asarray(example[3]).reshape(-1)[0]
+            next_sentence_positions[sequence] = offset
+            next_sentence_weights[sequence] = 1
+            valid = np.asarray(example[6]) != 0
+            masked = slice(predictions, predictions + num_predictions)
+            masked_lm_positions[masked] = np.asarray(example[4])[valid] + offset
+            masked_lm_ids[masked] = np.asarray(example[5])[valid]
+            masked_lm_weights[masked] = np.asarray(example[6])[valid]
+            offset = end
+            predictions += num_predictions
+        return (input_ids, input_mask, segment_ids, next_sentence_labels, masked_lm_positions,
+                masked_lm_ids, masked_lm_weights, position_ids, next_sentence_positions, next_sentence_weights)
+
+
+class T5SequencePacker(SequencePacker):
+    """
+    Pack the t5 examples, both the sources and the targets of the examples of a row should fit.
+
+    `source_mask` and `target_mask` of the packed row are the segment ids of the sources and the targets.
+    The t5 attention uses the relative position bias, which is the same within a segment wherever the
+    segment starts, so no position ids are needed.
+    Pack a dataset of input_columns by `pack_dataset(dataset, T5SequencePacker())` and create
+    T5ModelForGeneration with `packed=True` to train on the packed rows.
+
+    Args:
+        seq_length(int): The length of the sources of a row. Default None, which means the length of the
+            input sources.
+        target_length(int): The length of the targets of a row. Default None, which means the length of
+            the input targets.
+        max_sequences_per_pack(int): The max number of the examples of a row. Default 8.
+        pack_window(int): The number of the examples packed together. Default 1024.
+    """
+    input_columns = ["source_ids", "source_mask", "target_ids"]
+    output_columns = ["source_ids", "source_mask", "target_ids", "target_mask"]
+
+    def __init__(self, seq_length=None, target_length=None, max_sequences_per_pack=8, pack_window=1024):
+        super(T5SequencePacker, self).__init__(max_sequences_per_pack, pack_window)
+        self.seq_length = seq_length
+        self.target_length = target_length
+
+    def _capacity(self, example):
+        return np.array([self.seq_length if self.seq_length else len(example[0]),
+                         self.target_length if self.target_length else len(example[2])])
+
+    def _lengths(self, example):
+        # the padding id of the targets is 0, the same as the loss mask of T5ModelForGeneration
+        return np.array([np.count_nonzero(example[1]), np.count_nonzero(example[2])])
+
+    def _merge(self, examples, lengths):
+        seq_length, target_length = self.capacity.tolist()
+        source_ids = np.zeros(seq_length, dtype=np.int32)
+        source_mask = np.zeros(seq_length, dtype=np.int32)
+        target_ids = np.zeros(target_length, dtype=np.int32)
+        target_mask = np.zeros(target_length, dtype=np.int32)
+        source_offset = 0
+        target_offset = 0
+        for sequence, (example, (source_len, target_len)) in enumerate(zip(examples, lengths)):
+            source_ids[source_offset:source_offset + source_len] = example[0][:source_len]
+            source_mask[source_offset:source_offset + source_len] = sequence + 1
+            target_ids[target_offset:target_offset + target_len] = example[2][:target_len]
+            target_mask[target_offset:target_offset + target_len] = sequence + 1
+            source_offset += source_len
+            target_offset += target_len
+        return source_ids, source_mask, target_ids, target_mask
+
+
+class _PackedSource:
+    """An iterable source of GeneratorDataset, the upstream dataset is packed again every epoch"""
+    def __init__(self, dataset, packer):
+        self.dataset = dataset
+        self.packer = packer
+
+    def __iter__(self):
+        columns = self.packer.input_columns
+        rows = self.dataset.create_dict_iterator(num_epochs=1, output_numpy=True)
+        return self.packer.pack(tuple(row[name] for name in columns) for row in rows)
+
+
+def pack_dataset(dataset, packer):
+    """
+    Pack the rows of a dataset by the packer.
+
+    The packing runs in a single python worker since the examples are packed in order, the dataset should
+    be sharded and shuffled before it is packed.
+
+    Args:
+        dataset: The dataset which has the input_columns of the packer.
+        packer(SequencePacker): The packer.
+
+    Returns:
+        A GeneratorDataset of the output_columns of the packer.
+    """
+    return GeneratorDataset(_PackedSource(dataset, packer), column_names=packer.output_columns, shuffle=False)
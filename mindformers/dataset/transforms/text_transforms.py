@@ -24,18 +24,57 @@ __all__ = [
 
 @MindFormerRegister.register(MindFormerModuleType.TRANSFORMS)
 class RandomChoiceTokenizerForward:
-    """Random Choice Tokenizer Forward"""
-    def __init__(self, tokenizer, max_length=77, padding="max_length", random_seed=2022):
+    """
+    Random Choice Tokenizer Forward
+
+    If pretokenize is True, the captions of all samples are tokenized once by build_table into a padded
+    int32 table and the offsets of the samples, and the input of the transform is the pair of the sample
+    index and the epoch given by the epoch-aware sampler of the dataset, see BlockShuffleSampler. A row of
+    the sample is picked by a generator seeded by random_seed, the epoch and the sample index, so a different
+    caption can be picked every epoch and the pick does not depend on the worker which runs the transform.
+    """
+    def __init__(self, tokenizer, max_length=77, padding="max_length", random_seed=2022, pretokenize=False):
         self.max_length = max_length
         self.padding = padding
         self.tokenizer = tokenizer
         self.random_seed = random_seed
+        self.pretokenize = pretokenize
+        self.table = None
+        self.offsets = None
+
+    def build_table(self, captions):
+        """
+        Tokenize the captions of all samples once.
+
+        Args:
+            captions (list): a list of the caption lists of the samples in the order of the sample index.
+        """
+        num_captions = [len(item) for item in captions]
+        if 0 in num_captions:
+            raise ValueError(f"The sample {num_captions.index(0)} has no caption.")
+        offsets = np.zeros(len(captions) + 1, dtype=np.int64)
+        np.cumsum(num_captions, out=offsets[1:])
+        flat_captions = [caption for item in captions for caption in item]
+        self.table = self.tokenizer(flat_captions, max_length=self.max_length, padding=self.padding,
+                                    truncation=True, return_tensors="np")["input_ids"]
+        self.offsets = offsets
+
+    def pick(self, index, epoch):
+        """Return the tokenized caption of the sample picked in the epoch"""
+        start, end = self.offsets[index], self.offsets[index + 1]
+        generator = np.random.default_rng((self.random_seed, epoch, index))
+        return self.table[start + generator.integers(end - start)]
 
     def __call__(self, text):
+        if self.table is not None:
+            index, epoch = np.asarray(text).tolist()
+            return self.pick(index, epoch)
+
         np.random.seed(self.random_seed)
-        index = np.random.choice(len(text.tolist()))
+        text = text.tolist()
+        index = np.random.choice(len(text))
         token_id = self.tokenizer(
-            text.tolist()[index],
+            text[index],
             max_length=self.max_length,
             padding=self.padding
         )["input_ids"]
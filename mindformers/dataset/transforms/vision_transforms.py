@@ -22,10 +22,12 @@ from PIL import Image
 from mindspore.dataset import vision
 import mindspore as ms
 
+from ...tools.register import MindFormerRegister, MindFormerModuleType
+
 
 __all__ = [
     'BatchResize', 'BCHW2BHWC', 'BatchPILize',
-    'BatchNormalize', 'BatchCenterCrop', 'BatchToTensor'
+    'BatchNormalize', 'BatchCenterCrop', 'BatchToTensor', 'ToTensorNormalize'
 ]
 
 
@@ -70,6 +72,15 @@ class BatchResize:
     def __init__(self, image_resolution):
         self.sizer = vision.Resize(image_resolution)
 
+    def _resize_batch(self, image_batch):
+        """Resize the images one by one into a preallocated output, they share the same output shape"""
+        first = self.sizer(image_batch[0])
+        output = np.empty((len(image_batch),) + first.shape, dtype=first.dtype)
+        output[0] = first
+        for index in range(1, len(image_batch)):
+            output[index] = self.sizer(image_batch[index])
+        return output
+
     def __call__(self, image_batch):
         """
         The forward process.
@@ -90,8 +101,7 @@ class BatchResize:
             return [self.sizer(item) for item in image_batch]
         if isinstance(image_batch, np.ndarray):
             if len(image_batch.shape) == 4:
-                return np.row_stack([self.sizer(item)[np.newaxis, :]
-                                     for item in image_batch])
+                return self._resize_batch(image_batch)
             if len(image_batch.shape) == 3:
                 return self.sizer(image_batch)
             raise ValueError(f"the rank of image_batch should be 3 or 4,"
@@ -109,6 +119,30 @@ class BatchCenterCrop:
     """
     def __init__(self, image_resolution):
         self.crop = vision.CenterCrop(image_resolution)
+        if isinstance(image_resolution, int):
+            image_resolution = (image_resolution, image_resolution)
+        self.crop_height, self.crop_width = image_resolution
+        self._offsets = {}
+
+    def _crop_offset(self, height, width):
+        """
+        The top left of the crop of an image of the size, it is found by cropping an image of the pixel
+        indices by the op once, so the odd margins are rounded the same as the op.
+        """
+        offset = self._offsets.get((height, width))
+        if offset is None:
+            probe = np.arange(height * width, dtype=np.int32).reshape(height, width, 1)
+            offset = divmod(int(self.crop(probe)[0, 0, 0]), width)
+            self._offsets[(height, width)] = offset
+        return offset
+
+    def _crop_batch(self, image_batch):
+        """Crop the whole batch by slicing, the images smaller than the target are padded by the op"""
+        height, width = image_batch.shape[1:3]
+        if height < self.crop_height or width < self.crop_width:
+            return np.stack([self.crop(item) for item in image_batch])
+        top, left = self._crop_offset(height, width)
+        return np.ascontiguousarray(image_batch[:, top:top + self.crop_height, left:left + self.crop_width])
 
     def __call__(self, image_batch):
         """
@@ -132,8 +166,7 @@ class BatchCenterCrop:
             return [self.crop(item) for item in image_batch]
         if isinstance(image_batch, np.ndarray):
             if len(image_batch.shape) == 4:
-                return np.row_stack([self.crop(item)[np.newaxis, :]
-                                     for item in image_batch])
+                return self._crop_batch(image_batch)
             if len(image_batch.shape) == 3:
                 return self.crop(image_batch)
             raise ValueError(f"the rank of image_batch should be 3 or 4,"
@@ -165,8 +198,11 @@ class BatchToTensor:
             return [self.totensor(item) for item in image_batch]
         if isinstance(image_batch, np.ndarray):
             if len(image_batch.shape) == 4:
-                return np.row_stack([self.totensor(item)[np.newaxis, :]
-                                     for item in image_batch])
+                # a single transpose from NHWC to NCHW, scaled into the preallocated float32 output
+                batch_size, height, width, channel = image_batch.shape
+                output = np.empty((batch_size, channel, height, width), dtype=np.float32)
+                np.divide(image_batch.transpose(0, 3, 1, 2), 255, out=output, casting='unsafe')
+                return output
             if len(image_batch.shape) == 3:
                 return self.totensor(image_batch)
             raise ValueError(f"the rank of image_batch should be 3 or 4,"
@@ -184,6 +220,10 @@ class BatchNormalize:
             is_hwc=False
     ):
         self.normalize = vision.Normalize(mean=mean, std=std, is_hwc=is_hwc)
+        # the shapes broadcast over the channel axis of NHWC or NCHW batches
+        shape = (-1,) if is_hwc else (-1, 1, 1)
+        self.mean = np.array(mean, dtype=np.float32).reshape(shape)
+        self.std = np.array(std, dtype=np.float32).reshape(shape)
 
     def __call__(self, image_batch):
         """
@@ -205,12 +245,86 @@ class BatchNormalize:
             if len(image_batch.shape) == 3:
                 return self.normalize(image_batch)
             if len(image_batch.shape) == 4:
-                return np.row_stack([self.normalize(item)[np.newaxis, :]
-                                     for item in image_batch])
+                output = np.empty(image_batch.shape, dtype=np.float32)
+                np.subtract(image_batch, self.mean, out=output, casting='unsafe')
+                np.divide(output, self.std, out=output)
+                return output
             raise ValueError(f"the rank of image_batch should be 3 or 4,"
                              f" but got {len(image_batch.shape)}")
         raise TypeError(f"the type {type(image_batch)} of image_batch is unsupported.")
 
+@MindFormerRegister.register(MindFormerModuleType.TRANSFORMS)
+class ToTensorNormalize:
+    """
+    Fuse ToTensor, Normalize and the transpose from HWC to CHW.
+
+    The image is transposed once and written into the preallocated output with the precomputed
+    per-channel scale and offset, which replace the division by 255 and the normalization.
+
+    Args:
+        mean (tuple): the mean of each channel for the images scaled to (0, 1).
+        std (tuple): the std of each channel for the images scaled to (0, 1).
+        dtype (str): the output dtype, float32 or float16.
+    """
+    def __init__(
+            self,
+            mean=(0.48145466, 0.4578275, 0.40821073),
+            std=(0.26862954, 0.26130258, 0.27577711),
+            dtype="float32"
+    ):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"dtype should be float32 or float16, but got {dtype}.")
+        if len(mean) != len(std):
+            raise ValueError(f"the length of mean and std should be the same, but got {len(mean)} and {len(std)}.")
+        self.dtype = np.dtype(dtype)
+        mean = np.array(mean, dtype=np.float64)
+        std = np.array(std, dtype=np.float64)
+        # (x / 255 - mean) / std == x * scale + offset
+        self.scale = (1 / (255 * std)).astype(np.float32).reshape(-1, 1, 1)
+        self.offset = (-mean / std).astype(np.float32).reshape(-1, 1, 1)
+
+    def __call__(self, image_batch):
+        """
+        The forward process.
+
+        Args:
+            image_batch (tensor, numpy.array, PIL.Image, list): for tensor or numpy input,
+            the shape should be (bz, h, w, c) or (h, w, c). for list, the item should be
+            PIL.Image or numpy.array (h, w, c) of the same shape.
+
+        Returns:
+            the normalized numpy array with the shape (bz, c, h, w) or (c, h, w).
+        """
+        if isinstance(image_batch, ms.Tensor):
+            image_batch = image_batch.asnumpy()
+        if isinstance(image_batch, Image.Image):
+            image_batch = np.asarray(image_batch)
+        if isinstance(image_batch, list):
+            image_batch = np.stack([np.asarray(item) for item in image_batch])
+        if not isinstance(image_batch, np.ndarray):
+            raise TypeError(f"the type {type(image_batch)} of image_batch is unsupported.")
+        if len(image_batch.shape) not in (3, 4):
+            raise ValueError(f"the rank of image_batch should be 3 or 4,"
+                             f" but got {len(image_batch.shape)}")
+        if image_batch.shape[-1] != len(self.scale):
+            raise ValueError(f"the channel of image_batch should be {len(self.scale)},"
+                             f" but got {image_batch.shape[-1]}")
+
+        image_batch = np.moveaxis(image_batch, -1, -3)
+        output = np.empty(image_batch.shape, dtype=self.dtype)
+        if self.dtype == np.float32:
+            np.multiply(image_batch, self.scale, out=output, casting='unsafe')
+            np.add(output, self.offset, out=output)
+            return output
+        # the float16 arithmetic is slow, so each image is computed in a reused float32 buffer
+        shape = (-1,) + image_batch.shape[-3:]
+        buffer = np.empty(shape[1:], dtype=np.float32)
+        for image, image_output in zip(image_batch.reshape(shape), output.reshape(shape)):
+            np.multiply(image, self.scale, out=buffer, casting='unsafe')
+            np.add(buffer, self.offset, out=image_output, casting='unsafe')
+        return output
+
+
 class BatchPILize:
     """transform a batch of image to PIL.Image list."""
     def __call__(self, image_batch):
@@ -16,8 +16,13 @@
 import copy
 import os
 import json
+import multiprocessing
+import re
+import unicodedata
+import weakref
 from collections import defaultdict
 
+import numpy as np
 import yaml
 from mindspore import Tensor
 
@@ -25,6 +30,7 @@ from mindformers.tools import logger
 from mindformers.tools.register import MindFormerRegister, MindFormerModuleType, MindFormerConfig
 
 from .build_tokenizer import build_tokenizer
+from .tokenizer_utils import COMPILED_VOCAB_NAME, LRUCache
 
 __all__ = ['PretrainedTokenizerBase', 'PretrainedTokenizer', 'SpecialTokensMixin']
 
@@ -33,16 +39,50 @@ from ..mindformer_book import MindFormerBook
 
 SPECIAL_TOKEN_FILE_NAME = 'special_tokens_map.json'
 TOKENIZER_CONFIG_NAME = 'tokenizer_config.json'
+# The batch is tokenized by the worker pool only if each worker gets at least this number of texts
+MIN_TEXTS_PER_WORKER = 64
+# The long texts are split into the windows by the words between these whitespace characters, which are
+# the separators of all the tokenizers
+WINDOW_WORD_PATTERN = re.compile(r"[^ \t\n\r]+")
+WINDOW_WORD_SEPARATORS = " \t\n\r"
+
+_worker_tokenizer = None
+
+
+def _init_tokenizer_worker(tokenizer):
+    """Keep the tokenizer in the worker process, so it is only pickled once for each worker"""
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _normalize_offset_text(text):
+    """Lowercase the text and strip the accents, with the index in the text of each normalized character"""
+    if text.isascii():
+        return text.lower(), list(range(len(text))) + [len(text)]
+    chars = []
+    positions = []
+    for index, char in enumerate(text):
+        for item in unicodedata.normalize("NFD", char.lower()):
+            if unicodedata.category(item) != "Mn":
+                chars.append(item)
+                positions.append(index)
+    return "".join(chars), positions + [len(text)]
+
+
+def _worker_get_token_ids(text):
+    """Get the token ids using the tokenizer of the worker process"""
+    return _worker_tokenizer._get_token_ids(text)  # pylint: disable=W0212
 
 
 class SpecialTokensMixin:
     """A class for managing the specific tokens"""
-    SPECIAL_TOKENS = ['pad_token', 'cls_token', 'sep_token', 'pad_token', 'mask_token', 'bos_token', 'eos_token']
+    SPECIAL_TOKENS = ['pad_token', 'cls_token', 'sep_token', 'unk_token', 'mask_token', 'bos_token', 'eos_token']
 
     def __init__(self,
                  **kwargs):
 
         self._pad_token = None
+        self._unk_token = None
         self._sep_token = None
         self._cls_token = None
         self._mask_token = None
@@ -62,6 +102,14 @@ class SpecialTokensMixin:
     def pad_token_id(self):
         return self._convert_tokens_to_ids(self._pad_token)
 
+    @property
+    def unk_token(self):
+        return self._unk_token
+
+    @property
+    def unk_token_id(self):
+        return self._convert_tokens_to_ids(self._unk_token)
+
     @property
     def sep_token(self):
         return self._sep_token
@@ -98,6 +146,12 @@ class SpecialTokensMixin:
     def pad_token_type_id(self):
         return self._pad_token_type_id
 
+    @property
+    def all_special_ids(self):
+        """The sorted ids of the special tokens which are set"""
+        tokens = {getattr(self, '_' + item) for item in self.SPECIAL_TOKENS} - {None}
+        return sorted({self._convert_tokens_to_ids(token) for token in tokens})
+
 
 class PretrainedTokenizerBase(SpecialTokensMixin):
     """The pretrained tokenize providing basic method for tokenizing."""
@@ -109,6 +163,22 @@ class PretrainedTokenizerBase(SpecialTokensMixin):
         super(PretrainedTokenizerBase, self).__init__(**kwargs)
         self.model_inputs = self.MODEL_INPUT_NAME
         self.init_kwargs = kwargs
+        self.num_workers = kwargs.get('num_workers', 1)
+        self._worker_pool = None
+        self._worker_pool_size = 0
+        self._worker_pool_finalizer = None
+        self._decode_table = None
+        self._encode_cache = LRUCache(kwargs.get('encode_cache_size') or 0, thread_safe=True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_worker_pool'] = None
+        state['_worker_pool_size'] = 0
+        state['_worker_pool_finalizer'] = None
+        state['_encode_cache'] = LRUCache(self._encode_cache.capacity, thread_safe=True)
+        # the decode table is rebuilt on demand, it is not copied into the workers
+        state['_decode_table'] = None
+        return state
 
     def __call__(self,
                  text,
@@ -125,18 +195,69 @@ class PretrainedTokenizerBase(SpecialTokensMixin):
             1. tokenize
             2. convert them to ids
             3. combine them to a batch
+
+        If `encode_cache_size` is set in the tokenizer config, the outputs are kept in a bounded cache keyed
+        by the inputs and the arguments, so the repeated inputs, for example the prompts of the labels,
+        are not tokenized again. The cache can be shared by the threads, see `encode_cache_info`.
         """
         return_batch = True
         if isinstance(text, str):
             return_batch = False
+        cache_key = None
+        if self._encode_cache.capacity:
+            cache_key = self._get_encode_cache_key(text, text_pair, add_special_tokens, max_length,
+                                                   padding, return_tensors, kwargs)
+            output = self._encode_cache.get(cache_key) if cache_key is not None else None
+            if output is not None:
+                return self._copy_encode_output(output)
         output = self.batch_encode_plus(text, text_pair=text_pair, max_length=max_length,
                                         add_special_tokens=add_special_tokens,
                                         padding=padding,
                                         return_tensors=return_tensors,
                                         return_batch=return_batch,
                                         **kwargs)
+        if cache_key is not None:
+            self._encode_cache.put(cache_key, self._copy_encode_output(output))
         return output
 
+    @staticmethod
+    def _get_encode_cache_key(text, text_pair, *args):
+        """Return the key of the encode cache, None if the inputs are not hashable"""
+        def _to_key(item):
+            if isinstance(item, (list, tuple)):
+                return tuple(_to_key(sub_item) for sub_item in item)
+            if isinstance(item, dict):
+                return tuple(sorted((k, _to_key(v)) for k, v in item.items()))
+            return item
+
+        key = (_to_key(text), _to_key(text_pair), _to_key(args))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    @staticmethod
+    def _copy_encode_output(output):
+        """Copy the lists and the numpy arrays, so the cached outputs are not changed by the callers"""
+        res = {}
+        for k, v in output.items():
+            if isinstance(v, np.ndarray):
+                res[k] = v.copy()
+            elif isinstance(v, list):
+                res[k] = copy.deepcopy(v)
+            else:
+                res[k] = v
+        return res
+
+    def encode_cache_info(self):
+        """Return the hits, misses and evictions of the encode cache enabled by `encode_cache_size`"""
+        return self._encode_cache.stats()
+
+    def clear_encode_cache(self):
+        """Remove the outputs kept by the encode cache"""
+        self._encode_cache.clear()
+
     def _batch_encode_plus(self,
                            text,
                            text_pair=None,
@@ -147,6 +268,9 @@ class PretrainedTokenizerBase(SpecialTokensMixin):
                            return_token_type_ids=None,
                            return_attention_mask=None,
                            return_batch=True,
+                           num_workers=None,
+                           pad_to_multiple_of=None,
+                           truncation=False,
                            **kwargs):
         """Convert the input text into the ids"""
         raise NotImplementedError
@@ -161,20 +285,62 @@ class PretrainedTokenizerBase(SpecialTokensMixin):
                           return_attention_mask=None,
                           return_tensors=None,
                           return_batch=True,
+                          num_workers=None,
+                          pad_to_multiple_of=None,
+                          truncation=False,
+                          stride=0,
+                          return_overflowing_tokens=False,
+                          return_offsets_mapping=False,
                           **kwargs):
         """
         Convert the input text into the list. This API can process the batch inputs.
+
+        `padding` supports `max_length` to pad the batch to `max_length` and `longest` (or True) to pad the
+        batch to its longest sequence. The padded length is rounded up to a multiple of `pad_to_multiple_of`
+        if it is set. If `truncation` is True, the sequences are truncated to `max_length` with the room kept
+        for the special tokens, the longer sequence of a pair is truncated first.
+
+        If `num_workers` (or the `num_workers` of the tokenizer config when it is None) is larger than 1,
+        large batches are tokenized by a pool of worker processes. The order of the outputs is kept.
+
+        If `return_overflowing_tokens` is True, each text is split into the windows of `max_length` instead
+        of being truncated, and the consecutive windows of a text share `stride` tokens. The rows are the
+        windows of all the texts, `overflow_to_sample_mapping` keeps the index of the text of each row and
+        `offset_mapping` keeps the (start, end) characters of each token in the text if
+        `return_offsets_mapping` is True, (0, 0) for the special tokens and the padding. A token which is not
+        found in the text, like the unknown token, spans the characters between the tokens around it. The text pairs are
+        not supported. See `iter_windows` to stream the windows of a long document.
+
+        `return_tensors` supports `np` for the int32 numpy arrays and `ms` for the mindspore tensors.
         """
-        if padding and padding != "max_length":
-            raise ValueError("padding only supports `max_length` or `None`.")
+        if padding is True:
+            padding = "longest"
+        if padding and padding not in ("max_length", "longest"):
+            raise ValueError("padding only supports `max_length`, `longest` or `None`.")
         padding_strategy = None
         if padding:
-            padding_strategy = "max_length"
-        if max_length and not padding:
+            padding_strategy = padding
+        if max_length and not padding and not truncation and not return_overflowing_tokens:
             logger.warning("If you want to enable the padding, please set padding to `max_length`.")
+        if pad_to_multiple_of is not None and (not isinstance(pad_to_multiple_of, int) or pad_to_multiple_of <= 0):
+            raise ValueError(f"pad_to_multiple_of should be a positive int, but got {pad_to_multiple_of}.")
         # if input text is only one list, we should prepare it into a tensor with batch size 1.
         text = self._prepare_input_to_list(text)
         text_pair = self._prepare_input_to_list(text_pair)
+        if return_offsets_mapping and not return_overflowing_tokens:
+            raise ValueError("return_offsets_mapping is only supported with return_overflowing_tokens.")
+        if return_overflowing_tokens:
+            return self._batch_encode_windows(text,
+                                              text_pair=text_pair,
+                                              max_length=max_length,
+                                              stride=stride,
+                                              padding_strategy=padding_strategy,
+                                              add_special_tokens=add_special_tokens,
+                                              return_tensors=return_tensors,
+                                              return_token_type_ids=return_token_type_ids,
+                                              return_attention_mask=return_attention_mask,
+                                              return_offsets_mapping=return_offsets_mapping,
+                                              pad_to_multiple_of=pad_to_multiple_of)
         return self._batch_encode_plus(text,
                                        text_pair=text_pair,
                                        max_length=max_length,
@@ -184,8 +350,186 @@ class PretrainedTokenizerBase(SpecialTokensMixin):
                                        return_token_type_ids=return_token_type_ids,
                                        return_attention_mask=return_attention_mask,
                                        return_batch=return_batch,
+                                       num_workers=num_workers,
+                                       pad_to_multiple_of=pad_to_multiple_of,
+                                       truncation=truncation,
                                        **kwargs)
 
+    def _batch_encode_windows(self,
+                              text,
+                              text_pair=None,
+                              max_length=None,
+                              stride=0,
+                              padding_strategy=None,
+                              add_special_tokens=True,
+                              return_tensors=None,
+                              return_token_type_ids=None,
+                              return_attention_mask=None,
+                              return_offsets_mapping=False,
+                              pad_to_multiple_of=None):
+        """Split the texts into the windows and convert the windows of all the texts into a batch"""
+        if text_pair:
+            raise ValueError("return_overflowing_tokens does not support text_pair.")
+        window_ids = []
+        window_offsets = []
+        sample_mapping = []
+        for index, item in enumerate(text):
+            for ids, offsets in self._iter_window_ids(item, max_length, stride, add_special_tokens):
+                window_ids.append(ids)
+                window_offsets.append(offsets)
+                sample_mapping.append(index)
+        # the tensors are converted after the offsets are padded to the rows
+        output = self._batch_prepare_for_model(ids=window_ids,
+                                               add_special_tokens=add_special_tokens,
+                                               max_length=max_length,
+                                               padding_strategy=padding_strategy,
+                                               return_tensors='np' if return_tensors == 'ms' else return_tensors,
+                                               return_token_type_ids=return_token_type_ids,
+                                               return_attention_mask=return_attention_mask,
+                                               return_batch=True,
+                                               pad_to_multiple_of=pad_to_multiple_of)
+        output['overflow_to_sample_mapping'] = sample_mapping
+        if return_offsets_mapping:
+            output['offset_mapping'] = [self._get_window_offsets(offsets, add_special_tokens, len(row))
+                                        for offsets, row in zip(window_offsets, output['input_ids'])]
+        if return_tensors:
+            output['overflow_to_sample_mapping'] = np.array(sample_mapping, dtype=np.int32)
+            if return_offsets_mapping:
+                output['offset_mapping'] = np.array(output['offset_mapping'], dtype=np.int32).reshape(
+                    len(window_ids), -1, 2)
+            if return_tensors == 'ms':
+                for k in output.keys():
+                    output[k] = Tensor(output[k])
+        return output
+
+    def iter_windows(self,
+                     text,
+                     max_length,
+                     stride=0,
+                     add_special_tokens=True,
+                     padding=None,
+                     return_tensors=None,
+                     return_offsets_mapping=False):
+        """
+        Split a long text into the windows of max_length lazily, so the whole text is not tokenized at once.
+
+        The text is tokenized word by word, and a window is yielded once its tokens are ready. The consecutive
+        windows share `stride` tokens, and the last window may be shorter than max_length.
+
+        Args:
+            text(str or iterable): The text, or its chunks, for example the lines of a file, which are read
+                one by one. A word can be split across the chunks.
+            max_length(int): The max length of a window with the special tokens.
+            stride(int): The number of the tokens shared by the consecutive windows. Default 0.
+            add_special_tokens(bool): Whether to add the special tokens to each window. Default True.
+            padding(str): `max_length` to pad each window to max_length. Default None.
+            return_tensors(str): `np` or `ms` to return the tensors. Default None.
+            return_offsets_mapping(bool): Whether to return the `offset_mapping` of the (start, end) characters
+                of each token in the text, see `batch_encode_plus`. Default False.
+
+        Yields:
+            The dict of the input_ids, the token_type_ids and the attention_mask of a window.
+        """
+        if padding not in (None, False, "max_length"):
+            raise ValueError(f"padding of iter_windows only supports `max_length` or `None`, but got {padding}.")
+        for ids, offsets in self._iter_window_ids(text, max_length, stride, add_special_tokens):
+            output = self.prepare_for_model(ids,
+                                            add_special_tokens=add_special_tokens,
+                                            max_length=max_length,
+                                            padding_strategy=padding,
+                                            return_tensors=return_tensors)
+            if return_offsets_mapping:
+                offsets = self._get_window_offsets(offsets, add_special_tokens, len(output['input_ids']))
+                if return_tensors:
+                    offsets = np.array(offsets, dtype=np.int32).reshape(-1, 2)
+                    offsets = Tensor(offsets) if return_tensors == 'ms' else offsets
+                output['offset_mapping'] = offsets
+            yield output
+
+    def _iter_window_ids(self, text, max_length, stride=0, add_special_tokens=True):
+        """Yield the ids and the offsets of the windows of a text, the special tokens are not inserted"""
+        if not max_length:
+            raise ValueError("max_length should be set to split the texts into the windows.")
+        budget = max_length - (self.num_special_tokens_to_add() if add_special_tokens else 0)
+        if budget <= 0:
+            raise ValueError(f"The max_length {max_length} is too small to keep the special tokens.")
+        if not isinstance(stride, int) or not 0 <= stride < budget:
+            raise ValueError(f"stride should be an int in [0, {budget}) for the max_length {max_length}, "
+                             f"but got {stride}.")
+        ids = []
+        offsets = []
+        num_windows = 0
+        for word, start in self._iter_words(text):
+            tokens = self.tokenize(word)
+            ids.extend(self.convert_tokens_to_ids(tokens) if tokens else [])
+            offsets.extend(self._get_token_offsets(word, tokens, start))
+            while len(ids) > budget:
+                yield ids[:budget], offsets[:budget]
+                num_windows += 1
+                del ids[:budget - stride]
+                del offsets[:budget - stride]
+        # the tokens left after a window are more than stride, so they are never covered by the last window
+        if ids or not num_windows:
+            yield ids, offsets
+
+    def _iter_words(self, text):
+        """Yield the words of the text or its chunks and their start characters in the text"""
+        chunks = [text] if isinstance(text, str) else text
+        carry = ""
+        position = 0
+        for chunk in chunks:
+            if not isinstance(chunk, str):
+                raise ValueError(f"The text should be a str or an iterable of str, but got {type(chunk)}.")
+            buffer = carry + chunk
+            end = len(buffer)
+            if buffer and buffer[-1] not in WINDOW_WORD_SEPARATORS:
+                # the last word may be continued by the next chunk
+                end = max(buffer.rfind(char) for char in WINDOW_WORD_SEPARATORS) + 1
+            for match in WINDOW_WORD_PATTERN.finditer(buffer, 0, end):
+                yield match.group(), position + match.start()
+            carry = buffer[end:]
+            position += end
+        if carry:
+            yield carry, position
+
+    def _get_token_offsets(self, word, tokens, start):
+        """
+        Locate the text of each token in the word from the end of the previous token, ignoring the case and the
+        accents. The tokens which are not found span the characters between the found tokens around them.
+        """
+        normalized, positions = _normalize_offset_text(word)
+        offsets = []
+        missing = []
+        cursor = 0
+        for token in tokens:
+            token_text = _normalize_offset_text(self._token_text(token))[0]
+            found = normalized.find(token_text, cursor) if token_text else -1
+            if found < 0:
+                missing.append(len(offsets))
+                offsets.append(None)
+                continue
+            for index in missing:
+                offsets[index] = (start + positions[cursor], start + positions[found])
+            missing = []
+            cursor = found + len(token_text)
+            offsets.append((start + positions[found], start + positions[cursor - 1] + 1))
+        for index in missing:
+            offsets[index] = (start + positions[cursor], start + len(word))
+        return offsets
+
+    def _token_text(self, token):
+        """The text of a token in the original text, an empty str if it is unknown"""
+        return token
+
+    def _get_window_offsets(self, offsets, add_special_tokens, length):
+        """Insert the (0, 0) offsets of the special tokens and the padding into the offsets of a window"""
+        offsets = list(offsets)
+        if add_special_tokens:
+            # the negative ids mark the positions of the window tokens
+            positions = self.build_inputs_with_special_tokens([-1 - i for i in range(len(offsets))])
+            offsets = [offsets[-1 - item] if item < 0 else (0, 0) for item in positions]
+        return offsets + [(0, 0)] * (length - len(offsets))
+
     def _prepare_input_to_list(self, inputs):
         """put the input into the list"""
         if inputs is None:
@@ -207,6 +551,42 @@ class PretrainedTokenizerBase(SpecialTokensMixin):
             output.append(res)
         return output
 
+    def _batch_get_token_ids(self, text, num_workers=None):
+        """Get the token_ids of each item in text, using the worker pool for the large batches"""
+        if num_workers is None:
+            num_workers = self.num_workers
+        if not num_workers or num_workers <= 1 or len(text) < num_workers * MIN_TEXTS_PER_WORKER:
+            return [self._get_token_ids(item) for item in text]
+        pool = self._get_worker_pool(num_workers)
+        # a few chunks for each worker to balance the texts of different lengths
+        chunk_size = max(1, len(text) // (num_workers * 4))
+        return pool.map(_worker_get_token_ids, text, chunksize=chunk_size)
+
+    def _get_worker_pool(self, num_workers):
+        """Create the worker pool, the tokenizer is sent to each worker once when it starts"""
+        if self._worker_pool is not None and self._worker_pool_size != num_workers:
+            self.close_worker_pool()
+        if self._worker_pool is None:
+            logger.info("Start the tokenizer worker pool with %s workers.", num_workers)
+            self._worker_pool = multiprocessing.Pool(processes=num_workers,
+                                                     initializer=_init_tokenizer_worker,
+                                                     initargs=(copy.copy(self),))
+            self._worker_pool_size = num_workers
+            # the workers are stopped if the tokenizer is garbage collected or alive at exit without
+            # close_worker_pool, the pool keeps a copy without the pool so it does not keep the tokenizer
+            self._worker_pool_finalizer = weakref.finalize(self, self._worker_pool.terminate)
+        return self._worker_pool
+
+    def close_worker_pool(self):
+        """Close the worker pool used by the batch encoding"""
+        if self._worker_pool is not None:
+            self._worker_pool_finalizer.detach()
+            self._worker_pool.close()
+            self._worker_pool.join()
+            self._worker_pool = None
+            self._worker_pool_size = 0
+            self._worker_pool_finalizer = None
+
     def encode(self,
                text,
                text_pair=None,
@@ -346,6 +726,10 @@ class PretrainedTokenizerBase(SpecialTokensMixin):
                     if os.path.isfile(path):
                         read_vocab_file_dict[k] = path
 
+        compiled_vocab_path = os.path.join(name_or_path, COMPILED_VOCAB_NAME)
+        if read_vocab_file_dict and os.path.isfile(compiled_vocab_path):
+            read_vocab_file_dict['compiled_vocab_file'] = compiled_vocab_path
+
         for item in cls.FILE_LIST:
             path = os.path.join(name_or_path, item)
             if os.path.isfile(path):
@@ -354,23 +738,75 @@ class PretrainedTokenizerBase(SpecialTokensMixin):
                     "%s and %s", cls.__name__, name_or_path, read_vocab_file_dict, read_tokenizer_file_dict)
         return read_vocab_file_dict, read_tokenizer_file_dict
 
-    def _pad(self, id_dict, max_length, padding_strategy="do_not_pad"):
-        """Do padding according to the max_length"""
-        if not max_length or padding_strategy != "max_length":
+    @staticmethod
+    def _get_padded_length(lengths, max_length, padding_strategy, pad_to_multiple_of=None):
+        """Get the length which the sequences are padded to, None means no padding is needed"""
+        if padding_strategy == "max_length" and max_length:
+            padded_length = max_length
+        elif padding_strategy == "longest":
+            padded_length = max(lengths, default=0)
+        else:
+            return None
+        if pad_to_multiple_of:
+            padded_length = -(-padded_length // pad_to_multiple_of) * pad_to_multiple_of
+        return padded_length
+
+    def num_special_tokens_to_add(self, pair=False):
+        """Return the number of the special tokens added by build_inputs_with_special_tokens"""
+        token_ids_1 = [0] if pair else None
+        return len(self.build_inputs_with_special_tokens([0], token_ids_1)) - (2 if pair else 1)
+
+    def truncate_sequences(self, ids, pair_ids=None, max_length=None, add_special_tokens=True):
+        """
+        Truncate the ids and pair_ids, so that their length with the special tokens is no more than max_length.
+
+        The longer one of ids and pair_ids is truncated first, and they are truncated in turn once they have
+        the same length.
+        """
+        len_ids = len(ids)
+        len_pair_ids = len(pair_ids) if pair_ids else 0
+        num_special_tokens = self.num_special_tokens_to_add(pair=bool(pair_ids)) if add_special_tokens else 0
+        if not max_length or len_ids + len_pair_ids + num_special_tokens <= max_length:
+            return ids, pair_ids
+        budget = max_length - num_special_tokens
+        if budget <= 0:
+            raise ValueError(f"The max_length {max_length} is too small to keep the "
+                             f"{num_special_tokens} special tokens.")
+        num_removed = len_ids + len_pair_ids - budget
+        if not pair_ids:
+            return ids[:budget], pair_ids
+        num_removed_from_longer = min(num_removed, abs(len_ids - len_pair_ids))
+        if len_ids > len_pair_ids:
+            len_ids -= num_removed_from_longer
+        else:
+            len_pair_ids -= num_removed_from_longer
+        num_removed -= num_removed_from_longer
+        len_pair_ids -= (num_removed + 1) // 2
+        len_ids -= num_removed // 2
+        return ids[:len_ids], pair_ids[:len_pair_ids]
+
+    def _pad(self, id_dict, max_length, padding_strategy="do_not_pad", pad_to_multiple_of=None):
+        """Do padding according to the max_length or the longest sequence"""
+        if padding_strategy not in ("max_length", "longest"):
             return id_dict
         is_batch = False
         if isinstance(id_dict['input_ids'], list) and isinstance(id_dict['input_ids'][0], list):
             is_batch = True
+        rows = id_dict['input_ids'] if is_batch else [id_dict['input_ids']]
+        padded_length = self._get_padded_length([len(row) for row in rows], max_length,
+                                                padding_strategy, pad_to_multiple_of)
+        if padded_length is None:
+            return id_dict
 
         def _pad_batch(source_ids, pad_value):
             if not is_batch:
                 source_ids = [source_ids]
             for i in range(len(source_ids)):
-                if max_length < len(source_ids[i]):
+                if padding_strategy == "max_length" and max_length < len(source_ids[i]):
                     raise ValueError(f"The length of input_ids {len(source_ids[i])} "
                                      f"exceeds the max_length {max_length}, "
-                                     f"please increase the max_length.")
-                source_ids[i] += [pad_value] * (max_length - len(source_ids[i]))
+                                     f"please increase the max_length or set truncation to True.")
+                source_ids[i] += [pad_value] * (padded_length - len(source_ids[i]))
             if not is_batch:
                 source_ids = source_ids[0]
 
@@ -400,8 +836,8 @@ class PretrainedTokenizerBase(SpecialTokensMixin):
         def process_token_id(ids, par_ids=None):
             sentence_b_type_ids = []
             if par_ids:
-                sentence_b_type_ids = [1] * len(par_ids[0])
-            return [0] * len(ids[0]) + sentence_b_type_ids
+                sentence_b_type_ids = [1] * len(par_ids)
+            return [0] * len(ids) + sentence_b_type_ids
 
         if add_special_tokens:
             # add cls and sep: [cls] ids [seq] pair_ids
@@ -410,7 +846,7 @@ class PretrainedTokenizerBase(SpecialTokensMixin):
             # two 1 are for cls and sep
             attention_mask = [1] * (1 + 1 + len(ids) + (len(pair_ids) if pair_ids else 0))
         else:
-            input_ids_output = [ids + pair_ids] if pair_ids else ids
+            input_ids_output = ids + pair_ids if pair_ids else ids
             attention_mask = attention_mask = [1] * (len(ids) + (len(pair_ids) if pair_ids else 0))
             type_ids = process_token_id(ids, pair_ids)
 
@@ -421,11 +857,13 @@ class PretrainedTokenizerBase(SpecialTokensMixin):
             output_map['attention_mask'] = attention_mask
 
         output_map = self._pad(output_map, max_length=max_length, padding_strategy=padding_strategy)
-        if return_tensors and return_tensors != 'ms':
-            raise ValueError("You should set return_tensors to be `ms`.")
+        if return_tensors and return_tensors not in ('ms', 'np'):
+            raise ValueError("You should set return_tensors to be `ms` or `np`.")
         if return_tensors:
             for k, v in output_map.items():
-                output_map[k] = Tensor(v)
+                output_map[k] = np.array(v, dtype=np.int32)
+                if return_tensors == 'ms':
+                    output_map[k] = Tensor(output_map[k])
         return output_map
 
     def save_pretrained(self, save_directory=None, save_name="mindspore_model", file_format='json'):
@@ -475,12 +913,19 @@ class PretrainedTokenizerBase(SpecialTokensMixin):
         output_name = self.VOCAB_FILES['vocab_file']
         if isinstance(output_name, list):
             output_name = output_name[0]
-        self.save_vocabulary(save_directory, output_name)
+        vocab_file = self.save_vocabulary(save_directory, output_name)
+        self.save_compiled_vocabulary(os.path.join(save_directory, COMPILED_VOCAB_NAME), vocab_file)
 
     def save_vocabulary(self, save_directory, filename_prefix):
         """Save the vocabulary to the specific path with name_prefix"""
         raise NotImplementedError
 
+    def save_compiled_vocabulary(self, output_path, vocab_file):
+        """
+        Save the vocabulary as the compiled file which is loaded first by from_pretrained, the tokenizers
+        without the compiled format skip it.
+        """
+
 
 @MindFormerRegister.register(MindFormerModuleType.TOKENIZER)
 class PretrainedTokenizer(PretrainedTokenizerBase):
@@ -499,6 +944,83 @@ class PretrainedTokenizer(PretrainedTokenizerBase):
         """Convert the tokens to the string"""
         return " ".join(tokens).strip()
 
+    def decode(self, token_ids, skip_special_tokens=True, attention_mask=None):
+        """Convert a sequence of ids to the string, see batch_decode"""
+        if attention_mask is not None:
+            attention_mask = [attention_mask]
+        return self.batch_decode([token_ids], skip_special_tokens=skip_special_tokens,
+                                 attention_mask=attention_mask)[0]
+
+    def batch_decode(self, token_ids, skip_special_tokens=True, attention_mask=None):
+        """
+        Convert the batched ids to the strings.
+
+        The padding is removed by its position, as the pad token can be an ordinary token of the vocab, for
+        example `!` of the CLIP configs. It is the trailing run of the pad token of each row, or the positions
+        whose attention_mask is 0 if it is given, which should be used for the ids without the special tokens.
+
+        Args:
+            token_ids(list, numpy.ndarray, Tensor): The 2-D ids whose rows are padded to the same length.
+            skip_special_tokens(bool): Whether to remove the special tokens and the padding. Default True.
+            attention_mask(list, numpy.ndarray, Tensor): The mask of the same shape as token_ids, whose
+                padding is 0. Default None.
+
+        Returns:
+            A list of the strings, one for each row.
+        """
+        if isinstance(token_ids, Tensor):
+            token_ids = token_ids.asnumpy()
+        token_ids = np.asarray(token_ids)
+        if token_ids.ndim != 2 or not np.issubdtype(token_ids.dtype, np.integer):
+            raise ValueError(f"The token_ids should be the 2-D integer ids, but got the shape {token_ids.shape} "
+                             f"and the dtype {token_ids.dtype}.")
+        table = self._get_decode_table()
+        if token_ids.size and (token_ids.min() < 0 or token_ids.max() >= len(table)):
+            raise ValueError(f"The token_ids should be in the range [0, {len(table)}), but got the range "
+                             f"[{token_ids.min()}, {token_ids.max()}].")
+        tokens = table[token_ids]
+        if not skip_special_tokens:
+            return [self._decode_row(row.tolist()) for row in tokens]
+        keep_mask = ~np.isin(token_ids, self._get_control_token_ids()) & ~self._get_padding_mask(token_ids,
+                                                                                                 attention_mask)
+        return [self._decode_row(row[mask].tolist()) for row, mask in zip(tokens, keep_mask)]
+
+    def _get_control_token_ids(self):
+        """The ids of the special tokens removed by batch_decode, the pad token is removed by its position"""
+        tokens = {getattr(self, '_' + item) for item in self.SPECIAL_TOKENS if item != 'pad_token'} - {None}
+        return sorted({self._convert_tokens_to_ids(token) for token in tokens})
+
+    def _get_padding_mask(self, token_ids, attention_mask=None):
+        """Return the mask of the padding, the trailing pad tokens of the rows if attention_mask is None"""
+        if attention_mask is not None:
+            if isinstance(attention_mask, Tensor):
+                attention_mask = attention_mask.asnumpy()
+            attention_mask = np.asarray(attention_mask)
+            if attention_mask.shape != token_ids.shape:
+                raise ValueError(f"The attention_mask should have the shape {token_ids.shape} of the token_ids, "
+                                 f"but got {attention_mask.shape}.")
+            return attention_mask == 0
+        if self._pad_token is None:
+            return np.zeros(token_ids.shape, dtype=bool)
+        is_pad = token_ids == self.pad_token_id
+        return np.flip(np.cumprod(np.flip(is_pad, axis=1), axis=1), axis=1).astype(bool)
+
+    def _get_decode_table(self):
+        """Return the object array from the id to the entry of _build_decode_table, it is built once"""
+        if self._decode_table is None:
+            entries = self._build_decode_table()
+            self._decode_table = np.empty(len(entries), dtype=object)
+            self._decode_table[:] = entries
+        return self._decode_table
+
+    def _build_decode_table(self):
+        """Return the list of the tokens indexed by the id"""
+        raise NotImplementedError
+
+    def _decode_row(self, entries):
+        """Join the table entries of a row into the string"""
+        return self.convert_tokens_to_string(entries)
+
     def tokenize(self, text):
         raise NotImplementedError
 
@@ -522,14 +1044,17 @@ class PretrainedTokenizer(PretrainedTokenizerBase):
                            return_token_type_ids=None,
                            return_attention_mask=None,
                            return_batch=True,
+                           num_workers=None,
+                           pad_to_multiple_of=None,
+                           truncation=False,
                            **kwargs):
         """Convert the text into the converted id. text should be batched. For example, [["hello world"]]"""
         if not isinstance(text, list) and not isinstance(text[0], list):
             raise ValueError("For _batch_encode_plus, the input `text` should be batched, "
                              "for example: [['hello world']].")
 
-        text_ids = [self._get_token_ids(item) for item in text]
-        text_pair_ids = [self._get_token_ids(item) for item in text_pair] if text_pair else None
+        text_ids = self._batch_get_token_ids(text, num_workers=num_workers)
+        text_pair_ids = self._batch_get_token_ids(text_pair, num_workers=num_workers) if text_pair else None
         processed_output = self._batch_prepare_for_model(ids=text_ids,
                                                          pair_ids=text_pair_ids,
                                                          max_length=max_length,
@@ -538,7 +1063,9 @@ class PretrainedTokenizer(PretrainedTokenizerBase):
                                                          return_tensors=return_tensors,
                                                          return_token_type_ids=return_token_type_ids,
                                                          return_attention_mask=return_attention_mask,
-                                                         return_batch=return_batch)
+                                                         return_batch=return_batch,
+                                                         pad_to_multiple_of=pad_to_multiple_of,
+                                                         truncation=truncation)
         return processed_output
 
     def _batch_prepare_for_model(self, ids,
@@ -549,13 +1076,35 @@ class PretrainedTokenizer(PretrainedTokenizerBase):
                                  return_tensors=None,
                                  return_token_type_ids=None,
                                  return_attention_mask=None,
-                                 return_batch=True):
+                                 return_batch=True,
+                                 pad_to_multiple_of=None,
+                                 truncation=False):
         """Convert the input_ids to the format of model inputs"""
-        if return_tensors and return_tensors != 'ms':
-            raise ValueError("You should set return_tensors to be `ms`.")
+        if return_tensors and return_tensors not in ('ms', 'np'):
+            raise ValueError("You should set return_tensors to be `ms` or `np`.")
         if not return_batch and len(ids) != 1:
             raise ValueError(f"If `return_batch` is True, the length of input ids should be 1. But found {len(ids)}."
                              f"Input ids is: {ids}")
+        if truncation and max_length:
+            truncated = [self.truncate_sequences(per_ids, per_pair_ids, max_length=max_length,
+                                                 add_special_tokens=add_special_tokens)
+                         for per_ids, per_pair_ids in zip(ids, pair_ids if pair_ids else [None] * len(ids))]
+            ids = [item[0] for item in truncated]
+            pair_ids = [item[1] for item in truncated] if pair_ids else None
+        if return_tensors:
+            output_map = self._batch_prepare_for_model_np(ids=ids,
+                                                          pair_ids=pair_ids,
+                                                          add_special_tokens=add_special_tokens,
+                                                          max_length=max_length,
+                                                          padding_strategy=padding_strategy,
+                                                          return_token_type_ids=return_token_type_ids,
+                                                          return_attention_mask=return_attention_mask,
+                                                          return_batch=return_batch,
+                                                          pad_to_multiple_of=pad_to_multiple_of)
+            if return_tensors == 'ms':
+                for k in output_map.keys():
+                    output_map[k] = Tensor(output_map[k])
+            return output_map
         if pair_ids:
             paired_ids = zip(ids, pair_ids)
         else:
@@ -575,10 +1124,73 @@ class PretrainedTokenizer(PretrainedTokenizerBase):
             else:
                 for k, v in per_output.items():
                     output[k].append(v)
-        output_map = self._pad(output, max_length=max_length, padding_strategy=padding_strategy)
-        if return_tensors:
+        output_map = self._pad(output, max_length=max_length, padding_strategy=padding_strategy,
+                               pad_to_multiple_of=pad_to_multiple_of)
+        return output_map
+
+    def _batch_prepare_for_model_np(self, ids,
+                                    pair_ids=None,
+                                    add_special_tokens=True,
+                                    max_length=None,
+                                    padding_strategy="do_not_pad",
+                                    return_token_type_ids=None,
+                                    return_attention_mask=None,
+                                    return_batch=True,
+                                    pad_to_multiple_of=None):
+        """
+        Write the input_ids, attention_mask and token_type_ids into the preallocated int32 arrays.
+
+        The padding is filled when the arrays are allocated, so no padded lists are built for the rows.
+        """
+        batch_size = len(ids)
+        if not pair_ids:
+            pair_ids = [None] * batch_size
+        rows = []
+        for per_ids, per_pair_ids in zip(ids, pair_ids):
+            if add_special_tokens:
+                rows.append(self.build_inputs_with_special_tokens(per_ids, per_pair_ids))
+            else:
+                rows.append(per_ids + per_pair_ids if per_pair_ids else per_ids)
+        lengths = [len(row) for row in rows]
+        longest = max(lengths, default=0)
+
+        if max_length and padding_strategy == "max_length" and longest > max_length:
+            raise ValueError(f"The length of input_ids {longest} "
+                             f"exceeds the max_length {max_length}, "
+                             f"please increase the max_length or set truncation to True.")
+        seq_length = self._get_padded_length(lengths, max_length, padding_strategy, pad_to_multiple_of)
+        if seq_length is None:
+            if min(lengths, default=0) != longest:
+                raise ValueError("The input_ids of the batch have different lengths, please set padding to "
+                                 "`max_length` or `longest` to convert them into the tensors.")
+            seq_length = longest
+
+        output_map = dict()
+        input_ids = np.full((batch_size, seq_length), self.pad_token_id, dtype=np.int32)
+        output_map['input_ids'] = input_ids
+        token_type_ids = None
+        if return_token_type_ids or 'token_type_ids' in self.model_inputs:
+            token_type_ids = np.full((batch_size, seq_length), self.pad_token_type_id, dtype=np.int32)
+            output_map['token_type_ids'] = token_type_ids
+        attention_mask = None
+        if return_attention_mask or 'attention_mask' in self.model_inputs:
+            attention_mask = np.zeros((batch_size, seq_length), dtype=np.int32)
+            output_map['attention_mask'] = attention_mask
+
+        for i, (row, length, per_ids, per_pair_ids) in enumerate(zip(rows, lengths, ids, pair_ids)):
+            input_ids[i, :length] = row
+            if attention_mask is not None:
+                attention_mask[i, :length] = 1
+            if token_type_ids is not None:
+                token_type_ids[i, :length] = 0
+                if per_pair_ids and add_special_tokens:
+                    token_type_ids[i, :length] = self.create_token_type_ids_from_sequences(per_ids, per_pair_ids)
+                elif per_pair_ids:
+                    token_type_ids[i, len(per_ids):length] = 1
+
+        if not return_batch:
             for k in output_map.keys():
-                output_map[k] = Tensor(output_map[k])
+                output_map[k] = output_map[k][0]
         return output_map
 
     def _tokenize(self, text, **kwargs):
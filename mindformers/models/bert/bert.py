@@ -40,6 +40,9 @@ class BertForPretraining(BaseModel):
         is_training (bool): Specifies whether to use the training mode.
         use_one_hot_embeddings (bool): Specifies whether to use one-hot for embeddings. Default: False.
 
+    If `config.packed` is True, the inputs are the rows of BertSequencePacker: input_mask is the segment ids
+    of the packed examples, and position_ids, next_sentence_positions and next_sentence_weights are given.
+
     Returns:
         Tensor, the loss of the network.
     """
@@ -61,15 +64,20 @@ class BertForPretraining(BaseModel):
                   next_sentence_labels,
                   masked_lm_positions,
                   masked_lm_ids,
-                  masked_lm_weights):
+                  masked_lm_weights,
+                  position_ids=None,
+                  next_sentence_positions=None,
+                  next_sentence_weights=None):
         """Get pre-training loss"""
         if not self.is_training:
-            return self.bert(input_ids, input_mask, token_type_id, masked_lm_positions)
+            return self.bert(input_ids, input_mask, token_type_id, masked_lm_positions,
+                             position_ids, next_sentence_positions)
 
         prediction_scores, seq_relationship_score, moe_loss = \
-            self.bert(input_ids, input_mask, token_type_id, masked_lm_positions)
+            self.bert(input_ids, input_mask, token_type_id, masked_lm_positions,
+                      position_ids, next_sentence_positions)
         total_loss = self.loss(prediction_scores, seq_relationship_score,
-                               masked_lm_ids, masked_lm_weights, next_sentence_labels)
+                               masked_lm_ids, masked_lm_weights, next_sentence_labels, next_sentence_weights)
         if self.use_moe:
             total_loss = self.add(total_loss, moe_loss)
         return self.cast(total_loss, mstype.float32)
@@ -148,16 +156,20 @@ class BertModel(nn.Cell):
         self.slice = P.StridedSlice().shard(((1, 1, 1),))
 
         self.squeeze_1 = P.Squeeze(axis=1)
+        self.packed = config.packed
+        self.reshape = P.Reshape()
+        self.gather = P.Gather()
+        self.gather.shard(((1, 1), (1,)))
         self.dense = nn.Dense(self.hidden_size, self.hidden_size,
                               activation="tanh",
                               weight_init=TruncatedNormal(config.initializer_range)).to_float(config.compute_dtype)
         self.print = P.Print()
 
-    def construct(self, input_ids, token_type_ids, input_mask):
+    def construct(self, input_ids, token_type_ids, input_mask, position_ids=None, cls_positions=None):
         """Bidirectional Encoder Representations from Transformers."""
         # embedding
         word_embeddings, embedding_tables = self.word_embedding(input_ids)
-        embedding_output = self.embedding_postprocessor(token_type_ids, word_embeddings)
+        embedding_output = self.embedding_postprocessor(token_type_ids, word_embeddings, position_ids)
 
         # attention mask [batch_size, seq_length, seq_length](4, 1, 128) -> (4, 128, 128)
         input_mask = P.Cast()(input_mask, self.dtype)
@@ -167,11 +179,18 @@ class BertModel(nn.Cell):
         sequence_output = encoder_output[0]
         # pooler
         batch_size = P.Shape()(input_ids)[0]
-        sequence_slice = self.slice(sequence_output,
-                                    (0, 0, 0),
-                                    (batch_size, 1, self.hidden_size),
-                                    (1, 1, 1))
-        first_token = self.squeeze_1(sequence_slice)
+        if self.packed:
+            # the first token of each packed example, [batch_size * max_sequences_per_pack, hidden_size]
+            seq_length = P.Shape()(input_ids)[1]
+            flat_offsets = self.reshape(F.tuple_to_array(F.make_range(batch_size)) * seq_length, (-1, 1))
+            flat_positions = self.reshape(cls_positions + flat_offsets, (-1,))
+            first_token = self.gather(self.reshape(sequence_output, (-1, self.hidden_size)), flat_positions, 0)
+        else:
+            sequence_slice = self.slice(sequence_output,
+                                        (0, 0, 0),
+                                        (batch_size, 1, self.hidden_size),
+                                        (1, 1, 1))
+            first_token = self.squeeze_1(sequence_slice)
         pooled_output = self.dense(first_token)
         pooled_output = self.cast(pooled_output, self.dtype)
         moe_loss = 0
@@ -243,16 +262,17 @@ class EmbeddingPostprocessor(nn.Cell):
             ((config.parallel_config.data_parallel, 1, 1), (config.parallel_config.data_parallel, 1, 1)))
         self.slice = P.StridedSlice().shard(((1, 1),))
 
-    def construct(self, token_type_ids, word_embeddings):
+    def construct(self, token_type_ids, word_embeddings, position_ids=None):
         """Postprocessors apply positional and token type embeddings to word embeddings."""
         output = word_embeddings
         if self.use_token_type:
             token_type_embeddings, _ = self.token_type_embedding(token_type_ids)
             output = self.add(output, token_type_embeddings)
         if not self.use_relative_positions:
-            shape = F.shape(output)
-            shape_position = F.shape(self.position_ids)
-            position_ids = self.slice(self.position_ids, (0, 0), (shape_position[0], shape[1]), (1, 1))
+            if position_ids is None:
+                shape = F.shape(output)
+                shape_position = F.shape(self.position_ids)
+                position_ids = self.slice(self.position_ids, (0, 0), (shape_position[0], shape[1]), (1, 1))
             position_embeddings, _ = self.full_position_embedding(position_ids)
             output = self.add(output, position_embeddings)
         output = self.layernorm(output)
@@ -290,6 +310,9 @@ class CreateAttentionMaskFromInputMask(nn.Cell):
     """
     Create attention mask according to input mask.
 
+    If `config.packed` is True, input_mask is the segment ids of the packed examples, and a token attends
+    to the tokens of the same segment only, which is a block-diagonal mask.
+
     Args:
         config (Class): Configuration for BertModel.
     """
@@ -299,9 +322,18 @@ class CreateAttentionMaskFromInputMask(nn.Cell):
         self.cast = P.Cast()
         self.reshape = P.Reshape()
         self.tile = mindspore.ops.Tile().shard(((config.parallel_config.data_parallel, 1, 1),))
+        self.packed = config.packed
+        self.equal = P.Equal()
+        self.greater = P.Greater()
+        self.mul = P.Mul()
 
     def construct(self, input_mask):
         seq_length = F.shape(input_mask)[1]
+        if self.packed:
+            query_segments = self.reshape(input_mask, (-1, seq_length, 1))
+            key_segments = self.reshape(input_mask, (-1, 1, seq_length))
+            same_segment = self.cast(self.equal(query_segments, key_segments), mstype.float16)
+            return self.mul(same_segment, self.cast(self.greater(key_segments, 0.0), mstype.float16))
         attention_mask = self.cast(self.reshape(input_mask, (-1, 1, seq_length)), mstype.float16)
         attention_mask = self.tile(attention_mask, (1, seq_length, 1))
         return attention_mask
@@ -328,15 +360,15 @@ class BertScore(nn.Cell):
         self.is_training = is_training
 
     def construct(self, input_ids, input_mask, token_type_id,
-                  masked_lm_positions):
+                  masked_lm_positions, position_ids=None, next_sentence_positions=None):
         """connect backbone and heads."""
         moe_loss = 0
         if self.use_moe:
             sequence_output, pooled_output, embedding_table, moe_loss = \
-                self.bert(input_ids, token_type_id, input_mask)
+                self.bert(input_ids, token_type_id, input_mask, position_ids, next_sentence_positions)
         else:
             sequence_output, pooled_output, embedding_table = \
-                self.bert(input_ids, token_type_id, input_mask)
+                self.bert(input_ids, token_type_id, input_mask, position_ids, next_sentence_positions)
 
         if not self.is_training:
             return sequence_output, pooled_output
@@ -379,7 +411,7 @@ class BertLoss(nn.Cell):
         self.mul2 = P.Mul().shard(((config.parallel_config.data_parallel,), (config.parallel_config.data_parallel,)))
 
     def construct(self, prediction_scores, seq_relationship_score, masked_lm_ids,
-                  masked_lm_weights, next_sentence_labels):
+                  masked_lm_weights, next_sentence_labels, next_sentence_weights=None):
         """Defines the computation performed."""
         label_ids = self.reshape(masked_lm_ids, self.last_idx)
         label_weights = self.cast(self.reshape(masked_lm_weights, self.last_idx), mstype.float32)
@@ -395,7 +427,14 @@ class BertLoss(nn.Cell):
         one_hot_labels = self.onehot(labels, 2, self.on_value, self.off_value)
         per_example_loss = self.neg(self.reduce_sum1(
             self.mul(one_hot_labels, seq_relationship_score), self.last_idx))
-        next_sentence_loss = self.reduce_mean2(per_example_loss, self.last_idx)
+        if next_sentence_weights is None:
+            next_sentence_loss = self.reduce_mean2(per_example_loss, self.last_idx)
+        else:
+            # the empty slots of the packed rows are not counted
+            weights = self.cast(self.reshape(next_sentence_weights, self.last_idx), mstype.float32)
+            next_sentence_loss = self.div(self.reduce_sum(self.mul2(weights, per_example_loss), ()),
+                                          self.reduce_sum(weights, ()) +
+                                          self.cast(F.tuple_to_array((1e-5,)), mstype.float32))
         # total_loss
         total_loss = self.add(masked_lm_loss, next_sentence_loss)
 
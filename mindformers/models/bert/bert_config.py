@@ -53,6 +53,7 @@ class BertConfig:
     compute_dtype: mstype = mstype.float16
     use_past: bool = False
     use_moe: bool = False
+    packed: bool = False
     parallel_config: TransformerOpParallelConfig = default_transformer_config
     checkpoint_name_or_path: str = ""
     moe_config: MoEConfig = default_moe_config
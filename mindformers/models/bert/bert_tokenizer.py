@@ -17,9 +17,11 @@ import collections
 import json
 import os
 import unicodedata
+from functools import lru_cache
 
 from mindformers.tools.register import MindFormerRegister, MindFormerModuleType
 from mindformers.models.base_tokenizer import PretrainedTokenizer
+from mindformers.models.tokenizer_utils import LRUCache, SharedTokenTable, load_compiled_vocab, save_compiled_vocab
 
 __all__ = ['BertTokenizer']
 
@@ -153,11 +155,21 @@ class BasicTokenizer:
         self.do_lower_case = do_lower_case
 
     def _clean_and_tokenizer(self, text):
-        """Clean and tokenizer the text"""
-        text = self._clean_text(text)
-        text = self._tokenize_chinese_chars(text)
-        orig_tokens = whitespace_tokenize(text)
-        return orig_tokens
+        """Clean the text and add whitespace around the CJK characters in a single pass, then split it"""
+        table = _bmp_char_table()
+        output = []
+        for char in text:
+            cp = ord(char)
+            flags = table[cp] if cp < _BMP_SIZE else _astral_char_flags(cp)
+            if flags & _REMOVED:
+                continue
+            if flags & _WHITESPACE:
+                output.append(" ")
+            elif flags & _CHINESE:
+                output.append(" " + char + " ")
+            else:
+                output.append(char)
+        return whitespace_tokenize("".join(output))
 
     def tokenize(self, text):
         """
@@ -180,58 +192,96 @@ class BasicTokenizer:
 
     def _run_strip_accents(self, text):
         """Strips accents from a piece of text."""
+        if text.isascii():
+            return text
         text = unicodedata.normalize("NFD", text)
-        output = [char for char in text if unicodedata.category(char) != 'Mn']
+        output = [char for char in text if not _char_flags(char) & _NONSPACING_MARK]
         return "".join(output)
 
     def _run_split_on_punc(self, text):
         """Splits punctuation on a piece of text."""
-        start_new_word = True
+        table = _bmp_char_table()
         output = []
-        for char in text:
-            is_punctuated = _is_punctuation(char)
-            if not is_punctuated:
-                if start_new_word:
-                    output.append([])
-                    start_new_word = False
-                output[-1].append(char)
-            else:
-                output.append([char])
-                start_new_word = True
-        return ["".join(x) for x in output]
+        start = 0
+        for i, char in enumerate(text):
+            cp = ord(char)
+            flags = table[cp] if cp < _BMP_SIZE else _astral_char_flags(cp)
+            if flags & _PUNCTUATION:
+                if start < i:
+                    output.append(text[start:i])
+                output.append(char)
+                start = i + 1
+        if start < len(text):
+            output.append(text[start:])
+        return output
 
     def _clean_text(self, text):
         """Performs invalid character removal and whitespace cleanup on text."""
         output = []
-        filter_special = filter(lambda x: ord(x) not in (0, 0xfffd, _is_control(x)), text)
-        output = map(lambda char: " " if _is_whitespace(char) else char, filter_special)
-        return "".join(list(output))
+        for char in text:
+            flags = _char_flags(char)
+            if flags & _REMOVED:
+                continue
+            output.append(" " if flags & _WHITESPACE else char)
+        return "".join(output)
 
     def _tokenize_chinese_chars(self, text):
         """Adds whitespace around any CJK character."""
-        output = []
-        for char in text:
-            cp = ord(char)
-            is_chinese = self._is_chinese_char(cp)
-            if is_chinese:
-                output.append(" ")
-            output.append(char)
-            if is_chinese:
-                output.append(" ")
+        output = [" " + char + " " if _char_flags(char) & _CHINESE else char for char in text]
         return "".join(output)
 
     def _is_chinese_char(self, cp):
         """Checks whether CP is the codepoint of a CJK character."""
-        res = map(lambda item: item[0] <= cp <= item[1], self._CHINESE_SPACE)
-        return any(res)
+        return bool(_char_flags(chr(cp)) & _CHINESE)
 
 
 class WordpieceTokenizer:
     """
     Wordpiece tokenizer
+
+    The vocab is compiled into two prefix tries once, one for the pieces at the beginning of a word and one
+    for the `##` pieces, so that the longest piece is found by a single left-to-right walk. A SharedTokenTable
+    vocab keeps its prefix trie in the shared memory, the `##` pieces are walked from the node of `##`.
     """
     def __init__(self, vocab):
         self.vocab_dict = vocab
+        if isinstance(vocab, SharedTokenTable):
+            if not vocab.has_prefix_trie:
+                raise ValueError("WordpieceTokenizer needs a SharedTokenTable created with prefix_trie=True.")
+            self._word_trie, self._suffix_trie = None, None
+        else:
+            self._word_trie, self._suffix_trie = self._build_tries(vocab)
+
+    @staticmethod
+    def _build_tries(vocab):
+        """Build the tries of the vocab, the key None of a node marks the end of a piece"""
+        word_trie = {}
+        suffix_trie = {}
+
+        def _insert(trie, piece):
+            node = trie
+            for char in piece:
+                node = node.setdefault(char, {})
+            node[None] = True
+
+        for piece in vocab:
+            _insert(word_trie, piece)
+            if piece.startswith("##") and len(piece) > 2:
+                _insert(suffix_trie, piece[2:])
+        return word_trie, suffix_trie
+
+    @staticmethod
+    def _longest_match(trie, token, start):
+        """Return the end of the longest piece of token starting at start, start is returned if not found"""
+        node = trie
+        end = start
+        for i in range(start, len(token)):
+            node = node.get(token[i])
+            if node is None:
+                break
+            if None in node:
+                end = i + 1
+        return end
 
     def tokenize(self, tokens):
         """
@@ -245,24 +295,20 @@ class WordpieceTokenizer:
         output_tokens = []
         tokens = convert_to_unicode(tokens)
         for token in whitespace_tokenize(tokens):
-            chars = list(token)
-            len_chars = len(chars)
+            len_chars = len(token)
             start = 0
-            end = len_chars
+            trie = self._word_trie
             while start < len_chars:
-                while start < end:
-                    substr = "".join(token[start:end])
-                    if start != 0:
-                        substr = "##" + substr
-                    if substr in self.vocab_dict:
-                        output_tokens.append(substr)
-                        start = end
-                        end = len_chars
-                    else:
-                        end = end - 1
-                if start == end and start != len_chars:
+                if trie is None:
+                    end = self.vocab_dict.longest_match(token, start, "" if start == 0 else "##")
+                else:
+                    end = self._longest_match(trie, token, start)
+                if end == start:
                     output_tokens.append("[UNK]")
                     break
+                output_tokens.append(token[start:end] if start == 0 else "##" + token[start:end])
+                start = end
+                trie = self._suffix_trie
         return output_tokens
 
 
@@ -302,10 +348,60 @@ def _is_punctuation(char):
         return True
     return False
 
+# The bits of the character classes used by the BasicTokenizer.
+_REMOVED = 1
+_WHITESPACE = 2
+_CHINESE = 4
+_PUNCTUATION = 8
+_NONSPACING_MARK = 16
+_BMP_SIZE = 0x10000
+
+
+def _classify_char(char):
+    """Compute the character class bits of `char`."""
+    cp = ord(char)
+    flags = 0
+    if cp in (0, 0xfffd, _is_control(char)):
+        flags |= _REMOVED
+    if _is_whitespace(char):
+        flags |= _WHITESPACE
+    if any(start <= cp <= end for start, end in BasicTokenizer._CHINESE_SPACE):
+        flags |= _CHINESE
+    if _is_punctuation(char):
+        flags |= _PUNCTUATION
+    if unicodedata.category(char) == 'Mn':
+        flags |= _NONSPACING_MARK
+    return flags
+
+
+@lru_cache()
+def _bmp_char_table():
+    """The dense table of the character class bits for the Basic Multilingual Plane, built once per process."""
+    return bytearray(_classify_char(chr(cp)) for cp in range(_BMP_SIZE))
+
+
+@lru_cache(maxsize=65536)
+def _astral_char_flags(cp):
+    """The character class bits of the code points out of the Basic Multilingual Plane."""
+    return _classify_char(chr(cp))
+
+
+def _char_flags(char):
+    """Lookup the character class bits of `char`."""
+    cp = ord(char)
+    if cp < _BMP_SIZE:
+        return _bmp_char_table()[cp]
+    return _astral_char_flags(cp)
+
+
 @MindFormerRegister.register(MindFormerModuleType.TOKENIZER)
 class BertTokenizer(PretrainedTokenizer):
     """
         Bert Tokenizer.
+
+        The wordpiece tokens and ids of the basic tokens are kept in a bounded word cache of `cache_size`
+        entries, so the frequent words are split once. None means the cache is unbounded and 0 disables it,
+        see `cache_info` for the hit rate.
     """
     VOCAB_FILES = {'vocab_file': 'vocab.txt'}
     FILE_LIST = ['tokenizer_config.json', 'special_tokens_map.json']
@@ -318,6 +414,9 @@ class BertTokenizer(PretrainedTokenizer):
                  pad_token="[PAD]",
                  cls_token="[CLS]",
                  mask_token="[MASK]",
+                 compiled_vocab_file=None,
+                 share_tables=False,
+                 cache_size=100000,
                  **kwargs):
         super(BertTokenizer, self).__init__(do_lower_case=do_lower_case,
                                             do_basic_tokenize=do_basic_tokenize,
@@ -326,15 +425,36 @@ class BertTokenizer(PretrainedTokenizer):
                                             pad_token=pad_token,
                                             cls_token=cls_token,
                                             mask_token=mask_token,
+                                            cache_size=cache_size,
                                             **kwargs)
         self.do_lower_case = do_lower_case
         self.do_basic_tokenize = do_basic_tokenize
         if do_basic_tokenize:
             self.basic_tokenizer = BasicTokenizer(do_lower_case=do_lower_case)
 
-        self.vocab_dict = vocab_to_dict_key_token(vocab_file)
+        compiled_vocab = load_compiled_vocab(compiled_vocab_file, vocab_file)
+        if compiled_vocab:
+            tokens, ids, _ = compiled_vocab
+            self.vocab_dict = collections.OrderedDict(zip(tokens, ids.tolist()))
+        else:
+            self.vocab_dict = vocab_to_dict_key_token(vocab_file)
         self.vocab_id2token = {v: k for k, v in self.vocab_dict.items()}
         self.word_piece_tokenizer = WordpieceTokenizer(vocab=self.vocab_dict)
+        self.word_cache = LRUCache(cache_size)
+        if share_tables:
+            self.share_tables()
+
+    def share_tables(self):
+        """
+        Publish the vocab into the read-only shared memory once, the dataset workers attach to it instead
+        of copying the vocab dicts and the wordpiece tries.
+        """
+        if isinstance(self.vocab_dict, SharedTokenTable):
+            return
+        self.vocab_dict = SharedTokenTable.create(self.vocab_dict.items(), prefix_trie=True)
+        self.vocab_id2token = self.vocab_dict.inverse()
+        self.word_piece_tokenizer = WordpieceTokenizer(vocab=self.vocab_dict)
+        self.word_cache.clear()
 
     def build_inputs_with_special_tokens(self, token_ids_0, token_ids_1=None):
         if token_ids_1:
@@ -349,14 +469,49 @@ class BertTokenizer(PretrainedTokenizer):
 
     def _tokenize(self, text, **kwargs):
         tokens_ret = []
+        for word in self._split_words(text):
+            tokens_ret.extend(self._tokenize_word(word)[0])
+        return tokens_ret
+
+    def _get_token_ids(self, text):
+        """Get the token_ids from the ids of the cached words, the tokens are not converted again"""
+        if not isinstance(text, str):
+            return super(BertTokenizer, self)._get_token_ids(text)
+        output = []
+        for word in self._split_words(text):
+            tokens, ids = self._tokenize_word(word)
+            output.extend(ids if ids is not None else self._convert_tokens_to_ids(tokens))
+        return output
+
+    def _split_words(self, text):
+        """Split the text into the words of the wordpiece tokenizer"""
         text = convert_to_unicode(text)
         if self.do_basic_tokenize:
-            for tokens in self.basic_tokenizer.tokenize(text):
-                wordpiece_tokens = self.word_piece_tokenizer.tokenize(tokens)
-                tokens_ret.extend(wordpiece_tokens)
-        else:
-            tokens_ret = self.word_piece_tokenizer.tokenize(text)
-        return tokens_ret
+            return self.basic_tokenizer.tokenize(text)
+        return whitespace_tokenize(text)
+
+    def _tokenize_word(self, word):
+        """
+        Return the wordpiece tokens and ids of a word, the ids are None if a token is not in the vocab.
+        The results are kept in the word cache.
+        """
+        cached = self.word_cache.get(word)
+        if cached is not None:
+            return cached
+        tokens = tuple(self.word_piece_tokenizer.tokenize(word))
+        ids = tuple(self.vocab_dict.get(token) for token in tokens)
+        cached = (tokens, None if None in ids else ids)
+        self.word_cache.put(word, cached)
+        return cached
+
+    def _token_text(self, token):
+        if token == self.unk_token:
+            return ""
+        return token[2:] if token.startswith("##") else token
+
+    def cache_info(self):
+        """Return the hits, misses and evictions of the word cache"""
+        return self.word_cache.stats()
 
     def _convert_tokens_to_ids(self, tokens):
         if isinstance(tokens, str):
@@ -372,6 +527,13 @@ class BertTokenizer(PretrainedTokenizer):
             output.append(self.vocab_id2token[item])
         return output
 
+    def convert_tokens_to_string(self, tokens):
+        """Join the tokens and merge the `##` pieces into the words"""
+        return " ".join(tokens).replace(" ##", "").strip()
+
+    def _build_decode_table(self):
+        return [self.vocab_id2token.get(index, "[UNK]") for index in range(max(self.vocab_id2token) + 1)]
+
     def save_vocabulary(self, save_directory, filename_prefix):
         """write the word to the files"""
         output_file_path = os.path.join(save_directory, filename_prefix)
@@ -379,3 +541,7 @@ class BertTokenizer(PretrainedTokenizer):
             for k in self.vocab_dict.keys():
                 fp.write(k + '\n')
         return output_file_path
+
+    def save_compiled_vocabulary(self, output_path, vocab_file):
+        return save_compiled_vocab(output_path, vocab_file, list(self.vocab_dict.keys()),
+                                   ids=list(self.vocab_dict.values()))
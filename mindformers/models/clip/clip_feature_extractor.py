@@ -23,8 +23,8 @@ import mindspore as ms
 
 from mindformers.mindformer_book import MindFormerBook
 from mindformers.dataset import (
-    BCHW2BHWC, BatchResize, BatchToTensor,
-    BatchNormalize, BatchCenterCrop, BatchPILize
+    BCHW2BHWC, BatchResize, ToTensorNormalize,
+    BatchCenterCrop, BatchPILize
 )
 from ..base_feature_extractor import BaseImageFeatureExtractor, BaseFeatureExtractor
 from ...tools.register import MindFormerRegister, MindFormerModuleType
@@ -47,8 +47,7 @@ class ClipImageFeatureExtractor(BaseImageFeatureExtractor):
         self.batch_pilizer = BatchPILize()
         self.batch_resizer = BatchResize(image_resolution)
         self.batch_crop = BatchCenterCrop(image_resolution)
-        self.batch_totensor = BatchToTensor()
-        self.batch_normalizer = BatchNormalize()
+        self.batch_totensor_normalizer = ToTensorNormalize()
 
     def preprocess(self, images, **kwargs):
         """
@@ -65,12 +64,9 @@ class ClipImageFeatureExtractor(BaseImageFeatureExtractor):
         images = self.batch_pilizer(images)
         images = self.batch_resizer(images)
         images = self.batch_crop(images)
-        images = self.batch_totensor(images)
-        images = self.batch_normalizer(images)
+        images = self.batch_totensor_normalizer(images)
 
         kwargs.pop("other", None)
-        if isinstance(images, list):
-            return ms.Tensor(np.row_stack([np.expand_dims(item, axis=0) for item in images]))
         if len(images.shape) == 4:
             return ms.Tensor(images)
         return ms.Tensor(np.expand_dims(images, axis=0))
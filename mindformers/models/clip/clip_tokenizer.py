@@ -17,6 +17,7 @@
 This is a temporary version of clip tokenizer
 """
 import gzip
+import heapq
 import html
 import os
 import shutil
@@ -29,6 +30,7 @@ from ...mindformer_book import MindFormerBook
 from ...tools.register import MindFormerRegister, MindFormerModuleType
 from ...tools.download_tools import downlond_with_progress_bar
 from ..base_tokenizer import PretrainedTokenizer
+from ..tokenizer_utils import LRUCache, SharedTokenTable, load_compiled_vocab, save_compiled_vocab
 
 @lru_cache()
 def default_bpe():
@@ -65,38 +67,86 @@ def bytes_to_unicode():
     output_cd = [chr(item) for item in output_cd]
     return dict(zip(input_bt, output_cd))
 
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+# str.split treats these ASCII separators as the whitespace while \s does not
+_ASCII_SEPARATOR_PATTERN = re.compile(r'[\x1c-\x1f]')
+# the characters out of the printable ASCII, the tab and the newline, and the `&` of the html entities
+_NEED_REPAIR_PATTERN = re.compile(r'[^\x20-\x25\x27-\x7e\t\n]')
+
 def whitespace_clean(input_text):
     """whitespace clean"""
-    input_text = re.sub(r'\s+', ' ', input_text)
+    if input_text.isascii() and not _ASCII_SEPARATOR_PATTERN.search(input_text):
+        return " ".join(input_text.split())
+    input_text = _WHITESPACE_PATTERN.sub(' ', input_text)
     input_text = input_text.strip()
     return input_text
 
 def basic_clean(input_text):
-    """basic_clean"""
+    """basic_clean, the texts which ftfy and html.unescape leave unchanged are only stripped"""
+    if input_text.isascii() and not _NEED_REPAIR_PATTERN.search(input_text):
+        return input_text.strip()
     input_text = ftfy.fix_text(input_text)
     input_text = html.unescape(html.unescape(input_text))
     return input_text.strip()
 
+class _SharedMergeRanks:
+    """The bpe ranks kept in a SharedTokenTable, a merge is keyed by its two tokens joined by a space"""
+    def __init__(self, table):
+        self.table = table
+
+    def get(self, pair, default=None):
+        return self.table.get(pair[0] + ' ' + pair[1], default)
+
+    def __contains__(self, pair):
+        return pair[0] + ' ' + pair[1] in self.table
+
+    def __len__(self):
+        return len(self.table)
+
+
 class TempTokenizer:
     """Simple Tokenizer"""
-    def __init__(self, merges, vocab, flag_dict):
+    BPE_ENGINES = ("heap", "naive")
+
+    def __init__(self, merges, vocab, flag_dict, bpe_engine="heap", cache_size=None):
+        if bpe_engine not in self.BPE_ENGINES:
+            raise ValueError(f"bpe_engine should be one of {self.BPE_ENGINES}, but got {bpe_engine}.")
         self.byte_encoder = bytes_to_unicode()
         self.byte_decoder = {v: k for k, v in self.byte_encoder.items()}
         self.bpe_ranks = dict(zip(merges, range(len(merges))))
-        self.flag_dict = flag_dict
+        # the entries in flag_dict are the special tokens, they are pinned in the cache
+        self.cache = LRUCache(cache_size, pinned=flag_dict)
         self.encoder = dict(zip(vocab, range(len(vocab))))
         self.decoder = {v: k for k, v in self.encoder.items()}
+        self.bpe_engine = bpe_engine
+        self._merge_fn = self._merge_heap if bpe_engine == "heap" else self._merge_naive
+
+    def share_tables(self):
+        """Move the encoder, the decoder and the bpe ranks into the shared memory"""
+        if isinstance(self.encoder, SharedTokenTable):
+            return
+        self.encoder = SharedTokenTable.create(self.encoder.items())
+        self.decoder = self.encoder.inverse()
+        self.bpe_ranks = _SharedMergeRanks(SharedTokenTable.create(
+            (' '.join(pair), rank) for pair, rank in self.bpe_ranks.items()))
 
     def tokenize_alg(self, input_tk):
         """bpe"""
-        if input_tk in self.flag_dict:
-            return self.flag_dict[input_tk]
+        cached = self.cache.get(input_tk)
+        if cached is not None:
+            return cached
         word = tuple(input_tk[:-1]) + (input_tk[-1] + '</w>',)
-        pairs = get_pairs(word)
 
-        if not pairs:
+        if len(word) < 2:
             return input_tk+'</w>'
 
+        word = ' '.join(self._merge_fn(word))
+        self.cache.put(input_tk, word)
+        return word
+
+    def _merge_naive(self, word):
+        """Merge the lowest ranked pair of the whole word per iteration, O(n^2) in the word length."""
+        pairs = get_pairs(word)
         while True:
             bigram = min(pairs, key=lambda pair: self.bpe_ranks.get(pair, float('inf')))
             if bigram not in self.bpe_ranks:
@@ -124,10 +174,58 @@ class TempTokenizer:
             if len(word) == 1:
                 break
             pairs = get_pairs(word)
-        word = ' '.join(word)
-        self.flag_dict[input_tk] = word
         return word
 
+    def _merge_heap(self, word):
+        """
+        Merge the pairs on a doubly linked list of symbols with a heap of (rank, position).
+
+        All occurrences of the lowest ranked pair are popped and merged from left to right before
+        any newly formed pair is pushed, so the output is identical to `_merge_naive`.
+        """
+        symbols = list(word)
+        length = len(symbols)
+        prev_pos = list(range(-1, length - 1))
+        next_pos = list(range(1, length + 1))
+        next_pos[-1] = -1
+        ranks = self.bpe_ranks
+        heap = []
+        for pos in range(length - 1):
+            rank = ranks.get((symbols[pos], symbols[pos + 1]))
+            if rank is not None:
+                heap.append((rank, pos))
+        heapq.heapify(heap)
+
+        while heap:
+            rank, pos = heapq.heappop(heap)
+            positions = [pos]
+            while heap and heap[0][0] == rank:
+                positions.append(heapq.heappop(heap)[1])
+
+            merged = []
+            for pos in positions:
+                right = next_pos[pos]
+                if symbols[pos] is None or right == -1 or ranks.get((symbols[pos], symbols[right])) != rank:
+                    continue
+                symbols[pos] += symbols[right]
+                symbols[right] = None
+                next_pos[pos] = next_pos[right]
+                if next_pos[pos] != -1:
+                    prev_pos[next_pos[pos]] = pos
+                merged.append(pos)
+
+            for pos in merged:
+                left, right = prev_pos[pos], next_pos[pos]
+                if left != -1:
+                    left_rank = ranks.get((symbols[left], symbols[pos]))
+                    if left_rank is not None:
+                        heapq.heappush(heap, (left_rank, left))
+                if right != -1:
+                    right_rank = ranks.get((symbols[pos], symbols[right]))
+                    if right_rank is not None:
+                        heapq.heappush(heap, (right_rank, pos))
+        return tuple(symbol for symbol in symbols if symbol is not None)
+
     def decode(self, input_ids):
         """decode"""
         output_text = ''.join([self.decoder[input_id] for input_id in input_ids])
@@ -157,23 +255,53 @@ class ClipTokenizer(PretrainedTokenizer):
                  eos_token="<|endoftext|>",
                  bos_token="<|startoftext|>",
                  pad_token="<|endoftext|>",
-                 unk_token="<|endoftext|>"):
+                 unk_token="<|endoftext|>",
+                 bpe_engine="heap",
+                 cache_size=100000,
+                 num_workers=1,
+                 encode_cache_size=None,
+                 compiled_vocab_file=None,
+                 share_tables=False):
         super(ClipTokenizer, self).__init__(eos_token=eos_token,
                                             bos_token=bos_token,
                                             pad_token=pad_token,
-                                            unk_token=unk_token)
+                                            unk_token=unk_token,
+                                            bpe_engine=bpe_engine,
+                                            cache_size=cache_size,
+                                            num_workers=num_workers,
+                                            encode_cache_size=encode_cache_size)
         self.path = vocab_file
-        merges = self._read_merge_files(vocab_file)
-        vocab = list(bytes_to_unicode().values())
-        vocab = vocab + [v + '</w>' for v in vocab]
-        for merge in merges:
-            vocab.append(''.join(merge))
-        vocab.extend([bos_token, eos_token])
+        compiled_vocab = load_compiled_vocab(compiled_vocab_file, vocab_file)
+        if compiled_vocab and compiled_vocab[0][-2:] == [bos_token, eos_token]:
+            vocab, _, merges = compiled_vocab
+        else:
+            merges = self._read_merge_files(vocab_file)
+            vocab = list(bytes_to_unicode().values())
+            vocab = vocab + [v + '</w>' for v in vocab]
+            for merge in merges:
+                vocab.append(''.join(merge))
+            vocab.extend([bos_token, eos_token])
+        self._vocab = vocab
+        self._merges = merges
 
         flag_dict = {bos_token: bos_token, eos_token: eos_token}
-        self.tool = TempTokenizer(merges, vocab, flag_dict)
+        self.tool = TempTokenizer(merges, vocab, flag_dict, bpe_engine=bpe_engine, cache_size=cache_size)
         self.pat = re.compile(r"""<\|startoftext\|>|<\|endoftext\|>|'s|'t|'re|
         've|'m|'ll|'d|[\p{L}]+|[\p{N}]|[^\s\p{L}\p{N}]+""", re.IGNORECASE)
+        if share_tables:
+            self.share_tables()
+
+    def share_tables(self):
+        """
+        Publish the encoder, the decoder and the bpe ranks into the read-only shared memory once.
+
+        The dataset workers unpickling the tokenizer attach to the shared memory instead of copying the
+        tables, and the forked workers do not touch the pages of the python dicts, which are released.
+        The lookups are slower than the dicts, the bpe word cache keeps the hot words in each worker.
+        """
+        self.tool.share_tables()
+        self._vocab = None
+        self._merges = None
 
 
     @staticmethod
@@ -196,6 +324,24 @@ class ClipTokenizer(PretrainedTokenizer):
             output_ids.extend(self.tool.tokenize_alg(token).split(' '))
         return output_ids
 
+    def _build_decode_table(self):
+        """The entries are the utf-8 bytes of the tokens, so a row is joined and decoded only once"""
+        byte_decoder = self.tool.byte_decoder
+        return [bytes(byte_decoder[char] for char in self.tool.decoder[index])
+                for index in range(len(self.tool.decoder))]
+
+    def _decode_row(self, entries):
+        return b''.join(entries).decode('utf-8', errors="replace").replace('</w>', ' ').strip()
+
+    def _token_text(self, token):
+        """The token is decoded from the utf-8 bytes, a part of a multi-byte character is an empty str"""
+        byte_decoder = self.tool.byte_decoder
+        return bytes(byte_decoder[char] for char in token.replace('</w>', '')).decode('utf-8', errors="ignore")
+
+    def cache_info(self):
+        """Return the hits, misses and evictions of the bpe word cache"""
+        return self.tool.cache.stats()
+
     def build_inputs_with_special_tokens(self, token_ids_0, token_ids_1=None):
         """
         Insert the special tokens to the input_ids. Currently, we support token_ids_0 is a list of ids.
@@ -214,6 +360,14 @@ class ClipTokenizer(PretrainedTokenizer):
         shutil.copy(self.path, output_file_path)
         return output_file_path
 
+    def save_compiled_vocabulary(self, output_path, vocab_file):
+        vocab, merges = self._vocab, self._merges
+        if vocab is None:
+            vocab = list(self.tool.encoder)
+            ranks = self.tool.bpe_ranks.table
+            merges = [tuple(merge.split(' ')) for merge in sorted(ranks, key=ranks.get)]
+        return save_compiled_vocab(output_path, vocab_file, vocab, merges=merges)
+
     def tokenize(self, text):
         """Tokenizer the input_text"""
         if not isinstance(text, str):
@@ -1564,6 +1564,9 @@ class T5Model(BaseModel):
         config (Class): Configuration for T5Model.
         is_training (bool): True for training mode. False for eval mode.
         use_one_hot_embeddings (bool): Specifies whether to use one hot encoding form. Default: False.
+
+    If `config.packed` is True, source_mask and target_mask are the segment ids of the packed examples
+    and the attention masks are block-diagonal, so the examples of a row do not attend to each other.
     """
 
     def __init__(self,
@@ -1632,6 +1635,9 @@ class T5Model(BaseModel):
         self.encoder_layernorm.shard(((config.parallel_config.data_parallel, 1),))
         self.decoder_layernorm.shard(((config.parallel_config.data_parallel, 1),))
         self._create_attention_mask_from_input_mask = CreateAttentionMaskFromInputMask(config.parallel_config)
+        self.packed = config.packed
+        self.equal = ops.Equal()
+        self.greater = ops.Greater()
 
     def construct(self, source_ids=None, source_mask=None, target_ids=None, target_mask=None, memory_mask=None,
                   encoder_cache=None):
@@ -1650,9 +1656,16 @@ class T5Model(BaseModel):
         tgt_length = self.shape(target_ids)[1]
 
         if memory_mask is None:
-            memory_mask = self.create_memory_mask(source_mask, target_mask)
+            if self.packed:
+                memory_mask = self.create_packed_mask(target_mask, source_mask)
+            else:
+                memory_mask = self.create_memory_mask(source_mask, target_mask)
 
-        if len(ops.shape(target_mask)) == 2:
+        if self.packed:
+            future_mask = convert_np_to_tensor_encoder(tgt_length)
+            tgt_attention_mask = self.multiply(self.create_packed_mask(target_mask, target_mask),
+                                               self.expand(future_mask, 0))
+        elif len(ops.shape(target_mask)) == 2:
             future_mask = convert_np_to_tensor_encoder(tgt_length)
             tgt_attention_mask = self._create_attention_mask_from_input_mask(target_mask)
             tgt_attention_mask = self.multiply(tgt_attention_mask, self.expand(future_mask, 0))
@@ -1677,7 +1690,9 @@ class T5Model(BaseModel):
         # process source sentence
         src_embedding_output, _ = self.tfm_embedding_lookup(source_ids)
         # attention mask [batch_size, seq_length, seq_length]
-        if len(F.shape(source_mask)) == 2:
+        if self.packed:
+            enc_attention_mask = self.create_packed_mask(source_mask, source_mask)
+        elif len(F.shape(source_mask)) == 2:
             enc_attention_mask = self._create_attention_mask_from_input_mask(source_mask)
         else:
             enc_attention_mask = source_mask
@@ -1695,6 +1710,12 @@ class T5Model(BaseModel):
         memory_mask = memory_mask * F.expand_dims(target_mask, 2)
         return memory_mask
 
+    def create_packed_mask(self, query_segments, key_segments):
+        """The block-diagonal mask of the segment ids, the padding keys of segment 0 are masked"""
+        same_segment = self.equal(F.expand_dims(query_segments, 2), F.expand_dims(key_segments, 1))
+        valid_key = self.greater(F.expand_dims(key_segments, 1), 0)
+        return self.cast(same_segment, mstype.float32) * self.cast(valid_key, mstype.float32)
+
 
 @MindFormerRegister.register(MindFormerModuleType.MODELS)
 class T5ModelForGeneration(BaseModel):
@@ -1712,6 +1733,7 @@ class T5ModelForGeneration(BaseModel):
         super(T5ModelForGeneration, self).__init__(model_config)
         parallel_config = model_config.parallel_config
         self.t5_model = T5Model(config=model_config)
+        self.packed = model_config.packed
         self.loss = CrossEntropyLoss(parallel_config=parallel_config.dp_mp_config)
         self.cast = ops.Cast()
         self.shape = ops.Shape()
@@ -1752,11 +1774,18 @@ class T5ModelForGeneration(BaseModel):
             target_mask = F.cast(labels != 0, mstype.float32)
 
         decoder_inputs = self._add_start_to_inputs(target_ids[:, :-1])
+        label_weights = target_mask
+        if self.packed:
+            # each packed example starts from the start token instead of the last token of the previous one
+            target_segments = self.cast(target_mask, mstype.int32)
+            previous_segments = self._add_start_to_inputs(target_segments[:, :-1])
+            decoder_inputs = decoder_inputs * self.cast(previous_segments == target_segments, mstype.int32)
+            label_weights = F.cast(target_mask > 0, mstype.float32)
 
         logits = self.t5_model(source_ids, source_mask, decoder_inputs, target_mask, memory_mask)
 
         label_ids = ops.Reshape()(labels, (-1,))
-        label_weights = ops.Reshape()(target_mask, (-1,))
+        label_weights = ops.Reshape()(label_weights, (-1,))
         total_loss = self.loss(logits, label_ids, self.cast(label_weights, mstype.float32))
         return total_loss
 
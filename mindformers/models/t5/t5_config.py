@@ -46,6 +46,7 @@ class T5Config(BaseConfig):
                  compute_dtype: mindspore.common.dtype = mstype.float32,
                  has_relative_bias: bool = True,
                  scale_output: bool = True,
+                 packed: bool = False,
                  parallel_config: TransformerOpParallelConfig = default_transformer_config,
                  **kwargs):
         """Transformer Config"""
@@ -69,5 +70,6 @@ class T5Config(BaseConfig):
         self.compute_dtype = compute_dtype
         self.has_relative_bias = has_relative_bias
         self.scale_output = scale_output
+        self.packed = packed
         self.parallel_config = parallel_config
         super(T5Config, self).__init__(**kwargs)
@@ -0,0 +1,578 @@
+# Copyright 2022 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+"""Utils shared by the tokenizers"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
+from collections.abc import Mapping
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from ..tools.logger import logger
+
+__all__ = ['LRUCache', 'SharedTokenTable', 'save_compiled_vocab', 'load_compiled_vocab']
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    A bounded cache which evicts the least recently used entry when it is full.
+
+    Args:
+        capacity(int): The max number of the evictable entries. None means the cache is unbounded
+            and 0 disables the cache. Default None.
+        pinned(dict): The entries which are always hit and never evicted, for example the special tokens.
+            They are not counted in the capacity. Default None.
+        thread_safe(bool): Whether to guard the entries and the counters with a lock, so the cache can be
+            shared by the threads. Default False.
+    """
+    def __init__(self, capacity=None, pinned=None, thread_safe=False):
+        if capacity is not None and (not isinstance(capacity, int) or capacity < 0):
+            raise ValueError(f"The capacity of the cache should be None or a non-negative int, but got {capacity}.")
+        self.capacity = capacity
+        self.pinned = dict(pinned) if pinned else {}
+        self.thread_safe = thread_safe
+        self._lock = threading.Lock() if thread_safe else None
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock() if self.thread_safe else None
+
+    def get(self, key, default=None):
+        """Return the value of the key and mark it as the most recently used one"""
+        if self._lock is None:
+            return self._get(key, default)
+        with self._lock:
+            return self._get(key, default)
+
+    def _get(self, key, default):
+        if key in self.pinned:
+            self.hits += 1
+            return self.pinned[key]
+        value = self._data.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            # evicted by another thread of an unlocked cache after the lookup
+            pass
+        return value
+
+    def put(self, key, value):
+        """Insert the key, the least recently used entry is evicted if the cache is full"""
+        if key in self.pinned or self.capacity == 0:
+            return
+        if self._lock is None:
+            self._put(key, value)
+            return
+        with self._lock:
+            self._put(key, value)
+
+    def _put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.capacity is not None and len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Remove the evictable entries and reset the counters"""
+        if self._lock is None:
+            self._clear()
+            return
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Return the counters of the cache"""
+        if self._lock is None:
+            hits, misses, evictions, size = self.hits, self.misses, self.evictions, len(self._data)
+        else:
+            with self._lock:
+                hits, misses, evictions, size = self.hits, self.misses, self.evictions, len(self._data)
+        total = hits + misses
+        return {'hits': hits,
+                'misses': misses,
+                'evictions': evictions,
+                'size': size,
+                'capacity': self.capacity,
+                'hit_rate': hits / total if total else 0.0}
+
+    def __contains__(self, key):
+        return key in self.pinned or key in self._data
+
+    def __len__(self):
+        return len(self.pinned) + len(self._data)
+
+
+COMPILED_VOCAB_NAME = 'tokenizer_compiled.bin'
+COMPILED_VOCAB_VERSION = 2
+_COMPILED_VOCAB_MAGIC = b'MFTK'
+# magic, version, sha256, size and mtime in nanoseconds of the source vocab file, number of tokens, number of
+# merges. It is followed by the uint32 ids, the uint32 offsets of the tokens, the newline terminated utf-8
+# tokens and the uint32 pairs of the token positions of the merges.
+_COMPILED_VOCAB_HEADER = struct.Struct('<4sI32sQQII')
+
+
+def file_digest(path):
+    """Return the sha256 digest of the file"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.digest()
+
+
+def _pack_strings(strings):
+    """Pack the strings into the uint32 byte offsets and the newline terminated utf-8 bytes"""
+    encoded = [item.encode('utf-8') + b'\n' for item in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return offsets, b''.join(encoded)
+
+
+def save_compiled_vocab(path, source_file, tokens, ids=None, merges=None):
+    """
+    Write the vocab and the merges into a compiled file, which can be memory mapped by load_compiled_vocab.
+
+    Args:
+        path(str): The output path of the compiled file.
+        source_file(str): The vocab file which the compiled file is built from, its digest is kept in the header.
+        tokens(list): The tokens of the vocab.
+        ids(list): The ids of the tokens. Default None, which means the ids are 0, 1, 2 ...
+        merges(list): The bpe merges, a list of the token pairs. Default None.
+            The merges are kept as the pairs of the token positions, so both tokens of a merge should be in tokens.
+
+    Returns:
+        The path of the compiled file, None if the vocab can not be compiled.
+    """
+    if any('\n' in item for item in tokens):
+        logger.warning("The vocab contains the newline character, so the compiled vocab %s is not saved.", path)
+        return None
+    positions = {token: pos for pos, token in enumerate(tokens)}
+    merges = merges if merges else []
+    if any(first not in positions or second not in positions for first, second in merges):
+        logger.warning("The merges contain the tokens out of the vocab, so the compiled vocab %s is not saved.", path)
+        return None
+    ids = np.arange(len(tokens), dtype='<u4') if ids is None else np.asarray(ids, dtype='<u4')
+    token_offsets, token_bytes = _pack_strings(tokens)
+    merge_pairs = np.array([(positions[first], positions[second]) for first, second in merges],
+                           dtype='<u4').reshape(-1, 2)
+    source_stat = os.stat(source_file)
+    header = _COMPILED_VOCAB_HEADER.pack(_COMPILED_VOCAB_MAGIC, COMPILED_VOCAB_VERSION, file_digest(source_file),
+                                         source_stat.st_size, source_stat.st_mtime_ns, len(tokens), len(merges))
+    with open(path, 'wb') as fp:
+        for item in (header, ids.tobytes(), token_offsets.tobytes(), token_bytes, merge_pairs.tobytes()):
+            fp.write(item)
+    return path
+
+
+def load_compiled_vocab(path, source_file):
+    """
+    Load the compiled file written by save_compiled_vocab.
+
+    Returns:
+        A tuple of the tokens, the uint32 ids array and the merges. None is returned if the compiled file
+        is not existed, is truncated, is written by another version or is stale compared with the source_file.
+        The source_file is hashed only if its size or mtime is not the one kept in the compiled file.
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    if os.path.getsize(path) < _COMPILED_VOCAB_HEADER.size:
+        logger.warning("The compiled vocab %s is truncated, it is ignored.", path)
+        return None
+    with open(path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        magic, version, digest, source_size, source_mtime, num_tokens, num_merges = \
+            _COMPILED_VOCAB_HEADER.unpack_from(buffer)
+        if magic != _COMPILED_VOCAB_MAGIC or version != COMPILED_VOCAB_VERSION:
+            logger.warning("The compiled vocab %s is not written by version %s, it is ignored.",
+                           path, COMPILED_VOCAB_VERSION)
+            return None
+        source_stat = os.stat(source_file)
+        if (source_stat.st_size, source_stat.st_mtime_ns) != (source_size, source_mtime) and \
+                digest != file_digest(source_file):
+            logger.warning("The compiled vocab %s is stale compared with %s, it is ignored.", path, source_file)
+            return None
+
+        pos = _COMPILED_VOCAB_HEADER.size
+        offsets_end = pos + 4 * (2 * num_tokens + 1)
+        if offsets_end > len(buffer):
+            logger.warning("The compiled vocab %s is truncated, it is ignored.", path)
+            return None
+        # the arrays are copied out, so the buffer can be closed
+        ids = np.frombuffer(buffer, dtype='<u4', count=num_tokens, offset=pos).copy()
+        tokens_end = offsets_end + int(np.frombuffer(buffer, dtype='<u4', count=1, offset=offsets_end - 4)[0])
+        if tokens_end + 8 * num_merges > len(buffer):
+            logger.warning("The compiled vocab %s is truncated, it is ignored.", path)
+            return None
+        tokens = buffer[offsets_end:tokens_end].decode('utf-8').split('\n')[:-1] if num_tokens else []
+        merge_pairs = np.frombuffer(buffer, dtype='<u4', count=num_merges * 2, offset=tokens_end).reshape(-1, 2)
+        merges = list(zip(map(tokens.__getitem__, merge_pairs[:, 0].tolist()),
+                          map(tokens.__getitem__, merge_pairs[:, 1].tolist())))
+        del merge_pairs
+    return tokens, ids, merges
+
+
+_SHARED_TABLE_MAGIC = b'MFST'
+_SHARED_TABLE_VERSION = 2
+# magic, version, number of tokens, number of hash slots, max value, max token length in characters, number
+# of trie nodes, number of trie edge slots. It is followed by the uint64 keys of the trie edge slots, the
+# uint32 values, the uint32 offsets of the tokens, the uint32 hash slots keeping the token position + 1
+# (0 is empty), the uint32 positions + 1 of the values, the uint32 children of the trie edge slots, the uint8
+# end of token flags of the trie nodes and the utf-8 tokens.
+_SHARED_TABLE_HEADER = struct.Struct('<4sIIIIIII')
+_EMPTY = 0
+_EDGE_HASH = 0x9E3779B97F4A7C15
+_UINT64_MASK = (1 << 64) - 1
+
+
+def _edge_key(node, char):
+    """The key of the trie edge from the node by the char, 0 is empty"""
+    return (node + 1) << 21 | ord(char)
+
+
+def _build_edge_slots(tokens):
+    """Build the prefix trie of the tokens as an open addressing hash table of the (node, char) edges"""
+    edges = {}
+    ends = [0]
+    for token in tokens:
+        node = 0
+        for char in token:
+            key = _edge_key(node, char)
+            child = edges.get(key)
+            if child is None:
+                child = len(ends)
+                edges[key] = child
+                ends.append(0)
+            node = child
+        ends[node] = 1
+    num_slots = 1 << max(3, (2 * len(edges) - 1).bit_length())
+    shift = 65 - num_slots.bit_length()
+    mask = num_slots - 1
+    keys = [0] * num_slots
+    children = [0] * num_slots
+    for key, child in edges.items():
+        slot = (key * _EDGE_HASH & _UINT64_MASK) >> shift
+        while keys[slot]:
+            slot = (slot + 1) & mask
+        keys[slot] = key
+        children[slot] = child
+    return np.array(keys, dtype='<u8'), np.array(children, dtype='<u4'), np.array(ends, dtype=np.uint8)
+
+
+def _unlink_shared_memory(shm, owner_pid):
+    """Remove the segment in the process which created it"""
+    if os.getpid() == owner_pid:
+        if os.name == 'posix' and sys.version_info < (3, 13):
+            # a worker sharing the resource tracker may have unregistered the segment, see _attach_shared_memory
+            resource_tracker.register(shm._name, "shared_memory")  # pylint: disable=W0212
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _attach_shared_memory(name):
+    """
+    Attach to an existing segment. Before python 3.13 the attaching process registers the segment in its
+    resource tracker too, which may remove the segment or warn about a leak when the process exits, so it is
+    unregistered, and the creator registers it again before removing it.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)  # pylint: disable=E1123
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix':
+        resource_tracker.unregister(shm._name, "shared_memory")  # pylint: disable=W0212
+    return shm
+
+
+class SharedTokenTable(Mapping):
+    """
+    A read-only mapping from the tokens to the uint32 values kept in a shared memory segment.
+
+    The table is published once by `create`, and the processes which unpickle it, for example the workers of
+    a dataset with python_multiprocessing, attach to the segment by its name instead of copying the tokens,
+    so the tokens are not duplicated as the python objects of each worker. A token is found by the crc32 of
+    its utf-8 bytes in an open addressing hash table, which is slower than a dict but copies nothing.
+
+    The values should be unique, so the tokens can be looked up by the values by `inverse`. With
+    `prefix_trie`, a prefix trie of the tokens is kept in the segment as a hash table of its edges, and
+    `longest_match` walks it to find the longest token at a position of a text.
+    The segment is removed when the table is closed or garbage collected in the process which created it,
+    or when that process exits.
+    """
+    def __init__(self, name):
+        self._shm = _attach_shared_memory(name)
+        self._finalizer = None
+        self._map_views()
+
+    @classmethod
+    def create(cls, items, prefix_trie=False):
+        """
+        Publish the tokens and the values into a new shared memory segment.
+
+        Args:
+            items: An iterable of the (token, value) pairs, the tokens are iterated in the order of the pairs.
+            prefix_trie(bool): Whether to keep the prefix trie of the tokens for `longest_match`. Default False.
+
+        Returns:
+            The SharedTokenTable owning the segment.
+        """
+        tokens = []
+        values = []
+        for token, value in items:
+            tokens.append(token)
+            values.append(value)
+        values = np.asarray(values, dtype='<u4')
+        if len(np.unique(values)) != len(values):
+            raise ValueError("The values of the SharedTokenTable should be unique.")
+        num_slots = 1 << max(3, (2 * len(tokens) - 1).bit_length())
+        encoded = [token.encode('utf-8') for token in tokens]
+        offsets = np.zeros(len(tokens) + 1, dtype='<u4')
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        slots = np.zeros(num_slots, dtype='<u4')
+        mask = num_slots - 1
+        for position, key in enumerate(encoded):
+            slot = zlib.crc32(key) & mask
+            while slots[slot] != _EMPTY:
+                slot = (slot + 1) & mask
+            slots[slot] = position + 1
+        max_value = int(values.max()) if len(values) else 0
+        value_positions = np.zeros(max_value + 1, dtype='<u4')
+        value_positions[values] = np.arange(1, len(values) + 1, dtype='<u4')
+        if prefix_trie:
+            edge_keys, edge_children, ends = _build_edge_slots(tokens)
+        else:
+            edge_keys, edge_children, ends = (np.zeros(0, dtype='<u8'), np.zeros(0, dtype='<u4'),
+                                              np.zeros(0, dtype=np.uint8))
+        header = _SHARED_TABLE_HEADER.pack(_SHARED_TABLE_MAGIC, _SHARED_TABLE_VERSION, len(tokens), num_slots,
+                                           max_value, max((len(token) for token in tokens), default=0),
+                                           len(ends), len(edge_keys))
+
+        # the uint64 keys follow the header of 32 bytes, so they are aligned
+        payload = (header, edge_keys.tobytes(), values.tobytes(), offsets.tobytes(), slots.tobytes(),
+                   value_positions.tobytes(), edge_children.tobytes(), ends.tobytes(), b''.join(encoded))
+        shm = shared_memory.SharedMemory(create=True, size=max(1, sum(len(item) for item in payload)))
+        position = 0
+        for item in payload:
+            shm.buf[position:position + len(item)] = item
+            position += len(item)
+        table = cls.__new__(cls)
+        table._shm = shm  # pylint: disable=W0212
+        # the forked workers inherit the table, only the creator process removes the segment
+        table._finalizer = weakref.finalize(table, _unlink_shared_memory, shm, os.getpid())  # pylint: disable=W0212
+        table._map_views()  # pylint: disable=W0212
+        logger.info("Publish %s tokens into the shared memory %s of %s bytes.", len(tokens), shm.name, shm.size)
+        return table
+
+    def _map_views(self):
+        """Map the sections of the segment as the memoryviews, the lookups index them without copying"""
+        buf = self._shm.buf
+        magic, version, num_tokens, num_slots, max_value, max_token_length, num_nodes, num_edge_slots = \
+            _SHARED_TABLE_HEADER.unpack_from(buf)
+        if magic != _SHARED_TABLE_MAGIC or version != _SHARED_TABLE_VERSION:
+            raise ValueError(f"The shared memory {self._shm.name} is not a SharedTokenTable "
+                             f"of version {_SHARED_TABLE_VERSION}.")
+        position = _SHARED_TABLE_HEADER.size
+        sections = []
+        for count, item_size, item_format in ((num_edge_slots, 8, 'Q'), (num_tokens, 4, 'I'),
+                                              (num_tokens + 1, 4, 'I'), (num_slots, 4, 'I'),
+                                              (max_value + 1, 4, 'I'), (num_edge_slots, 4, 'I'),
+                                              (num_nodes, 1, 'B')):
+            sections.append(buf[position:position + item_size * count].cast(item_format))
+            position += item_size * count
+        (self._edge_keys, self._values, self._offsets, self._slots, self._value_positions,
+         self._edge_children, self._ends) = sections
+        self._data = buf[position:position + self._offsets[num_tokens]]
+        self._edge_shift = 65 - num_edge_slots.bit_length()
+        self._num_tokens = num_tokens
+        self._mask = num_slots - 1
+        self.max_token_length = max_token_length
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def nbytes(self):
+        return self._shm.size
+
+    def _find(self, token):
+        """Return the position of the token, -1 if it is not found"""
+        if not isinstance(token, str):
+            return -1
+        key = token.encode('utf-8')
+        slots, offsets, data, mask = self._slots, self._offsets, self._data, self._mask
+        slot = zlib.crc32(key) & mask
+        length = len(key)
+        while True:
+            position = slots[slot]
+            if position == _EMPTY:
+                return -1
+            position -= 1
+            start = offsets[position]
+            end = offsets[position + 1]
+            if end - start == length and data[start:end] == key:
+                return position
+            slot = (slot + 1) & mask
+
+    def _token(self, position):
+        return bytes(self._data[self._offsets[position]:self._offsets[position + 1]]).decode('utf-8')
+
+    def get(self, key, default=None):
+        position = self._find(key)
+        return default if position < 0 else self._values[position]
+
+    def __getitem__(self, key):
+        position = self._find(key)
+        if position < 0:
+            raise KeyError(key)
+        return self._values[position]
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        for position in range(self._num_tokens):
+            yield self._token(position)
+
+    def __len__(self):
+        return self._num_tokens
+
+    @property
+    def has_prefix_trie(self):
+        return len(self._ends) > 0
+
+    def _child(self, node, char):
+        """Return the child of the trie node by the char, -1 if there is none"""
+        key = _edge_key(node, char)
+        keys = self._edge_keys
+        mask = len(keys) - 1
+        slot = (key * _EDGE_HASH & _UINT64_MASK) >> self._edge_shift
+        while True:
+            slot_key = keys[slot]
+            if slot_key == key:
+                return self._edge_children[slot]
+            if slot_key == _EMPTY:
+                return -1
+            slot = (slot + 1) & mask
+
+    def longest_match(self, text, start, prefix=""):
+        """
+        Return the end of the longest token which is `prefix + text[start:end]`, start is returned if there is
+        none. The table should be created with prefix_trie.
+        """
+        if not self.has_prefix_trie:
+            raise ValueError("longest_match needs a SharedTokenTable created with prefix_trie=True.")
+        node = 0
+        for char in prefix:
+            node = self._child(node, char)
+            if node < 0:
+                return start
+        end = start
+        ends = self._ends
+        for i in range(start, len(text)):
+            node = self._child(node, text[i])
+            if node < 0:
+                break
+            if ends[node]:
+                end = i + 1
+        return end
+
+    def get_token(self, value, default=None):
+        """Return the token of the value"""
+        if not isinstance(value, (int, np.integer)) or not 0 <= value < len(self._value_positions):
+            return default
+        position = self._value_positions[value]
+        return default if position == _EMPTY else self._token(position - 1)
+
+    def inverse(self):
+        """Return a read-only mapping from the values to the tokens on the same segment"""
+        return _SharedTokenTableInverse(self)
+
+    def __getstate__(self):
+        return {'name': self.name}
+
+    def __setstate__(self, state):
+        self.__init__(state['name'])
+
+    def close(self):
+        """Detach from the segment, the creator also removes it"""
+        if self._shm is None:
+            return
+        for view in (self._edge_keys, self._values, self._offsets, self._slots, self._value_positions,
+                     self._edge_children, self._ends, self._data):
+            view.release()
+        self._shm.close()
+        if self._finalizer is not None:
+            self._finalizer()
+        self._shm = None
+
+    def __del__(self):
+        # the views should be released before SharedMemory closes the buffer
+        try:
+            self.close()
+        except (AttributeError, BufferError, TypeError):
+            pass
+
+
+class _SharedTokenTableInverse(Mapping):
+    """The values to the tokens view of a SharedTokenTable"""
+    def __init__(self, table):
+        self.table = table
+
+    def get(self, key, default=None):
+        return self.table.get_token(key, default)
+
+    def __getitem__(self, key):
+        token = self.table.get_token(key)
+        if token is None:
+            raise KeyError(key)
+        return token
+
+    def __contains__(self, key):
+        return self.table.get_token(key) is not None
+
+    def __iter__(self):
+        return iter(self.table.values())
+
+    def __len__(self):
+        return len(self.table)
@@ -89,8 +89,8 @@ class ZeroShotImageClassificationPipeline(BasePipeline):
             inputs (url, PIL.Image, tensor, numpy): the image to be classified.
             candidate_labels (str, list): the candidate labels for classification.
             max_length (int): max length of tokenizer's output
-            padding (False / "max_length"): padding for max_length
-            return_tensors ("ms"): the type of returned tensors
+            padding (False / "max_length" / "longest"): padding for max_length or the longest text
+            return_tensors ("ms" / "np"): the type of returned tensors
 
         Return:
             processed image.
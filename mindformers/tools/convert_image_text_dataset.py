@@ -0,0 +1,50 @@
+# Copyright 2022 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+"""
+Convert the Flickr8k style image text folders into the packed shards read by PackedImageTextDataLoader.
+
+python -m mindformers.tools.convert_image_text_dataset --dataset_dir ./Flickr8k_Dataset \
+    --annotation_dir ./Flickr8k_text --stage train --output_dir ./flickr8k_train_packed
+"""
+from argparse import ArgumentParser
+
+from mindformers.dataset.dataloader.flickr8k_dataloader import Flickr8kDataSet
+from mindformers.dataset.dataloader.packed_image_text_dataloader import pack_image_text_dataset
+
+
+def parse_args():
+    """parse args"""
+    parser = ArgumentParser(description="convert the image text folders into the packed shards")
+    parser.add_argument("--dataset_dir", type=str, required=True, help="The directory to the images.")
+    parser.add_argument("--annotation_dir", type=str, required=True, help="The directory to the caption files.")
+    parser.add_argument("--stage", type=str, default="train", help="One of train, test, dev and all.")
+    parser.add_argument("--annotation_file", type=str, default="Flickr8k.token.txt",
+                        help="The caption file under annotation_dir.")
+    parser.add_argument("--output_dir", type=str, required=True, help="The output directory of the shards.")
+    parser.add_argument("--shard_size", type=int, default=1 << 30,
+                        help="The bytes of a shard, a new shard is started when it is exceeded.")
+    return parser.parse_args()
+
+
+def main():
+    """pack the dataset"""
+    args = parse_args()
+    dataset = Flickr8kDataSet(args.dataset_dir, args.annotation_dir, stage=args.stage,
+                              annotation_file=args.annotation_file, decode_image=False)
+    pack_image_text_dataset(dataset, args.output_dir, shard_size=args.shard_size, prefix=args.stage)
+
+
+if __name__ == "__main__":
+    main()
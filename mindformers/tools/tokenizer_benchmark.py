@@ -0,0 +1,309 @@
+# Copyright 2022 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+"""
+Measure the throughput of a tokenizer on a synthetic corpus or the text files, and save the results as json.
+
+python -m mindformers.tools.tokenizer_benchmark --tokenizer ClipTokenizer \
+    --vocab_file ./bpe_simple_vocab_16e6.txt.gz --corpus synthetic --output ./clip_tokenizer.json
+
+python -m mindformers.tools.tokenizer_benchmark --tokenizer clip_vit_b_32 \
+    --corpus ./Flickr8k_text/Flickr8k.token.txt --compare ./clip_tokenizer.json
+"""
+import json
+import platform
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from mindformers.tools.logger import logger
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+__all__ = ['synthetic_corpus', 'read_corpus', 'benchmark_tokenizer', 'compare_results']
+
+BENCHMARK_VERSION = 1
+
+_COMMON_WORDS = ("the", "a", "of", "and", "in", "to", "is", "on", "with", "two", "man", "woman", "dog", "people",
+                 "are", "at", "his", "her", "while", "an", "young", "boy", "girl", "white", "black", "red", "blue",
+                 "water", "street", "playing", "running", "standing", "sitting", "through", "front", "grass",
+                 "ball", "shirt", "wearing", "looking", "child", "small", "large", "group", "near", "holding")
+_SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "zen", "qua", "tri", "pho", "gra", "str", "ble", "ion")
+_PUNCTUATION = (".", ",", "!", "?", ";", ":")
+_RARE_WORDS = ("café", "naïve", "Zürich", "東京", "smörgåsbord", "&amp;", "e-mail", "1,024", "don't", "CO2")
+
+
+def synthetic_corpus(num_texts=10000, min_words=5, max_words=40, seed=0):
+    """
+    Generate the texts whose words follow the Zipf's law like the natural language.
+
+    The words are the common words, the rare words made of the random syllables, the numbers, the
+    punctuation and a few non-ASCII words, so the caches of the tokenizers hit as they do on the real text.
+
+    Args:
+        num_texts(int): The number of the texts. Default 10000.
+        min_words(int): The min number of the words of a text. Default 5.
+        max_words(int): The max number of the words of a text. Default 40.
+        seed(int): The random seed. Default 0.
+
+    Returns:
+        A list of the texts.
+    """
+    rng = np.random.default_rng(seed)
+    made_words = ["".join(rng.choice(_SYLLABLES, size=rng.integers(2, 5))) for _ in range(5000)]
+    words = list(_COMMON_WORDS) + made_words
+    weights = 1.0 / np.arange(1, len(words) + 1)
+    weights /= weights.sum()
+    texts = []
+    for _ in range(num_texts):
+        num_words = int(rng.integers(min_words, max_words + 1))
+        text = [words[index] for index in rng.choice(len(words), size=num_words, p=weights)]
+        for position in rng.choice(num_words, size=num_words // 8, replace=False):
+            kind = rng.random()
+            if kind < 0.6:
+                text[position] += _PUNCTUATION[int(rng.integers(len(_PUNCTUATION)))]
+            elif kind < 0.8:
+                text[position] = str(int(rng.integers(0, 10000)))
+            else:
+                text[position] = _RARE_WORDS[int(rng.integers(len(_RARE_WORDS)))]
+        text[0] = text[0].capitalize()
+        texts.append(" ".join(text))
+    return texts
+
+
+def read_corpus(paths, num_texts=None):
+    """
+    Read the non-empty lines of the text files as the texts. The text after the last tab of a line is used,
+    so the caption files like Flickr8k.token.txt are read as they are.
+    """
+    texts = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                text = line.rstrip("\n").rsplit("\t", 1)[-1].strip()
+                if text:
+                    texts.append(text)
+                if num_texts and len(texts) >= num_texts:
+                    return texts
+    if not texts:
+        raise ValueError(f"No text is found in {paths}.")
+    return texts
+
+
+def _peak_rss_mb():
+    """The peak resident memory of the process in MB, None if it is not supported by the system"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # the peak is in bytes on the macOS and in KB on the linux
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def _get_cache_stats(tokenizer):
+    """Return the counters of the caches of the tokenizer"""
+    stats = {}
+    if hasattr(tokenizer, "cache_info"):
+        stats["word_cache"] = tokenizer.cache_info()
+    if hasattr(tokenizer, "encode_cache_info"):
+        stats["encode_cache"] = tokenizer.encode_cache_info()
+    return stats
+
+
+def _diff_cache_stats(before, after):
+    """Return the hits, the misses and the hit rate of each cache between two snapshots"""
+    stats = {}
+    for name, counters in after.items():
+        if counters.get('capacity') == 0:
+            continue
+        hits = counters['hits'] - before.get(name, {}).get('hits', 0)
+        misses = counters['misses'] - before.get(name, {}).get('misses', 0)
+        stats[name] = {'hits': hits,
+                       'misses': misses,
+                       'hit_rate': hits / (hits + misses) if hits + misses else 0.0}
+    return stats
+
+
+def _clear_caches(tokenizer):
+    """Clear the word caches of ClipTokenizer and BertTokenizer and the encode cache"""
+    for cache in (getattr(getattr(tokenizer, "tool", None), "cache", None), getattr(tokenizer, "word_cache", None)):
+        if cache is not None:
+            cache.clear()
+    if hasattr(tokenizer, "clear_encode_cache"):
+        tokenizer.clear_encode_cache()
+
+
+def _run_case(tokenizer, func, calls, count_tokens, repeat):
+    """Run func on each call repeat times, the latency of each call is measured"""
+    latencies = []
+    num_tokens = 0
+    cache_before = _get_cache_stats(tokenizer)
+    for _ in range(repeat):
+        for call in calls:
+            start = time.perf_counter()
+            output = func(call)
+            latencies.append(time.perf_counter() - start)
+            num_tokens += count_tokens(call, output)
+    cache_after = _get_cache_stats(tokenizer)
+    latencies = np.array(latencies)
+    seconds = float(latencies.sum())
+    return {'calls': len(latencies),
+            'tokens': num_tokens,
+            'seconds': seconds,
+            'tokens_per_second': num_tokens / seconds if seconds else 0.0,
+            'latency_ms': {'mean': float(latencies.mean() * 1000) if latencies.size else 0.0,
+                           'p50': float(np.percentile(latencies, 50) * 1000) if latencies.size else 0.0,
+                           'p99': float(np.percentile(latencies, 99) * 1000) if latencies.size else 0.0},
+            'peak_rss_mb': _peak_rss_mb(),
+            'cache': _diff_cache_stats(cache_before, cache_after)}
+
+
+def benchmark_tokenizer(tokenizer, texts, batch_size=32, repeat=1, warmup=True, cases=None):
+    """
+    Measure the single and the batch encode and decode of the tokenizer.
+
+    The tokens per second, the p50 and the p99 latency of a call, the peak resident memory of the process
+    after each case and the hit rates of the caches in each case are reported. The caches are warmed by
+    the first pass over the texts if warmup is True, otherwise the first case runs with the cold caches.
+
+    Args:
+        tokenizer: The tokenizer, for example ClipTokenizer or BertTokenizer.
+        texts(list): The texts.
+        batch_size(int): The number of the texts of a batch call. Default 32.
+        repeat(int): The number of the passes over the texts of each case. Default 1.
+        warmup(bool): Whether to encode the texts once before the cases. Default True.
+        cases(list): The cases to run, in `encode`, `batch_encode`, `decode` and `batch_decode`.
+            Default None, which means all of them.
+
+    Returns:
+        A dict of the results, which can be saved as json.
+    """
+    all_cases = ('encode', 'batch_encode', 'decode', 'batch_decode')
+    cases = all_cases if cases is None else cases
+    if set(cases) - set(all_cases):
+        raise ValueError(f"The cases should be in {all_cases}, but got {cases}.")
+    if not texts:
+        raise ValueError("The texts should not be empty.")
+    if not isinstance(batch_size, int) or batch_size <= 0:
+        raise ValueError(f"batch_size should be a positive int, but got {batch_size}.")
+    batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+
+    start = time.perf_counter()
+    ids = tokenizer(texts)["input_ids"]
+    logger.info("Encode %s texts in %.3fs before the cases.", len(texts), time.perf_counter() - start)
+    if not warmup:
+        _clear_caches(tokenizer)
+    # the padded ids of a batch and the number of the real tokens, the padding is not counted
+    id_batches = []
+    for start in range(0, len(ids), batch_size):
+        rows = ids[start:start + batch_size]
+        padded = np.full((len(rows), max(len(row) for row in rows)), tokenizer.pad_token_id, dtype=np.int32)
+        for index, row in enumerate(rows):
+            padded[index, :len(row)] = row
+        id_batches.append((padded, sum(len(row) for row in rows)))
+
+    case_funcs = {
+        'encode': (texts, tokenizer, lambda text, output: len(output["input_ids"])),
+        'batch_encode': (batches, tokenizer, lambda batch, output: sum(len(row) for row in output["input_ids"])),
+        'decode': (ids, tokenizer.decode, lambda row, output: len(row)),
+        'batch_decode': (id_batches, lambda batch: tokenizer.batch_decode(batch[0]),
+                         lambda batch, output: batch[1]),
+    }
+    results = {}
+    for case in cases:
+        calls, func, count_tokens = case_funcs[case]
+        results[case] = _run_case(tokenizer, func, calls, count_tokens, repeat)
+        logger.info("%s: %.0f tokens/s, p50 %.3fms, p99 %.3fms, peak rss %s MB, cache %s.", case,
+                    results[case]['tokens_per_second'], results[case]['latency_ms']['p50'],
+                    results[case]['latency_ms']['p99'], results[case]['peak_rss_mb'], results[case]['cache'])
+    return {'version': BENCHMARK_VERSION,
+            'tokenizer': type(tokenizer).__name__,
+            'corpus': {'texts': len(texts),
+                       'chars': sum(len(text) for text in texts),
+                       'tokens': sum(len(row) for row in ids)},
+            'settings': {'batch_size': batch_size, 'repeat': repeat, 'warmup': warmup},
+            'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+            'results': results}
+
+
+def compare_results(current, baseline):
+    """Return the ratios of the tokens per second and the p99 latency of the current run to the baseline"""
+    def _ratio(value, base_value):
+        return value / base_value if base_value else None
+
+    ratios = {}
+    for case, result in current['results'].items():
+        base = baseline.get('results', {}).get(case)
+        if not base:
+            continue
+        ratios[case] = {'tokens_per_second': _ratio(result['tokens_per_second'], base['tokens_per_second']),
+                        'latency_p99': _ratio(result['latency_ms']['p99'], base['latency_ms']['p99'])}
+    return ratios
+
+
+def parse_args():
+    """parse args"""
+    parser = ArgumentParser(description="measure the throughput of a tokenizer")
+    parser.add_argument("--tokenizer", type=str, required=True,
+                        help="The registered class name with --vocab_file, or the name of from_pretrained, "
+                             "for example clip_vit_b_32.")
+    parser.add_argument("--vocab_file", type=str, default=None, help="The vocab file of the tokenizer class.")
+    parser.add_argument("--corpus", type=str, nargs="+", default=["synthetic"],
+                        help="`synthetic` or the text files, a text for each line.")
+    parser.add_argument("--num_texts", type=int, default=10000, help="The number of the texts.")
+    parser.add_argument("--batch_size", type=int, default=32, help="The number of the texts of a batch call.")
+    parser.add_argument("--repeat", type=int, default=1, help="The number of the passes of each case.")
+    parser.add_argument("--cold", action="store_true", help="Run the cases with the cold caches.")
+    parser.add_argument("--cases", type=str, nargs="+", default=None,
+                        help="The cases in encode, batch_encode, decode and batch_decode.")
+    parser.add_argument("--output", type=str, default=None, help="The json file of the results.")
+    parser.add_argument("--compare", type=str, default=None, help="The json file of the baseline results.")
+    return parser.parse_args()
+
+
+def main():
+    """run the benchmark"""
+    args = parse_args()
+    # pylint: disable=C0415
+    from mindformers import AutoTokenizer
+    from mindformers.models.build_tokenizer import build_tokenizer
+    if args.vocab_file:
+        tokenizer = build_tokenizer(class_name=args.tokenizer, vocab_file=args.vocab_file)
+    else:
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    if args.corpus == ["synthetic"]:
+        texts = synthetic_corpus(args.num_texts)
+    else:
+        texts = read_corpus(args.corpus, args.num_texts)
+    results = benchmark_tokenizer(tokenizer, texts, batch_size=args.batch_size, repeat=args.repeat,
+                                  warmup=not args.cold, cases=args.cases)
+    results['corpus']['source'] = args.corpus
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=4)
+        logger.info("Save the results in %s.", args.output)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        for case, ratios in compare_results(results, baseline).items():
+            logger.info("%s: %s of the baseline tokens/s, %s of the baseline p99 latency.", case,
+                        ratios['tokens_per_second'], ratios['latency_p99'])
+
+
+if __name__ == "__main__":
+    main()
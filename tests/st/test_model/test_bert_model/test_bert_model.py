@@ -21,9 +21,13 @@ windows:  pytest .\\tests\\st\\test_model\\test_bert_model\\test_bert_model.py
 linux:  pytest ./tests/st/test_model/test_bert_model/test_bert_model.py
 """
 import os
+import numpy as np
 import pytest
+import mindspore.common.dtype as mstype
+from mindspore import Tensor, load_param_into_net
 from mindformers import MindFormerBook, AutoModel
-from mindformers.models import BaseModel, BertForPretraining
+from mindformers.dataset import BertSequencePacker
+from mindformers.models import BaseModel, BertForPretraining, BertConfig
 from mindformers.tools import logger
 
 
@@ -54,3 +58,98 @@ class TestModelMethod:
         model = AutoModel.from_config(self.config_path)
         assert isinstance(model, BertForPretraining)
         assert isinstance(model, BaseModel)
+
+    @pytest.mark.level0
+    @pytest.mark.platform_x86_cpu
+    @pytest.mark.env_onecard
+    def test_sequence_packing(self):
+        """
+        Feature: BertSequencePacker
+        Description: Test the packed rows keep the tokens, the labels and the masked positions of the examples
+        Expectation: AssertionError
+        """
+        seq_length, max_predictions = 32, 4
+        examples = []
+        for length in [20, 10, 6, 30, 12, 8]:
+            input_ids = np.zeros(seq_length, np.int64)
+            input_ids[:length] = np.arange(1, length + 1)
+            input_mask = (input_ids > 0).astype(np.int64)
+            masked_lm_positions = np.array([1, 2, 0, 0])
+            masked_lm_weights = np.array([1.0, 1.0, 0.0, 0.0], np.float32)
+            examples.append((input_ids, input_mask, np.zeros(seq_length, np.int64), np.array([length % 2]),
+                             masked_lm_positions, input_ids[masked_lm_positions] * masked_lm_weights.astype(np.int64),
+                             masked_lm_weights))
+
+        packer = BertSequencePacker(max_sequences_per_pack=3, max_predictions_per_pack=max_predictions * 2)
+        rows = list(packer.pack(examples))
+        assert len(rows) == 3
+        stats = packer.stats()
+        assert stats['examples'] == 6
+        assert stats['packing_efficiency'] > stats['padded_efficiency']
+
+        lengths = []
+        for row in rows:
+            row = dict(zip(packer.output_columns, row))
+            for segment in range(1, row['input_mask'].max() + 1):
+                tokens = row['input_mask'] == segment
+                start = row['next_sentence_positions'][segment - 1]
+                length = int(tokens.sum())
+                assert row['next_sentence_weights'][segment - 1] == 1
+                assert row['next_sentence_labels'][segment - 1] == length % 2
+                assert np.array_equal(row['input_ids'][tokens], np.arange(1, length + 1))
+                assert np.array_equal(row['position_ids'][tokens], np.arange(length))
+                masked = row['masked_lm_positions'][(row['masked_lm_weights'] > 0) &
+                                                    (row['masked_lm_positions'] >= start) &
+                                                    (row['masked_lm_positions'] < start + length)]
+                assert np.array_equal(masked - start, [1, 2])
+                lengths.append(length)
+        assert sorted(lengths) == [6, 8, 10, 12, 20, 30]
+
+    @pytest.mark.level0
+    @pytest.mark.platform_x86_cpu
+    @pytest.mark.env_onecard
+    def test_packed_model(self):
+        """
+        Feature: packed option of BertForPretraining
+        Description: Test a row packed from three examples has the same per example outputs and loss as the examples
+        Expectation: AssertionError
+        """
+        seq_length, max_predictions = 32, 4
+        config = dict(batch_size=3, seq_length=seq_length, vocab_size=100, embedding_size=32, num_layers=1,
+                      num_heads=2, hidden_dropout_prob=0.0, attention_probs_dropout_prob=0.0,
+                      max_position_embeddings=seq_length, dtype=mstype.float32, compute_dtype=mstype.float32)
+        bert = BertForPretraining(BertConfig(**config))
+        config['batch_size'] = 1
+        packed_bert = BertForPretraining(BertConfig(packed=True, **config))
+        load_param_into_net(packed_bert, bert.parameters_dict())
+
+        examples = []
+        for length in [12, 8, 10]:
+            input_ids = np.zeros(seq_length, np.int32)
+            input_ids[:length] = np.random.randint(low=1, high=100, size=(length,))
+            input_mask = (input_ids > 0).astype(np.int32)
+            segment_ids = np.zeros(seq_length, np.int32)
+            segment_ids[length // 2:length] = 1
+            masked_lm_positions = np.array([1, length - 2, 0, 0], np.int32)
+            masked_lm_weights = np.array([1, 1, 0, 0], np.int32)
+            examples.append((input_ids, input_mask, segment_ids, np.array([length % 2], np.int32),
+                             masked_lm_positions, input_ids[masked_lm_positions] * masked_lm_weights,
+                             masked_lm_weights))
+        packer = BertSequencePacker(max_sequences_per_pack=3, max_predictions_per_pack=max_predictions * 2)
+        rows = list(packer.pack(examples))
+        assert len(rows) == 1
+        batch = [Tensor(np.stack(column)) for column in zip(*examples)]
+        packed_batch = [Tensor(column[np.newaxis]) for column in rows[0]]
+
+        # the inputs of BertScore are input_ids, input_mask, token_type_id and masked_lm_positions
+        scores, nsp_scores, _ = bert.bert(*batch[:3], batch[4])
+        packed_scores, packed_nsp_scores, _ = packed_bert.bert(*packed_batch[:3], packed_batch[4],
+                                                                packed_batch[7], packed_batch[8])
+        weights = np.stack([example[6] for example in examples]).reshape(-1)
+        packed_weights = rows[0][6]
+        assert np.allclose(scores.asnumpy()[weights > 0], packed_scores.asnumpy()[packed_weights > 0], atol=1e-4)
+        assert np.allclose(nsp_scores.asnumpy(), packed_nsp_scores.asnumpy(), atol=1e-4)
+
+        loss = bert(*batch)
+        packed_loss = packed_bert(*packed_batch)
+        assert np.allclose(loss.asnumpy(), packed_loss.asnumpy(), atol=1e-4)
@@ -0,0 +1,164 @@
+# Copyright 2022 Huawei Technologies Co., Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+
+"""
+Test Module for testing BertPretrainDataset on the small tfrecord files
+
+How to run this:
+windows:  pytest .\\tests\\st\\test_model\\test_bert_model\\test_bert_pretrain_dataset.py
+linux:  pytest ./tests/st/test_model/test_bert_model/test_bert_pretrain_dataset.py
+"""
+import os
+import struct
+
+import pytest
+
+from mindformers.dataset import BertPretrainDataset
+from mindformers.tools.register.config import MindFormerConfig
+
+SEQ_LENGTH = 8
+INPUT_COLUMNS = ["input_ids", "input_mask", "segment_ids", "next_sentence_labels",
+                 "masked_lm_positions", "masked_lm_ids", "masked_lm_weights"]
+# the rows 0 to 39 of the fixture have 8 tokens and the rows 40 to 45 have 3 tokens and the padding,
+# the input ids of a row are the row id and the following ids, the tokens 1 and 2 are masked
+FIXTURE_FILE = os.path.join(os.path.dirname(__file__), "bert_pretrain_rows.tfrecord")
+
+
+def read_records(path):
+    """Split a tfrecord file into the records, each one with its length and crc fields"""
+    with open(path, 'rb') as file:
+        data = file.read()
+    records = []
+    offset = 0
+    while offset < len(data):
+        end = offset + struct.unpack_from('<Q', data, offset)[0] + 16
+        records.append(data[offset:end])
+        offset = end
+    return records
+
+
+FIXTURE_RECORDS = read_records(FIXTURE_FILE)
+
+
+def write_tfrecord(path, row_ids):
+    """Write the rows of the fixture into a tfrecord file"""
+    with open(path, 'wb') as file:
+        file.write(b"".join(FIXTURE_RECORDS[row_id] for row_id in row_ids))
+
+
+def make_config(dataset_dir, data_loader=None, **kwargs):
+    """The config of BertPretrainDataset reading the files in order"""
+    config = {"data_loader": dict({"type": "TFRecordDataset", "dataset_dir": dataset_dir, "shuffle": False},
+                                  **(data_loader or {})),
+              "input_columns": INPUT_COLUMNS, "num_parallel_workers": 1, "shuffle_buffer_size": 0,
+              "drop_remainder": False, "batch_size": 1, "repeat": 1, "numa_enable": False, "prefetch_size": 1,
+              "seed": 2022}
+    config.update(kwargs)
+    return MindFormerConfig(**config)
+
+
+def read_row_ids(dataset_dir, shuffle_buffer_size=0, data_loader=None):
+    """Read the first input ids of BertPretrainDataset"""
+    dataset = BertPretrainDataset(make_config(dataset_dir, data_loader, shuffle_buffer_size=shuffle_buffer_size))
+    return [int(row["input_ids"][0, 0]) for row in dataset.create_dict_iterator(output_numpy=True)]
+
+
+@pytest.mark.level0
+@pytest.mark.platform_x86_cpu
+@pytest.mark.env_onecard
+class TestBertPretrainDataset:
+    """A test class for testing BertPretrainDataset"""
+
+    def test_read_all_files(self, tmp_path):
+        """
+        Feature: BertPretrainDataset reading a directory
+        Description: Read the tfrecord files of a directory and its sub directory
+        Expectation: The rows of some files are not read.
+        """
+        os.makedirs(tmp_path / "part")
+        write_tfrecord(tmp_path / "a.tfrecord", range(0, 3))
+        write_tfrecord(tmp_path / "b.tfrecord", range(3, 8))
+        write_tfrecord(tmp_path / "part" / "c.tfrecord", range(8, 10))
+        (tmp_path / "readme.txt").write_text("not a tfrecord file")
+        assert read_row_ids(str(tmp_path)) == list(range(10))
+
+    def test_shards(self, tmp_path, monkeypatch):
+        """
+        Feature: BertPretrainDataset sharded by RANK_ID and RANK_SIZE
+        Description: Shard the files of the balanced and the unbalanced rows and 1 file across 2 devices
+        Expectation: The shards are not equal or not disjoint, or the balanced files are not read whole.
+        """
+        monkeypatch.setenv("RANK_SIZE", "2")
+
+        def read_shards(dataset_dir, data_loader=None):
+            shards = []
+            for rank_id in range(2):
+                monkeypatch.setenv("RANK_ID", str(rank_id))
+                shards.append(read_row_ids(str(dataset_dir), data_loader=data_loader))
+            return shards
+
+        for name, file_rows in [("equal", [5, 5, 5, 5]), ("balanced", [7, 5, 3, 5]),
+                                ("unbalanced", [5, 3, 2, 7]), ("one", [8])]:
+            dataset_dir = tmp_path / name
+            os.makedirs(dataset_dir)
+            files = []
+            for index, num_rows in enumerate(file_rows):
+                start = sum(file_rows[:index])
+                write_tfrecord(dataset_dir / f"part-{index}.tfrecord", range(start, start + num_rows))
+                files.append(set(range(start, start + num_rows)))
+
+            shards = read_shards(dataset_dir)
+            assert len(shards[0]) == len(shards[1]) >= sum(file_rows) // 2
+            assert set(shards[0]) | set(shards[1]) == set(range(sum(file_rows)))
+            if name in ("equal", "balanced"):
+                # each device reads whole files
+                assert not set(shards[0]) & set(shards[1])
+                assert all(rows <= set(shards[0]) or rows <= set(shards[1]) for rows in files)
+            if name == "unbalanced":
+                with pytest.raises(ValueError):
+                    read_shards(dataset_dir, data_loader={"shard_equal_rows": False})
+
+    def test_shuffle_buffer(self, tmp_path):
+        """
+        Feature: shuffle_buffer_size of BertPretrainDataset
+        Description: Read the rows with and without the shuffle buffer
+        Expectation: The rows are not shuffled by the buffer.
+        """
+        write_tfrecord(tmp_path / "a.tfrecord", range(40))
+        assert read_row_ids(str(tmp_path)) == list(range(40))
+        row_ids = read_row_ids(str(tmp_path), shuffle_buffer_size=16)
+        assert sorted(row_ids) == list(range(40))
+        assert row_ids != list(range(40))
+
+    def test_pack_sequences(self, tmp_path):
+        """
+        Feature: pack_sequences of BertPretrainDataset
+        Description: Pack the examples of 3 tokens into the rows of 8 tokens
+        Expectation: The packed columns are not built from the examples.
+        """
+        write_tfrecord(tmp_path / "a.tfrecord", range(40, 46))
+        config = make_config(str(tmp_path), pack_sequences=True, seq_length=SEQ_LENGTH, max_sequences_per_pack=2)
+        rows = list(BertPretrainDataset(config).create_dict_iterator(output_numpy=True))
+        assert len(rows) == 3
+        for row in rows:
+            first, second = row["input_ids"][0, 0], row["input_ids"][0, 3]
+            assert row["input_ids"][0].tolist() == [first, first + 1, first + 2, second, second + 1, second + 2, 0, 0]
+            assert row["input_mask"][0].tolist() == [1, 1, 1, 2, 2, 2, 0, 0]
+            assert row["position_ids"][0].tolist() == [0, 1, 2, 0, 1, 2, 0, 0]
+            assert row["masked_lm_positions"][0].tolist() == [1, 2, 4, 5]
+            assert row["masked_lm_ids"][0].tolist() == [first + 1, first + 2, second + 1, second + 2]
+            assert row["next_sentence_positions"][0].tolist() == [0, 3]
+            assert row["next_sentence_labels"][0].tolist() == [first % 2, second % 2]
+        assert sorted(int(row["input_ids"][0, start]) for row in rows for start in (0, 3)) == list(range(40, 46))
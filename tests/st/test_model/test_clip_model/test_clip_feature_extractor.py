@@ -25,7 +25,9 @@ import os
 import numpy as np
 from PIL import Image
 import mindspore as ms
+from mindspore.dataset import vision
 from mindformers.models import ClipFeatureExtractor, ClipImageFeatureExtractor
+from mindformers.dataset import BatchResize, BatchCenterCrop, BatchToTensor, BatchNormalize, build_transforms
 from mindformers import MindFormerBook, AutoFeatureExtractor
 from mindformers.tools import logger
 
@@ -113,3 +115,53 @@ def test_auto_feature_extractor():
     fe_a.save_pretrained(save_directory, save_name='clip_vit_b_32')
     fe_b.save_pretrained(save_directory, save_name='clip_vit_b_32')
     fe_c.save_pretrained(save_directory, save_name='clip_vit_b_32')
+
+
+def test_batch_vision_transforms():
+    """
+    Feature: BatchResize, BatchCenterCrop, BatchToTensor and BatchNormalize
+    Description: Compare the batch outputs with the outputs of the transforms of each image
+    Expectation: The batch outputs are not close to the outputs of each image.
+    """
+    image_batch = np.random.randint(0, 256, (4, 478, 269, 3)).astype(np.uint8)
+    resizer = BatchResize(224)
+    cropper = BatchCenterCrop(224)
+    totensor = BatchToTensor()
+    normalizer = BatchNormalize()
+
+    resized = resizer(image_batch)
+    assert np.array_equal(resized, np.stack([resizer(item) for item in image_batch]))
+    cropped = cropper(resized)
+    assert np.array_equal(cropped, np.stack([cropper(item) for item in resized]))
+    tensors = totensor(cropped)
+    assert tensors.shape == (4, 3, 224, 224)
+    assert np.allclose(tensors, np.stack([totensor(item) for item in cropped]), atol=1e-6)
+    normalized = normalizer(tensors)
+    assert np.allclose(normalized, np.stack([normalizer(item) for item in tensors]), atol=1e-5)
+
+    # the odd margins are rounded the same as vision.CenterCrop
+    for shape, size in [((2, 225, 227, 3), 224), ((2, 231, 301, 3), (200, 180)), ((2, 6, 9, 3), (3, 4))]:
+        image_batch = np.random.randint(0, 256, shape).astype(np.uint8)
+        target = np.stack([vision.CenterCrop(size)(item) for item in image_batch])
+        assert np.array_equal(BatchCenterCrop(size)(image_batch), target)
+
+
+def test_totensor_normalize():
+    """
+    Feature: ToTensorNormalize
+    Description: Compare the fused transform with BatchToTensor and BatchNormalize
+    Expectation: The fused outputs are not close to the outputs of the two transforms.
+    """
+    image_batch = np.random.randint(0, 256, (4, 224, 224, 3)).astype(np.uint8)
+    target = BatchNormalize()(BatchToTensor()(image_batch))
+    fused = build_transforms(class_name='ToTensorNormalize')
+    res = fused(image_batch)
+    assert res.dtype == np.float32
+    assert np.allclose(res, target, atol=1e-5)
+    assert np.allclose(fused(image_batch[0]), target[0], atol=1e-5)
+    assert np.allclose(fused([Image.fromarray(item) for item in image_batch]), target, atol=1e-5)
+
+    fused = build_transforms(class_name='ToTensorNormalize', dtype='float16')
+    res = fused(image_batch)
+    assert res.dtype == np.float16
+    assert np.allclose(res, target, atol=1e-2)
@@ -18,15 +18,32 @@ Test Module for testing Tokenizer class
 How to run this:
 linux:  pytest ./tests/st/test_model/test_clip_model/test_clip_tokenizer.py
 """
+import gc
+import html
+import json
+import multiprocessing
+import operator
 import os
+import pickle
 import shutil
+import subprocess
+import sys
 import time
 
+import ftfy
+import numpy as np
+import regex
 import pytest
 from mindspore import Tensor
 
 from mindformers import PretrainedTokenizer, AutoTokenizer
 from mindformers import BertTokenizer, ClipTokenizer
+from mindformers.models.bert.bert_tokenizer import BasicTokenizer, WordpieceTokenizer
+from mindformers.models import tokenizer_utils
+from mindformers.models.tokenizer_utils import SharedTokenTable
+from mindformers.models.clip.clip_tokenizer import basic_clean, whitespace_clean
+from mindformers.dataset import RandomChoiceTokenizerForward
+from mindformers.tools.tokenizer_benchmark import benchmark_tokenizer, compare_results, synthetic_corpus
 
 @pytest.mark.level0
 @pytest.mark.platform_x86_ascend_training
@@ -185,9 +202,290 @@ class TestBertTokenizerMethod:
                        'token_type_ids': [0, 0, 0, 0], 'attention_mask': [1, 1, 1, 1]}, \
             f"The res is {res} is not equal to the target"
 
+    def test_return_numpy(self):
+        """
+        Feature: The BertTokenizer test using numpy outputs
+        Description: Encode the batch with return_tensors `np` and `ms`
+        Expectation: The returned arrays are not equal to the list outputs.
+        """
+        bert_tokenizer = BertTokenizer(vocab_file=os.path.join(self.output_path, 'vocab.txt'))
+        batch_inputs = ["hello world", "hello"]
+        res = bert_tokenizer(batch_inputs, text_pair=["world !", "hello"], max_length=8, padding="max_length")
+        res_np = bert_tokenizer(batch_inputs, text_pair=["world !", "hello"], max_length=8, padding="max_length",
+                                return_tensors="np")
+        assert list(res_np.keys()) == list(res.keys())
+        for k in res.keys():
+            assert isinstance(res_np[k], np.ndarray)
+            assert res_np[k].dtype == np.int32
+            assert res_np[k].tolist() == res[k]
+
+        res_ms = bert_tokenizer("hello world", max_length=8, padding="max_length", return_tensors="ms")
+        assert isinstance(res_ms["input_ids"], Tensor)
+        assert res_ms["input_ids"].asnumpy().tolist() == [3, 6, 7, 4, 0, 0, 0, 0]
+
+        with pytest.raises(ValueError):
+            bert_tokenizer(batch_inputs, return_tensors="np")
+
+    def test_padding_and_truncation(self):
+        """
+        Feature: The BertTokenizer test using dynamic padding and truncation
+        Description: Encode the batch with padding `longest`, pad_to_multiple_of and truncation
+        Expectation: The returned ids are not equal to the target.
+        """
+        bert_tokenizer = BertTokenizer(vocab_file=os.path.join(self.output_path, 'vocab.txt'))
+        batch_inputs = ["hello world", "hello"]
+        res = bert_tokenizer(batch_inputs, padding="longest")
+        assert res["input_ids"] == [[3, 6, 7, 4], [3, 6, 4, 0]]
+        assert res["attention_mask"] == [[1, 1, 1, 1], [1, 1, 1, 0]]
+
+        res = bert_tokenizer(batch_inputs, padding="longest", pad_to_multiple_of=8, return_tensors="np")
+        assert res["input_ids"].shape == (2, 8)
+
+        res = bert_tokenizer(["hello world ! hello world", "hello"], max_length=5, padding="max_length",
+                             truncation=True)
+        assert res["input_ids"] == [[3, 6, 7, 8, 4], [3, 6, 4, 0, 0]]
+
+        res = bert_tokenizer("hello world ! hello world", text_pair="world ! !", max_length=7, truncation=True)
+        assert res["input_ids"] == [3, 6, 7, 8, 4, 7, 8]
+        assert res["token_type_ids"] == [0, 0, 0, 0, 1, 1, 1]
+
+        with pytest.raises(ValueError):
+            bert_tokenizer("hello world ! hello", max_length=4, padding="max_length")
+
+    def test_overflowing_tokens(self):
+        """
+        Feature: The BertTokenizer test splitting the long texts into the windows
+        Description: Encode the texts with return_overflowing_tokens and stream the windows of the text chunks
+        Expectation: The windows or the offsets are not equal to the target.
+        """
+        bert_tokenizer = BertTokenizer(vocab_file=os.path.join(self.output_path, 'vocab.txt'))
+        res = bert_tokenizer(["hello world! hello world", "hello"], max_length=5, stride=1,
+                             return_overflowing_tokens=True, return_offsets_mapping=True)
+        assert res["input_ids"] == [[3, 6, 7, 8, 4], [3, 8, 6, 7, 4], [3, 6, 4]]
+        assert res["overflow_to_sample_mapping"] == [0, 0, 1]
+        assert res["offset_mapping"][0] == [(0, 0), (0, 5), (6, 11), (11, 12), (0, 0)]
+        assert res["offset_mapping"][1] == [(0, 0), (11, 12), (13, 18), (19, 24), (0, 0)]
+
+        res = bert_tokenizer(["hello world! hello world", "hello"], max_length=5, stride=1, padding="max_length",
+                             return_overflowing_tokens=True, return_offsets_mapping=True, return_tensors="np")
+        assert res["input_ids"].shape == (3, 5)
+        assert res["offset_mapping"].shape == (3, 5, 2)
+
+        windows = bert_tokenizer.iter_windows(iter(["hello wo", "rld! hel", "lo world"]), max_length=5, stride=1,
+                                              return_offsets_mapping=True)
+        assert [window["input_ids"] for window in windows] == [[3, 6, 7, 8, 4], [3, 8, 6, 7, 4]]
+
+        # the unknown token spans the characters between the tokens around it
+        res = bert_tokenizer("Hello xyz! abc", max_length=8, return_overflowing_tokens=True,
+                             return_offsets_mapping=True)
+        assert res["input_ids"] == [[3, 6, 2, 8, 2, 4]]
+        assert res["offset_mapping"] == [[(0, 0), (0, 5), (6, 9), (9, 10), (11, 14), (0, 0)]]
+
+        with pytest.raises(ValueError):
+            bert_tokenizer("hello world", max_length=5, stride=3, return_overflowing_tokens=True)
+
+    def test_num_workers(self):
+        """
+        Feature: The BertTokenizer test using the worker pool
+        Description: Encode a large batch with and without the worker pool
+        Expectation: The outputs of the worker pool are not equal to the serial outputs.
+        """
+        bert_tokenizer = BertTokenizer(vocab_file=os.path.join(self.output_path, 'vocab.txt'))
+        batch_inputs = ["hello world", "hello", "world ! hello", "!"] * 100
+        res = bert_tokenizer(batch_inputs)
+        res_parallel = bert_tokenizer(batch_inputs, num_workers=2)
+        bert_tokenizer.close_worker_pool()
+        assert res_parallel == res
+
+        bert_tokenizer = BertTokenizer(vocab_file=os.path.join(self.output_path, 'vocab.txt'), num_workers=2)
+        assert bert_tokenizer.num_workers == 2
+        assert bert_tokenizer(batch_inputs) == res
+        bert_tokenizer.close_worker_pool()
+
+        # the pool is not pickled, and its workers stop when the tokenizer is garbage collected
+        assert bert_tokenizer(batch_inputs) == res
+        assert pickle.loads(pickle.dumps(bert_tokenizer))(batch_inputs) == res
+        workers = list(bert_tokenizer._worker_pool._pool)  # pylint: disable=W0212
+        del bert_tokenizer
+        gc.collect()
+        for worker in workers:
+            worker.join(timeout=10)
+        assert not any(worker.is_alive() for worker in workers)
+
+    def test_wordpiece_tokenizer(self):
+        """
+        Feature: The WordpieceTokenizer test using the longest match of the vocab
+        Description: Tokenize words with the prefix and the `##` pieces
+        Expectation: The returned tokens are not equal to the target.
+        """
+        vocab = ["[UNK]", "un", "##aff", "##able", "aff", "##a", "##affable", "##", "runn", "##ing", "run"]
+        tokenizer = WordpieceTokenizer({token: index for index, token in enumerate(vocab)})
+        assert tokenizer.tokenize("unaffable") == ["un", "##affable"]
+        assert tokenizer.tokenize("running affa") == ["runn", "##ing", "aff", "##a"]
+        assert tokenizer.tokenize("unknown") == ["un", "[UNK]"]
+        assert tokenizer.tokenize("xyz  ##") == ["[UNK]", "##"]
+        assert tokenizer.tokenize("") == []
+
+    def test_basic_tokenizer(self):
+        """
+        Feature: The BasicTokenizer test using the character class tables
+        Description: Tokenize texts with CJK characters, punctuations, accents and control characters
+        Expectation: The returned tokens are not equal to the target.
+        """
+        tokenizer = BasicTokenizer(do_lower_case=True)
+        assert tokenizer.tokenize(" \tHeLLo!how  \n Are yoU?  ") == ["hello", "!", "how", "are", "you", "?"]
+        assert tokenizer.tokenize("H\u00E9llo\u00A0w\u00F6rld") == ["hello", "world"]
+        assert tokenizer.tokenize("ah\u535A\u63A8zz") == ["ah", "\u535A", "\u63A8", "zz"]
+        assert tokenizer.tokenize("a\x00b\ufffdc\U00020001d") == ["abc", "\U00020001", "d"]
+
+        tokenizer = BasicTokenizer(do_lower_case=False)
+        assert tokenizer.tokenize("HeLLo, W\u00F6rld") == ["HeLLo", ",", "W\u00F6rld"]
+
+    def test_compiled_vocab(self, monkeypatch):
+        """
+        Feature: The BertTokenizer test using the compiled vocab
+        Description: Save the tokenizer with the compiled vocab and load it, then modify the vocab file
+        Expectation: The restored tokenizer is not equal to the source one or the stale compiled vocab is used.
+        """
+        saved_path = os.path.join(self.output_path, 'saved')
+        os.makedirs(saved_path, exist_ok=True)
+        bert_tokenizer = BertTokenizer(vocab_file=os.path.join(self.output_path, 'vocab.txt'))
+        bert_tokenizer.save_pretrained(saved_path)
+        assert os.path.exists(os.path.join(saved_path, 'tokenizer_compiled.bin'))
+
+        restore_tokenizer = BertTokenizer.from_pretrained(saved_path)
+        assert restore_tokenizer.vocab_dict == bert_tokenizer.vocab_dict
+        assert restore_tokenizer("hello world!") == bert_tokenizer("hello world!")
+        assert 'compiled_vocab_file' not in restore_tokenizer.init_kwargs
+
+        # the source vocab is hashed only when its size or mtime is changed
+        compiled_file = os.path.join(saved_path, 'tokenizer_compiled.bin')
+        vocab_file = os.path.join(saved_path, 'vocab.txt')
+        monkeypatch.setattr(tokenizer_utils, 'file_digest', lambda path: pytest.fail("the vocab is hashed"))
+        assert tokenizer_utils.load_compiled_vocab(compiled_file, vocab_file)[0] == list(bert_tokenizer.vocab_dict)
+        monkeypatch.undo()
+
+        # the truncated compiled vocab is ignored
+        with open(compiled_file, 'rb') as fp:
+            compiled = fp.read()
+        for length in (0, 10, len(compiled) - 1):
+            with open(compiled_file, 'wb') as fp:
+                fp.write(compiled[:length])
+            assert tokenizer_utils.load_compiled_vocab(compiled_file, vocab_file) is None
+            assert BertTokenizer.from_pretrained(saved_path).vocab_dict == bert_tokenizer.vocab_dict
+
+        with open(os.path.join(saved_path, 'vocab.txt'), 'a') as fp:
+            fp.write('new\n')
+        restore_tokenizer = BertTokenizer.from_pretrained(saved_path)
+        assert restore_tokenizer.vocab_dict['new'] == len(bert_tokenizer.vocab_dict)
+
+    def test_batch_decode(self):
+        """
+        Feature: The BertTokenizer test using batch_decode
+        Description: Decode the padded ids with and without the special tokens
+        Expectation: The decoded strings are not equal to the target.
+        """
+        bert_tokenizer = BertTokenizer(vocab_file=os.path.join(self.output_path, 'vocab.txt'))
+        res = bert_tokenizer(["hello world!", "hello"], max_length=8, padding='max_length', return_tensors='np')
+        assert bert_tokenizer.batch_decode(res['input_ids']) == ["hello world !", "hello"]
+        assert bert_tokenizer.batch_decode(res['input_ids'], skip_special_tokens=False) == \
+               ["[CLS] hello world ! [SEP] [PAD] [PAD] [PAD]", "[CLS] hello [SEP] [PAD] [PAD] [PAD] [PAD] [PAD]"]
+        assert bert_tokenizer.decode([3, 6, 7, 4]) == "hello world"
+        with pytest.raises(ValueError):
+            bert_tokenizer.batch_decode([[6, 100]])
+
+    def test_shared_tables(self):
+        """
+        Feature: The BertTokenizer test using the shared tables
+        Description: Publish the vocab into the shared memory and unpickle the tokenizer as a worker does
+        Expectation: The outputs are not equal to the tokenizer with the vocab dicts.
+        """
+        bert_tokenizer = BertTokenizer(vocab_file=os.path.join(self.output_path, 'vocab.txt'))
+        shared_tokenizer = BertTokenizer(vocab_file=os.path.join(self.output_path, 'vocab.txt'), share_tables=True)
+        worker_tokenizer = pickle.loads(pickle.dumps(shared_tokenizer))
+        sentences = ["hello world!", "hello, unknown words"]
+        for tokenizer in (shared_tokenizer, worker_tokenizer):
+            assert tokenizer(sentences) == bert_tokenizer(sentences)
+            assert tokenizer.decode([3, 6, 7, 4]) == "hello world"
+            assert dict(tokenizer.vocab_dict) == dict(bert_tokenizer.vocab_dict)
+
+        # the wordpieces are matched by the trie in the shared memory
+        table = SharedTokenTable.create([("un", 0), ("unaff", 1), ("##able", 2), ("##a", 3)], prefix_trie=True)
+        wordpiece_tokenizer = WordpieceTokenizer(table)
+        assert table.longest_match("unaffable", 0) == 5
+        assert table.longest_match("unaffable", 5, "##") == 9
+        assert wordpiece_tokenizer.tokenize("unaffable una unb") == \
+            WordpieceTokenizer(dict(table)).tokenize("unaffable una unb") == \
+            ["unaff", "##able", "un", "##a", "un", "[UNK]"]
+        with pytest.raises(ValueError):
+            WordpieceTokenizer(SharedTokenTable.create([("un", 0)]))
+
+        # a spawned worker attaches to the segment, and its exit does not remove the segment
+        worker = multiprocessing.get_context("spawn").Process(target=operator.getitem, args=(table, "##able"))
+        worker.start()
+        worker.join()
+        assert worker.exitcode == 0
+        assert table["##able"] == 2
+        # a worker with its own resource tracker neither removes the segment nor warns about a leak
+        code = f"from mindformers.models.tokenizer_utils import SharedTokenTable; SharedTokenTable({table.name!r})"
+        worker = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        assert "leaked" not in worker.stderr
+        assert SharedTokenTable(table.name)["unaff"] == 1
+
+    def test_word_cache(self):
+        """
+        Feature: The BertTokenizer test using the word cache
+        Description: Tokenize the repeated words with the word cache and without it
+        Expectation: The outputs are not equal or the hits are not counted.
+        """
+        bert_tokenizer = BertTokenizer(vocab_file=os.path.join(self.output_path, 'vocab.txt'), cache_size=0)
+        cached_tokenizer = BertTokenizer(vocab_file=os.path.join(self.output_path, 'vocab.txt'), cache_size=2)
+        sentences = ["hello world! hello world!", "hello, unknown words", "Hello World"]
+        assert cached_tokenizer(sentences) == bert_tokenizer(sentences)
+        assert cached_tokenizer.tokenize(sentences[0]) == bert_tokenizer.tokenize(sentences[0])
+        info = cached_tokenizer.cache_info()
+        assert info['hits'] > 0
+        assert info['size'] == 2
+        assert bert_tokenizer.cache_info()['size'] == 0
+
+    def test_benchmark(self):
+        """
+        Feature: The tokenizer benchmark
+        Description: Measure the BertTokenizer on the synthetic corpus and compare the run with itself
+        Expectation: The results are not complete or can not be saved as json.
+        """
+        bert_tokenizer = BertTokenizer(vocab_file=os.path.join(self.output_path, 'vocab.txt'))
+        texts = synthetic_corpus(num_texts=50)
+        res = benchmark_tokenizer(bert_tokenizer, texts, batch_size=8)
+        assert set(res['results']) == {'encode', 'batch_encode', 'decode', 'batch_decode'}
+        assert res['results']['encode']['calls'] == 50
+        assert res['results']['batch_encode']['calls'] == 7
+        assert res['results']['encode']['tokens'] == res['corpus']['tokens']
+        assert res['results']['batch_decode']['tokens'] == res['corpus']['tokens']
+        assert res['results']['encode']['cache']['word_cache']['hit_rate'] == 1.0
+        assert json.loads(json.dumps(res)) == res
+        assert compare_results(res, res)['decode']['tokens_per_second'] == 1.0
+
 
 class TestClipTokenizerMethod:
     """Test the basic usage of the ClipTokenizer"""
+    def test_basic_clean(self):
+        """
+        Feature: The text cleaning of the ClipTokenizer
+        Description: Clean the captions by the fast path and by ftfy, html.unescape and the regex
+        Expectation: The cleaned captions are not the same.
+        """
+        captions = ["A child in a pink dress is climbing up a set of stairs in an entry way .",
+                    "  two dogs\tplay in the\nsnow  ", "", " ", "Tom &amp; Jerry &amp;amp; friends",
+                    "a <b>bold</b> &lt;tag&gt;", "caf\u00e9 cr\u00c3\u00a8me", "\u201cquoted\u201d \ufb01sh",
+                    "line\r\nbreak\rend", "bell\x07 and \x1b[31mred\x1b[0m", "unit\x1fseparator\x1c",
+                    "no\u00a0break\u3000space\x85next", "\uff26\uff55\uff4c\uff4c width", "\u4e2d\u6587 caption"]
+        for caption in captions:
+            cleaned = html.unescape(html.unescape(ftfy.fix_text(caption))).strip()
+            assert basic_clean(caption) == cleaned, f"The caption is {caption!r}."
+            assert whitespace_clean(caption) == regex.sub(r'\s+', ' ', caption).strip(), \
+                f"The caption is {caption!r}."
+
     def test_padding(self):
         """
         Feature: The ClipTokenizer test using padding
@@ -215,3 +513,142 @@ class TestClipTokenizerMethod:
                        'attention_mask': [[1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0],
                                           [1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0],
                                           [1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0]]}
+
+    def test_offsets_mapping(self):
+        """
+        Feature: The ClipTokenizer test returning the offsets of the windows
+        Description: Split a text of the sub words, the accents and an emoji into the windows with the offsets
+        Expectation: The offsets are not the characters of the tokens.
+        """
+        clip_tokenizer = ClipTokenizer.from_pretrained("clip_vit_b_32")
+        text = "Supercalifragilistic caf\u00e9, \U0001f600 na\u00efve!"
+        window = next(clip_tokenizer.iter_windows(text, max_length=40, return_offsets_mapping=True))
+        assert [text[start:end] for start, end in window["offset_mapping"]] == \
+               ["", "Super", "cali", "frag", "ili", "stic", "caf\u00e9", ",", "\U0001f600", "na", "\u00ef", "ve", "!",
+                ""]
+
+    def test_bpe_engine(self):
+        """
+        Feature: The ClipTokenizer test using different bpe engines
+        Description: Tokenize the same texts with the heap and the naive bpe engine
+        Expectation: The tokens of the two engines are not equal.
+        """
+        heap_tokenizer = ClipTokenizer.from_pretrained("clip_vit_b_32")
+        naive_tokenizer = ClipTokenizer(vocab_file=heap_tokenizer.path, bpe_engine="naive")
+        texts = ["hello world?", "Who are you?", "I am find, thank you.",
+                 "supercalifragilisticexpialidocious antidisestablishmentarianism",
+                 "a dog runs through the grassy field chasing a frisbee"]
+        for text in texts:
+            assert heap_tokenizer.tokenize(text) == naive_tokenizer.tokenize(text)
+
+        with pytest.raises(ValueError):
+            ClipTokenizer(vocab_file=heap_tokenizer.path, bpe_engine="unknown")
+
+    def test_cache_size(self):
+        """
+        Feature: The ClipTokenizer test using a bounded bpe word cache
+        Description: Tokenize texts with a cache smaller than the number of words
+        Expectation: The cache grows over the capacity or the tokens are changed.
+        """
+        clip_tokenizer = ClipTokenizer.from_pretrained("clip_vit_b_32")
+        small_cache_tokenizer = ClipTokenizer(vocab_file=clip_tokenizer.path, cache_size=2)
+        text = "a dog runs through the grassy field chasing a frisbee"
+        assert small_cache_tokenizer.tokenize(text) == clip_tokenizer.tokenize(text)
+        assert small_cache_tokenizer.tokenize(text) == clip_tokenizer.tokenize(text)
+
+        res = small_cache_tokenizer.cache_info()
+        assert res['size'] == 2
+        assert res['evictions'] > 0
+        assert res['hits'] + res['misses'] > 0
+        assert small_cache_tokenizer.tool.tokenize_alg("<|startoftext|>") == "<|startoftext|>"
+        assert "<|endoftext|>" in small_cache_tokenizer.tool.cache
+
+    def test_batch_decode(self):
+        """
+        Feature: The ClipTokenizer test using batch_decode
+        Description: Decode the padded ids of a batch
+        Expectation: The decoded strings are not equal to the inputs.
+        """
+        clip_tokenizer = ClipTokenizer.from_pretrained("clip_vit_b_32")
+        batch_inputs = ["hello world?", "who are you?", "a caf\u00E9 in \u6771\u4EAC"]
+        res = clip_tokenizer(batch_inputs, max_length=12, padding='max_length', return_tensors='np')
+        assert clip_tokenizer.batch_decode(res['input_ids']) == ["hello world ?", "who are you ?",
+                                                               "a caf\u00E9 in \u6771\u4EAC"]
+        assert clip_tokenizer.decode(res['input_ids'][0], skip_special_tokens=False).startswith("<|startoftext|>")
+
+        # the pad token of configs/clip/task_config/clip_flickr8k_dataset.yaml is an ordinary token
+        pad_tokenizer = ClipTokenizer(vocab_file=clip_tokenizer.path, pad_token='!')
+        res = pad_tokenizer(["wow!", "wow!$"], max_length=8, padding='max_length', return_tensors='np')
+        assert pad_tokenizer.batch_decode(res['input_ids']) == ["wow !", "wow !$"]
+        res = pad_tokenizer(["wow!", "wow!$"], max_length=8, padding='max_length', add_special_tokens=False,
+                            return_tensors='np')
+        assert pad_tokenizer.batch_decode(res['input_ids'], attention_mask=res['attention_mask']) == \
+               ["wow !", "wow !$"]
+
+    def test_encode_cache(self):
+        """
+        Feature: The ClipTokenizer test using the encode cache
+        Description: Encode the same prompts twice and change the returned outputs
+        Expectation: The cached outputs are not equal to the uncached ones or are changed by the callers.
+        """
+        clip_tokenizer = ClipTokenizer.from_pretrained("clip_vit_b_32")
+        cached_tokenizer = ClipTokenizer(vocab_file=clip_tokenizer.path, encode_cache_size=4)
+        sentences = ["This is a photo of dog.", "This is a photo of cat."]
+        res = cached_tokenizer(sentences, max_length=8, padding='max_length', return_tensors='np')
+        res['input_ids'][0, 0] = 0
+        res = cached_tokenizer(sentences, max_length=8, padding='max_length', return_tensors='np')
+        target = clip_tokenizer(sentences, max_length=8, padding='max_length', return_tensors='np')
+        assert (res['input_ids'] == target['input_ids']).all()
+        assert cached_tokenizer(sentences, max_length=8, padding='max_length') == \
+               clip_tokenizer(sentences, max_length=8, padding='max_length')
+
+        info = cached_tokenizer.encode_cache_info()
+        assert info['hits'] == 1
+        assert info['misses'] == 2
+        cached_tokenizer.clear_encode_cache()
+        assert cached_tokenizer.encode_cache_info()['size'] == 0
+
+    def test_shared_tables(self):
+        """
+        Feature: The ClipTokenizer test using the shared tables
+        Description: Publish the tables into the shared memory and unpickle the tokenizer as a worker does
+        Expectation: The outputs are not equal to the tokenizer with the dicts.
+        """
+        clip_tokenizer = ClipTokenizer.from_pretrained("clip_vit_b_32")
+        shared_tokenizer = ClipTokenizer(vocab_file=clip_tokenizer.path, share_tables=True)
+        worker_tokenizer = pickle.loads(pickle.dumps(shared_tokenizer))
+        sentences = ["a photo of a dog.", "Héllo wörld, unbelievable!"]
+        res = clip_tokenizer(sentences, max_length=16, padding='max_length', return_tensors='np')
+        for tokenizer in (shared_tokenizer, worker_tokenizer):
+            assert (tokenizer(sentences, max_length=16, padding='max_length', return_tensors='np')['input_ids']
+                    == res['input_ids']).all()
+            assert tokenizer.batch_decode(res['input_ids']) == clip_tokenizer.batch_decode(res['input_ids'])
+
+    def test_pretokenized_random_choice(self):
+        """
+        Feature: RandomChoiceTokenizerForward with the pre-tokenized captions
+        Description: Build the caption table and pick the rows of the samples
+        Expectation: The picked rows are not the tokenized captions of the samples.
+        """
+        clip_tokenizer = ClipTokenizer.from_pretrained("clip_vit_b_32")
+        captions = [["a dog runs.", "a cat sleeps."], ["a little girl."],
+                    ["hello world?", "who are you?", "thank you."]]
+        transform = RandomChoiceTokenizerForward(clip_tokenizer, max_length=8, pretokenize=True)
+        transform.build_table(captions)
+        assert transform.table.shape == (6, 8)
+        assert transform.table.dtype == np.int32
+        assert transform.offsets.tolist() == [0, 2, 3, 6]
+
+        for index, sample_captions in enumerate(captions):
+            targets = [clip_tokenizer(caption, max_length=8, padding="max_length")["input_ids"]
+                       for caption in sample_captions]
+            picked = [transform(np.array([index, epoch])).tolist() for epoch in range(10)]
+            assert all(row in targets for row in picked)
+        assert len({tuple(transform(np.array([2, epoch])).tolist()) for epoch in range(20)}) > 1
+
+        # the pick only depends on the seed, the epoch and the sample index
+        other = RandomChoiceTokenizerForward(clip_tokenizer, max_length=8, pretokenize=True)
+        other.build_table(captions)
+        for epoch in range(5):
+            assert (transform(np.array([2, epoch])) == other.pick(2, epoch)).all()
+            assert (transform(np.array([2, epoch])) == transform(np.array([2, epoch]))).all()
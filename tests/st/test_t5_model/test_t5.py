@@ -24,10 +24,12 @@ import os
 
 import numpy as np
 
-from mindspore import Tensor
+from mindspore import Tensor, load_param_into_net
+from mindspore.dataset import GeneratorDataset
 
 from mindformers import MindFormerBook, AutoModel
 from mindformers.models import T5ModelForGeneration, T5Config
+from mindformers.dataset import T5SequencePacker, pack_dataset
 
 
 class TestModelForT5Method:
@@ -79,3 +81,44 @@ class TestModelForT5Method:
         out2 = restored_t5(input_ids, attention_mask, labels)
 
         assert out1.asnumpy() == out2.asnumpy()
+
+    def test_packed_model(self):
+        """
+        Feature: packed option of T5ModelForGeneration and T5SequencePacker
+        Description: Pack two examples of different lengths into a row and compare it with the examples
+        Expectation: AssertionError
+        """
+        config = dict(num_hidden_layers=1, hidden_dropout_prob=0.0, attention_probs_dropout_prob=0.0,
+                      batch_size=1, seq_length=16, max_decode_length=8)
+        t5 = T5ModelForGeneration(T5Config(**config))
+        packed_t5 = T5ModelForGeneration(T5Config(packed=True, **config))
+        load_param_into_net(packed_t5, t5.parameters_dict())
+
+        examples = []
+        for source_length, target_length in [(10, 5), (5, 2)]:
+            source_ids = np.zeros(16, np.int32)
+            source_ids[:source_length] = np.random.randint(low=1, high=15, size=(source_length,))
+            target_ids = np.zeros(8, np.int32)
+            target_ids[:target_length] = np.random.randint(low=1, high=15, size=(target_length,))
+            examples.append((source_ids, (source_ids > 0).astype(np.int32), target_ids))
+        dataset = GeneratorDataset(examples, column_names=T5SequencePacker.input_columns, shuffle=False)
+        rows = list(pack_dataset(dataset, T5SequencePacker()).create_tuple_iterator(output_numpy=True))
+        assert len(rows) == 1
+        assert rows[0][1].tolist() == [1] * 10 + [2] * 5 + [0]
+        assert rows[0][3].tolist() == [1] * 5 + [2] * 2 + [0]
+        source_ids, source_mask, target_ids, target_mask = [Tensor(item[None]) for item in rows[0]]
+
+        # the attention does not cross the segments, and the relative positions restart at each segment
+        encoded = packed_t5.t5_model.encoder_forward(source_ids, source_mask).asnumpy().reshape(16, -1)
+        for (start, end), example in zip([(0, 10), (10, 15)], examples):
+            single = t5.t5_model.encoder_forward(Tensor(example[0][None]), Tensor(example[1][None]))
+            assert np.allclose(encoded[start:end], single.asnumpy().reshape(16, -1)[:end - start], atol=1e-5)
+
+        # the loss of the targets of a segment is the loss of its example
+        losses = [t5(*[Tensor(item[None]) for item in example]).asnumpy() for example in examples]
+        for segment, loss in enumerate(losses, start=1):
+            segment_mask = rows[0][3] * (rows[0][3] == segment)
+            out = packed_t5(source_ids, source_mask, target_ids, Tensor(segment_mask[None]))
+            assert np.allclose(out.asnumpy(), loss, atol=1e-5)
+        out = packed_t5(source_ids, source_mask, target_ids, target_mask)
+        assert np.allclose(out.asnumpy(), (losses[0] * 5 + losses[1] * 2) / 7, atol=1e-5)
@@ -25,12 +25,16 @@ pytest ./tests/st/test_trainer
 /test_contrastive_language_image_pretrain_trainer/test_dataset.py
 """
 import os
+import shutil
 import numpy as np
 from PIL import Image
 
 from mindformers.mindformer_book import MindFormerBook
 from mindformers.tools.register.config import MindFormerConfig
 from mindformers.dataset.build_dataset import build_dataset
+from mindformers.dataset import BlockShuffleSampler, LengthBucketedSampler
+from mindformers.dataset.dataloader.flickr8k_dataloader import Flickr8kDataSet
+from mindformers.dataset.dataloader.packed_image_text_dataloader import pack_image_text_dataset
 
 
 class TestClipPretrainDataset:
@@ -64,6 +68,90 @@ class TestClipPretrainDataset:
             assert item[0].shape == (32, 3, 224, 224)
             assert item[1].shape == (32, 77)
 
+    def test_packed_dataset(self):
+        """
+        Feature: ContrastiveLanguageImagePretrainDataset with PackedImageTextDataLoader
+        Description: Test the encoded images are decoded when decode_image is not configured
+        Expectation: ValueError, AssertionError
+        """
+        data_loader_config = self.config.train_dataset.data_loader
+        output_dir = os.path.join(self.local_root, "packed")
+        pack_image_text_dataset(Flickr8kDataSet(data_loader_config.dataset_dir, data_loader_config.annotation_dir,
+                                                decode_image=False), output_dir)
+
+        config = MindFormerConfig(os.path.join(MindFormerBook.get_project_path(), "configs", "clip",
+                                               "task_config", "clip_flickr8k_packed_dataset.yaml"))
+        config.train_dataset.data_loader.dataset_dir = output_dir
+        config.train_dataset.data_loader.pop("decode_image")
+        for item in build_dataset(config.train_dataset_task):
+            assert item[0].shape == (32, 3, 224, 224)
+            assert item[1].shape == (32, 77)
+        shutil.rmtree(output_dir)
+
+    def test_length_bucketed_sampler(self):
+        """
+        Feature: LengthBucketedSampler
+        Description: Test the batches are formed within the buckets and reshuffled every epoch
+        Expectation: AssertionError
+        """
+        lengths = np.random.RandomState(0).randint(3, 77, size=1000)
+        sampler = LengthBucketedSampler(batch_size=32, lengths=lengths, num_buckets=4)
+        first_epoch = list(sampler)
+        assert sorted(first_epoch) == list(range(1000))
+        batches = sampler.get_batches(0)
+        bucketed = [batch for batch in batches if len(set(sampler.buckets[batch].tolist())) == 1]
+        assert len(bucketed) >= len(batches) - 4
+        assert list(sampler) != first_epoch
+
+        # the epoch-aware indices are the indices of the epoch offset by the epoch
+        sampler.with_epoch = True
+        sampler.set_epoch(3)
+        assert list(sampler) == (np.concatenate(sampler.get_batches(3)) + 3 * 1000).tolist()
+
+        sampler = LengthBucketedSampler(batch_size=2, lengths=[3, 5, 9, 12, 20], bucket_boundaries=[6, 15])
+        assert sampler.buckets.tolist() == [0, 0, 1, 1, 2]
+
+        # every shard gets the same number of full batches
+        for num_samples, drop_remainder in [(1000, False), (1000, True), (70, False), (3, False)]:
+            shards = [LengthBucketedSampler(batch_size=32, lengths=lengths[:num_samples], num_buckets=4,
+                                            drop_remainder=drop_remainder, num_shards=4, shard_id=shard_id)
+                      for shard_id in range(4)]
+            batches = [shard.get_batches(1) for shard in shards]
+            assert len({len(shard_batches) for shard_batches in batches}) == 1
+            assert all(len(batch) == 32 for shard_batches in batches for batch in shard_batches)
+            samples = set(np.concatenate([batch for shard_batches in batches for batch in shard_batches]).tolist())
+            assert samples == set(range(num_samples)) or drop_remainder
+
+        self.config.train_dataset.sampler = {"type": "LengthBucketedSampler", "num_buckets": 2}
+        data_loader = build_dataset(self.config.train_dataset_task)
+        for item in data_loader:
+            assert item[1].shape == (32, 77)
+
+    def test_block_shuffle_sampler(self):
+        """
+        Feature: BlockShuffleSampler
+        Description: Test the blocks are shuffled and read in order, and the buffer shuffles the samples
+        Expectation: AssertionError
+        """
+        sampler = BlockShuffleSampler(100, block_size=10, buffer_size=0, seed=1)
+        first_epoch = list(sampler)
+        blocks = [first_epoch[start:start + 10] for start in range(0, 100, 10)]
+        assert all(block == list(range(block[0], block[0] + 10)) and block[0] % 10 == 0 for block in blocks)
+        assert first_epoch != list(range(100))
+        assert list(sampler) != first_epoch
+        assert sampler.get_epoch_indices(0).tolist() == first_epoch
+
+        sampler = BlockShuffleSampler(100, block_size=10, buffer_size=16, seed=1)
+        indices = sampler.get_epoch_indices(0)
+        assert sorted(indices.tolist()) == list(range(100))
+        unbuffered = BlockShuffleSampler(100, block_size=10, buffer_size=0, seed=1)
+        assert not np.array_equal(indices, unbuffered.get_epoch_indices(0))
+        assert list(BlockShuffleSampler(5, shuffle=False)) == [0, 1, 2, 3, 4]
+        sampler = BlockShuffleSampler(5, shuffle=False, with_epoch=True)
+        assert list(sampler) == [0, 1, 2, 3, 4]
+        sampler.set_epoch(2)
+        assert list(sampler) == [10, 11, 12, 13, 14]
+
     def make_local_directory(self, config):
         """make local directory"""
         dataset_dir = config.train_dataset.data_loader.dataset_dir
@@ -21,12 +21,21 @@ windows:  pytest .\\tests\\st\\test_clip_model\\test_flickr8k_dataloader.py
 linux:  pytest ./tests/st/test_clip_model/test_flickr8k_dataloader.py
 """
 import os
+import pickle
+import shutil
+
 import numpy as np
 from PIL import Image
+from mindspore.dataset import GeneratorDataset, vision
 
 from mindformers.mindformer_book import MindFormerBook
 from mindformers.tools.register.config import MindFormerConfig
+from mindformers.dataset import BlockShuffleSampler
 from mindformers.dataset.dataloader import build_dataset_loader
+from mindformers.dataset.dataloader.flickr8k_dataloader import Flickr8kDataSet, load_annotations
+from mindformers.dataset.dataloader.image_cache import DecodedImageCache, split_cache_transforms
+from mindformers.dataset.dataloader.packed_image_text_dataloader import PackedImageTextDataLoader, \
+    PackedImageTextDataSet, pack_image_text_dataset
 
 
 class TestFlickr8kDataloader:
@@ -62,6 +71,163 @@ class TestFlickr8kDataloader:
             assert item[0].shape == (478, 269, 3)
             assert item[1].shape == (5,)
 
+    def test_annotation_index(self, tmp_path):
+        """
+        Feature: Flickr8kDataSet with the annotation index
+        Description: Build the dataset with and without the index file, then change a copy of the caption file
+        Expectation: The captions are not equal or the stale index is used.
+        """
+        dataset_dir = self.config.train_dataset.data_loader.dataset_dir
+        # the caption file is changed below, so a copy is used instead of the shared fixture
+        annotation_dir = str(tmp_path / "annotations")
+        shutil.copytree(self.config.train_dataset.data_loader.annotation_dir, annotation_dir)
+        target = Flickr8kDataSet(dataset_dir, annotation_dir, stage="test").dataset_dict
+
+        load_annotations.cache_clear()
+        dataset = Flickr8kDataSet(dataset_dir, annotation_dir, stage="test", annotation_index=True)
+        index_file = os.path.join(annotation_dir, "Flickr8k.token.txt.index.json")
+        assert os.path.isfile(index_file)
+        assert dataset.dataset_dict == target
+        load_annotations.cache_clear()
+        dataset = Flickr8kDataSet(dataset_dir, annotation_dir, stage="test", annotation_index=True)
+        assert dataset.dataset_dict == target
+        assert len(dataset.dataset_dict["test_image_0.jpg"]) == 5
+
+        with open(os.path.join(annotation_dir, "Flickr8k.token.txt"), 'a', encoding='utf-8') as filer:
+            filer.write("test_image_0.jpg#5\tA little girl .\n")
+        dataset = Flickr8kDataSet(dataset_dir, annotation_dir, stage="test", annotation_index=True)
+        assert dataset.dataset_dict["test_image_0.jpg"][-1] == "A little girl ."
+
+    def test_raw_image_bytes(self):
+        """
+        Feature: Flickr8kDataSet returning the encoded images
+        Description: Decode the encoded bytes of the dataset by the Decode transform
+        Expectation: The decoded image is not equal to the image decoded by the dataset.
+        """
+        dataset_dir = self.config.train_dataset.data_loader.dataset_dir
+        annotation_dir = self.config.train_dataset.data_loader.annotation_dir
+        dataset = Flickr8kDataSet(dataset_dir, annotation_dir, stage="train", decode_image=False)
+        image, image_anno = dataset[0]
+        assert image.dtype == np.uint8 and image.ndim == 1
+        assert len(image_anno) == 5
+
+        target = Flickr8kDataSet(dataset_dir, annotation_dir, stage="train")[0][0]
+        assert (vision.Decode()(image) == np.array(target)).all()
+
+    def test_return_index(self):
+        """
+        Feature: Flickr8kDataSet returning the sample index and the epoch
+        Description: Read the samples by an epoch-aware sampler for 2 epochs and resume from the epoch 5
+        Expectation: The epochs are not given by the sampler.
+        """
+        dataset_dir = self.config.train_dataset.data_loader.dataset_dir
+        annotation_dir = self.config.train_dataset.data_loader.annotation_dir
+        dataset = Flickr8kDataSet(dataset_dir, annotation_dir, stage="train", decode_image=False)
+        dataset.return_index = True
+        assert dataset[3][1].tolist() == [3, 0]
+        # the reads of a sample do not change its epoch
+        assert dataset[3][1].tolist() == [3, 0]
+        assert dataset[len(dataset) * 2 + 3][1].tolist() == [3, 2]
+
+        sampler = BlockShuffleSampler(len(dataset), block_size=1, buffer_size=0, with_epoch=True)
+        loader = GeneratorDataset(dataset, ["image", "text"], sampler=sampler)
+        iterator = loader.create_tuple_iterator(output_numpy=True, num_epochs=2)
+        for epoch in range(2):
+            pairs = sorted(text.tolist() for _, text in iterator)
+            assert pairs == [[index, epoch] for index in range(len(dataset))]
+        sampler.set_epoch(5)
+        assert {int(text[1]) for _, text in loader.create_tuple_iterator(output_numpy=True, num_epochs=1)} == {5}
+
+    def test_image_cache(self):
+        """
+        Feature: Flickr8kDataSet with the decoded image cache
+        Description: Read the dataset twice with a cache smaller than the dataset
+        Expectation: The cached images are not equal to the decoded images.
+        """
+        dataset_dir = self.config.train_dataset.data_loader.dataset_dir
+        annotation_dir = self.config.train_dataset.data_loader.annotation_dir
+        cache_dir = os.path.join(self.local_root, "image_cache")
+        image_cache = {"cache_dir": cache_dir, "image_size": 224, "max_size": 224 * 224 * 3 * 10}
+        dataset = Flickr8kDataSet(dataset_dir, annotation_dir, stage="train", image_cache=image_cache)
+        first = [dataset[index][0] for index in range(20)]
+        assert first[0].shape == (224, 224, 3)
+        uncached = Flickr8kDataSet(dataset_dir, annotation_dir, stage="train")
+        target = vision.CenterCrop(224)(vision.Resize(224)(np.asarray(uncached[0][0])))
+        assert (first[0] == target).all()
+
+        dataset = pickle.loads(pickle.dumps(dataset))
+        second = [dataset[index][0] for index in range(20)]
+        assert all((image == target).all() for image, target in zip(second, first))
+        assert dataset.image_cache.stats()['hits'] == 10
+        shutil.rmtree(cache_dir)
+
+    def test_image_cache_transforms(self, tmp_path):
+        """
+        Feature: DecodedImageCache with the configured Resize and CenterCrop
+        Description: Cache the random images with the bicubic Resize and a non square CenterCrop
+        Expectation: The cached pixels are not equal to the pixels of the uncached transforms.
+        """
+        transforms = [{"type": "Resize", "size": 240, "interpolation": vision.Inter.BICUBIC},
+                      {"type": "CenterCrop", "size": [224, 200]}]
+        cached, rest = split_cache_transforms(transforms + [{"type": "ToTensor"}])
+        assert cached == transforms and rest == [{"type": "ToTensor"}]
+
+        cache = DecodedImageCache(str(tmp_path), 3, transforms=cached)
+        assert cache.image_shape == (224, 200, 3)
+        images = [Image.fromarray(np.random.randint(0, 255, shape, np.uint8))
+                  for shape in [(300, 451, 3), (500, 333, 3), (231, 301, 3)]]
+        for index, image in enumerate(images):
+            cache.put(index, cache.transform(image))
+        for index, image in enumerate(images):
+            target = vision.CenterCrop([224, 200])(
+                vision.Resize(240, vision.Inter.BICUBIC)(np.asarray(image)))
+            assert (cache.get(index) == target).all()
+
+        bilinear = [dict(cached[0], interpolation=vision.Inter.BILINEAR), cached[1]]
+        assert DecodedImageCache(str(tmp_path), 3, transforms=bilinear).data_file != cache.data_file
+
+    def test_packed_dataset(self):
+        """
+        Feature: PackedImageTextDataLoader
+        Description: Pack the fake Flickr8k dataset into the shards and read them with and without sharding
+        Expectation: The packed samples are not equal to the source samples.
+        """
+        dataset_dir = self.config.train_dataset.data_loader.dataset_dir
+        annotation_dir = self.config.train_dataset.data_loader.annotation_dir
+        output_dir = os.path.join(self.local_root, "packed")
+        source = Flickr8kDataSet(dataset_dir, annotation_dir, stage="train", decode_image=False)
+        assert pack_image_text_dataset(source, output_dir, shard_size=1 << 20) == len(source)
+
+        packed = PackedImageTextDataSet(output_dir)
+        assert len(packed) == len(source)
+        for index in range(len(source)):
+            image, image_anno = packed[index]
+            assert (image == source[index][0]).all()
+            assert image_anno == source[index][1]
+
+        shards = [PackedImageTextDataSet(output_dir, num_shards=3, shard_id=shard_id) for shard_id in range(3)]
+        assert [len(shard) for shard in shards] == [34, 34, 34]
+        assert shards[2][33][1] == source[1][1]
+
+        files = list(packed._files.values())
+        assert files
+        packed.close()
+        assert all(file.closed for file in files) and not packed._files
+
+        # the loader shuffles the blocks of the samples by default, a block is read in order
+        loader = PackedImageTextDataLoader(output_dir, num_shards=1, shard_id=0, block_size=10, buffer_size=0)
+        loader.source.return_index = True
+        iterator = loader.create_tuple_iterator(output_numpy=True, num_epochs=2)
+        indices = [int(text[0]) for _, text in iterator]
+        assert sorted(indices) == list(range(len(source)))
+        assert indices != list(range(len(source)))
+        assert all(indices[start:start + 10] == list(range(indices[start], indices[start] + 10))
+                   for start in range(0, len(source), 10))
+        # the blocks are shuffled again in the next epoch
+        assert [int(text[0]) for _, text in iterator] != indices
+        loader.source.close()
+        shutil.rmtree(output_dir)
+
     def make_local_directory(self, config):
         """make local directory"""
         dataset_dir = config.train_dataset.data_loader.dataset_dir